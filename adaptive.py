@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+import evaluate_by_judge
+import evaluate_model
+from backends import add_backend_arguments, close_backends, load_backend_configs
+from checkpoint import CheckpointedWriter, assign_row_ids, read_csv_rows
+from generation_engine import PrioritySemaphore, imap_ordered
+from instrumentation import current_config, metrics
+from judge_cascade import add_cascade_arguments
+from pipeline import StreamingPipeline, config_names
+from scoring import bootstrap_ci, row_weighted_scores
+
+
+class AdaptiveSettings:
+    """
+    Stopping rule of an adaptive run: a config stops once at least `min_rows` rows are scored
+    and the `confidence` bootstrap interval of its Weighted Overall Score is at most
+    `ci_width` points wide, or when `max_rows` rows (default all) have been evaluated.
+    """
+
+    def __init__(self, ci_width=2.0, confidence=0.95, batch_size=50, min_rows=30, max_rows=None,
+                 resamples=2000, stratify_by=None, strata=4, threshold=70, seed=0):
+        self.ci_width = ci_width
+        self.confidence = confidence
+        self.batch_size = batch_size
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.resamples = resamples
+        self.stratify_by = stratify_by
+        self.strata = strata
+        self.threshold = threshold
+        self.seed = seed
+
+
+def stratum_labels(rows, column=None, strata=4):
+    """
+    Returns a stratum label per row: the value of `column`, or else the quantile bin of the
+    prompt length (System + Instruction), which tracks how hard and long a task is.
+    """
+    if column:
+        return [row.get(column) or '' for row in rows]
+    lengths = pd.Series([len(row.get('System') or '') + len(row.get('Instruction') or '') for row in rows])
+    if lengths.nunique() < 2:
+        return ['all'] * len(rows)
+    return [f"length-q{int(b)}" for b in pd.qcut(lengths.rank(method='first'), min(strata, len(rows)), labels=False)]
+
+
+def sampling_order(strata, seed=0):
+    """
+    Random order of the row indices in which every prefix holds the strata in about their
+    population proportions: each stratum is shuffled and its rows are spread evenly over
+    the order, so consecutive batches are stratified samples.
+    """
+    rng = random.Random(seed)
+    members = {}
+    for index, label in enumerate(strata):
+        members.setdefault(label, []).append(index)
+    keyed = []
+    for label in sorted(members, key=str):
+        indices = members[label]
+        rng.shuffle(indices)
+        offset = rng.random()
+        keyed.extend(((position + offset) / len(indices), index) for position, index in enumerate(indices))
+    return [index for _, index in sorted(keyed)]
+
+
+def estimate(config_name, sampled, shares, settings):
+    """
+    Stratified bootstrap estimate of the Weighted Overall Score from the (row, stratum)
+    pairs evaluated so far.
+    """
+    frame = pd.DataFrame([row for row, _ in sampled])
+    scores = row_weighted_scores(frame, config_name, settings.threshold).dropna()
+    strata = [sampled[position][1] for position in scores.index]
+    mean, low, high = bootstrap_ci(scores.to_numpy(), strata, shares, settings.resamples, settings.confidence, settings.seed)
+    return {
+        'rows': len(sampled),
+        'scored_rows': len(scores),
+        'weighted_overall_score': mean,
+        'ci_low': low,
+        'ci_high': high,
+        'ci_width': high - low,
+    }
+
+
+def settled(result, settings):
+    return result['scored_rows'] >= settings.min_rows and result['ci_width'] <= settings.ci_width
+
+
+async def run_config_adaptive(pipeline, config_name, generate, judge_slots, settings, output_dir):
+    """
+    Evaluates a config in stratified random batches until its Weighted Overall Score is settled.
+    The evaluated rows are written to <output_dir>/judged like a full run, so scoring.py works
+    on them; an interrupted run resumes with the rows it already has.
+
+    Returns:
+        dict: The final estimate with the rows available, the rows used and why the config stopped.
+    """
+    current_config.set(config_name)
+    input_csv_path = os.path.join(pipeline.input_dir, f"{config_name}_test.csv")
+    fieldnames, rows = read_csv_rows(input_csv_path)
+    if 'Instruction' not in fieldnames or 'System' not in fieldnames:
+        logging.error(f"Input CSV must contain 'Instruction' and 'System' columns. Found columns: {fieldnames}")
+        return None
+
+    strata = stratum_labels(rows, settings.stratify_by, settings.strata)
+    shares = {label: count / len(rows) for label, count in zip(*np.unique(strata, return_counts=True))}
+    row_ids = assign_row_ids(rows)
+    order = sampling_order(strata, settings.seed)[:settings.max_rows]
+    _, _, judged_fields = pipeline.stage_fields(fieldnames, config_name)
+    judged_path = os.path.join(output_dir, 'judged', f"extracted_judged_evaluated_{config_name}_test.csv")
+    os.makedirs(os.path.dirname(judged_path), exist_ok=True)
+
+    async def process(index):
+        return index, await pipeline.process_row(config_name, rows[index], generate, judge_slots)
+
+    with CheckpointedWriter(judged_path, judged_fields) as writer:
+        sampled = []
+        if writer.completed:
+            _, previous = read_csv_rows(judged_path)
+            previous = dict(zip(assign_row_ids(previous), previous))
+            sampled = [(previous[row_ids[index]], strata[index]) for index in order if row_ids[index] in previous]
+        pending = [index for index in order if row_ids[index] not in writer.completed]
+
+        result = estimate(config_name, sampled, shares, settings) if sampled else None
+        position = 0
+        while position < len(pending) and not (result and settled(result, settings)):
+            batch = pending[position:position + settings.batch_size]
+            position += len(batch)
+            async for index, row in imap_ordered(process, batch, settings.batch_size):
+                writer.writerow(row_ids[index], row)
+                sampled.append((row, strata[index]))
+            result = estimate(config_name, sampled, shares, settings)
+            logging.info(f"{config_name}: {result['rows']} rows, Weighted Overall Score {result['weighted_overall_score']:.2f} "
+                         f"[{result['ci_low']:.2f}, {result['ci_high']:.2f}]")
+
+    result = result or estimate(config_name, sampled, shares, settings)
+    result.update({
+        'config': config_name,
+        'rows_available': len(rows),
+        'settled': settled(result, settings),
+        'stopped': 'settled' if settled(result, settings) else 'max rows' if settings.max_rows and len(order) < len(rows) else 'all rows',
+    })
+    logging.info(f"Finished {config_name}: {result['stopped']} after {result['rows']} of {len(rows)} rows")
+    return result
+
+
+async def run_adaptive(pipeline, configs, settings, output_dir):
+    generate = pipeline.make_generate()
+    judge_slots = PrioritySemaphore(pipeline.judge_concurrency)
+    try:
+        results = await asyncio.gather(*(run_config_adaptive(pipeline, config_name, generate, judge_slots, settings, output_dir)
+                                         for config_name in configs))
+    finally:
+        await close_backends()
+    return [result for result in results if result]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Generate and judge random stratified batches of every config until "
+                                                 "the Weighted Overall Score is settled.")
+    parser.add_argument("--configs", nargs="+", default=config_names, choices=config_names)
+    parser.add_argument("--input-dir", default=".", help="Directory with the downloaded <config>_test.csv files")
+    parser.add_argument("--output-dir", default=os.path.join("evaluated", "adaptive"))
+    parser.add_argument("--ci-width", type=float, default=2.0, help="Stop once the interval is at most this wide (2.0 = +-1 point)")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--batch-size", type=int, default=50, help="Rows generated and judged between two estimates")
+    parser.add_argument("--min-rows", type=int, default=30, help="Scored rows needed before a config may stop")
+    parser.add_argument("--max-rows", type=int, help="Stop a config after this many rows even if it is not settled")
+    parser.add_argument("--resamples", type=int, default=2000, help="Bootstrap resamples")
+    parser.add_argument("--stratify-by", help="Column to stratify by (default: quartiles of the prompt length)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the row order and the bootstrap")
+    parser.add_argument("--threshold", type=float, default=70)
+    parser.add_argument("--judge-concurrency", type=int, default=100)
+    parser.add_argument("--stream", action="store_true", help="Stream the responses and record their latency per row")
+    add_cascade_arguments(parser)
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    backend_configs = load_backend_configs(args.backends)
+    evaluate_model.set_backend(backend_configs.get('generation'))
+    evaluate_by_judge.set_backend(backend_configs.get('judge'))
+    evaluate_by_judge.set_cascade(args.cascade_model, args.uncertainty_band, args.audit_rate)
+
+    settings = AdaptiveSettings(args.ci_width, args.confidence, args.batch_size, args.min_rows, args.max_rows,
+                                args.resamples, args.stratify_by, threshold=args.threshold, seed=args.seed)
+    pipeline = StreamingPipeline(args.input_dir, args.output_dir, judge_concurrency=args.judge_concurrency, stream=args.stream)
+    start = time.monotonic()
+    results = asyncio.run(run_adaptive(pipeline, args.configs, settings, args.output_dir))
+    logging.info(f"Adaptive run finished in {time.monotonic() - start:.1f}s")
+
+    if results:
+        summary = pd.DataFrame(results)[['config', 'rows', 'rows_available', 'weighted_overall_score', 'ci_low', 'ci_high', 'stopped']]
+        pd.options.display.float_format = '{:.2f}'.format
+        print(summary.to_string(index=False))
+        print(f"Rows used: {summary['rows'].sum()} of {summary['rows_available'].sum()}")
+        with open(os.path.join(args.output_dir, 'adaptive_summary.json'), mode='w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    evaluate_model.response_cache.report()
+    evaluate_by_judge.response_cache.report()
+    metrics.report()
+    metrics.export('adaptive')
+    if evaluate_by_judge.judge_cascade:
+        evaluate_by_judge.judge_cascade.report()
+        evaluate_by_judge.judge_cascade.export('adaptive')
@@ -0,0 +1,283 @@
+import asyncio
+import copy
+import fnmatch
+import json
+import os
+import threading
+import weakref
+
+import openai
+from openai.openai_object import OpenAIObject
+
+# Sampling overrides per model family, matched on the lower-cased model name; the first match wins
+model_presets = {
+    '*phi*': {"stop": ["<|end|>"]},
+    '*llama-3*': {"stop": ["<|eot_id|>"]},
+}
+
+# Overrides per server kind
+server_presets = {
+    'openai': {},
+    'lmstudio': {"max_tokens": -1},
+}
+
+# Backends with open connection pools, closed by close_backends at the end of an event loop
+open_backends = weakref.WeakSet()
+
+
+def sampling_params(model, base_params=None, server='openai', params=None):
+    """
+    Returns the sampling parameters of a model: `base_params`, then the first matching
+    model_presets entry, the server_presets of `server` and last the explicit `params`.
+    """
+    merged = dict(base_params or {})
+    for pattern, preset in model_presets.items():
+        if fnmatch.fnmatch(model.lower(), pattern):
+            merged.update(preset)
+            break
+    if server not in server_presets:
+        raise ValueError(f"Unknown server kind {server!r}, expected one of {sorted(server_presets)}")
+    merged.update(server_presets[server])
+    merged.update(params or {})
+    return merged
+
+
+def api_error(status, body, headers):
+    """
+    Builds the openai error of an HTTP error response, so retries and metrics treat the
+    requests of every transport alike.
+    """
+    try:
+        json_body = json.loads(body)
+        message = json_body.get('error', {}).get('message') or body
+    except (ValueError, AttributeError):
+        json_body, message = None, body
+    error_class = openai.error.RateLimitError if status == 429 else openai.error.APIError
+    return error_class(message, http_body=body, http_status=status, json_body=json_body, headers=dict(headers))
+
+
+class Backend:
+    """
+    One model on one inference server: its endpoint, credentials, sampling parameters and
+    connection pool. The model under test and the judge each get their own, so generation
+    and judging can use different servers in one process.
+
+    Requests go through the openai module with the endpoint passed per request. Async
+    requests share a keep-alive aiohttp session per event loop instead of opening one
+    connection per request; sync requests reuse the keep-alive session openai keeps per
+    thread. With `http2` the requests are sent with httpx over one multiplexed HTTP/2
+    client (HTTP/1.1 where the server does not negotiate HTTP/2), which needs httpx[http2].
+
+    Parameters:
+        model (str): Model name sent to the server.
+        api_base (str): Server URL, e.g. http://localhost:1234/v1; defaults to the openai
+            module's (OPENAI_API_BASE).
+        api_key (str): API key; defaults to OPENAI_API_KEY.
+        params (dict): Explicit sampling parameters, applied last.
+        server (str): Kind of server, see server_presets.
+        base_params (dict): Sampling parameters of the role (generation or judge), applied first.
+        http2 (bool): Send the requests with httpx over HTTP/2.
+        max_connections (int): Size of the connection pool.
+        keepalive_timeout (float): Seconds an idle connection is kept open.
+        max_concurrency, requests_per_minute, tokens_per_minute (int): Limits of the endpoint
+            for the schedulers; None uses the defaults of evaluate_model.
+    """
+
+    def __init__(self, model, api_base=None, api_key=None, params=None, server='openai', base_params=None, http2=False,
+                 max_connections=100, keepalive_timeout=30.0, max_concurrency=None, requests_per_minute=None,
+                 tokens_per_minute=None):
+        self.model = model
+        self.explicit_api_base = bool(api_base)
+        self.api_base = (api_base or openai.api_base).rstrip('/')
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY", "sk-[...]")
+        self.server = server
+        self.base_params = dict(base_params or {})
+        self.overrides = dict(params or {})
+        self.params = sampling_params(model, self.base_params, server, self.overrides)
+        self.http2 = http2
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # Shared with the copies made by with_model, so models on one server share the pool
+        self._pools = {'lock': threading.Lock(), 'async': {}, 'sync': None}
+
+    @classmethod
+    def from_config(cls, config, base_params=None):
+        """
+        Builds a backend from a config dict with 'model' and optionally 'api_base',
+        'api_key_env' (name of the environment variable holding the key), 'server',
+        'params', 'http2', 'max_connections', 'keepalive_timeout', 'max_concurrency',
+        'requests_per_minute' and 'tokens_per_minute'. Other keys (e.g. a sweep target's
+        'name') are ignored.
+        """
+        options = {key: config[key] for key in ('api_base', 'params', 'server', 'http2', 'max_connections', 'keepalive_timeout',
+                                                 'max_concurrency', 'requests_per_minute', 'tokens_per_minute') if config.get(key) is not None}
+        api_key = os.getenv(config["api_key_env"]) if config.get("api_key_env") else None
+        return cls(config["model"], api_key=api_key, base_params=base_params, **options)
+
+    @property
+    def cache_model(self):
+        """
+        Model name of the response cache keys; answers of an explicitly configured server
+        are kept apart from those of the default one.
+        """
+        return f"{self.model}@{self.api_base}" if self.explicit_api_base else self.model
+
+    def with_model(self, model):
+        """
+        Returns a backend for another model on the same server and connection pool.
+        """
+        other = copy.copy(self)
+        other.model = model
+        other.params = sampling_params(model, self.base_params, self.server, self.overrides)
+        return other
+
+    def request_params(self, messages, params):
+        return dict(self.params, **params, model=self.model, messages=messages)
+
+    def create(self, messages, **params):
+        """
+        Sends a chat completion request and returns the completion.
+        """
+        if self.http2:
+            return self._httpx_create(self.request_params(messages, params))
+        return openai.ChatCompletion.create(api_base=self.api_base, api_key=self.api_key, **self.request_params(messages, params))
+
+    async def acreate(self, messages, stream=False, **params):
+        """
+        Async create; with `stream` an async iterator of the completion chunks.
+        """
+        if self.http2:
+            body = self.request_params(messages, params)
+            if stream:
+                return self._httpx_astream(dict(body, stream=True))
+            return await self._httpx_acreate(body)
+        token = openai.aiosession.set(self._aiohttp_session())
+        try:
+            return await openai.ChatCompletion.acreate(api_base=self.api_base, api_key=self.api_key, stream=stream,
+                                                       **self.request_params(messages, params))
+        finally:
+            openai.aiosession.reset(token)
+
+    def _aiohttp_session(self):
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        with self._pools['lock']:
+            session = self._pools['async'].get(loop)
+            if session is None or session.closed:
+                connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=self.keepalive_timeout)
+                session = self._pools['async'][loop] = aiohttp.ClientSession(connector=connector)
+                open_backends.add(self)
+        return session
+
+    def _httpx_client(self, asynchronous):
+        import httpx
+
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections,
+                              keepalive_expiry=self.keepalive_timeout)
+        client_class = httpx.AsyncClient if asynchronous else httpx.Client
+        return client_class(base_url=self.api_base + '/', http2=True, limits=limits, timeout=600.0,
+                            headers={"Authorization": f"Bearer {self.api_key}"})
+
+    def _httpx_async_client(self):
+        loop = asyncio.get_running_loop()
+        with self._pools['lock']:
+            client = self._pools['async'].get(loop)
+            if client is None or client.is_closed:
+                client = self._pools['async'][loop] = self._httpx_client(asynchronous=True)
+                open_backends.add(self)
+        return client
+
+    def _httpx_sync_client(self):
+        with self._pools['lock']:
+            if self._pools['sync'] is None:
+                self._pools['sync'] = self._httpx_client(asynchronous=False)
+            return self._pools['sync']
+
+    def _httpx_create(self, body):
+        import httpx
+
+        try:
+            response = self._httpx_sync_client().post('chat/completions', json=body)
+        except httpx.TimeoutException as e:
+            raise openai.error.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise openai.error.APIConnectionError(str(e)) from e
+        if response.status_code >= 400:
+            raise api_error(response.status_code, response.text, response.headers)
+        return OpenAIObject.construct_from(response.json())
+
+    async def _httpx_acreate(self, body):
+        import httpx
+
+        try:
+            response = await self._httpx_async_client().post('chat/completions', json=body)
+        except httpx.TimeoutException as e:
+            raise openai.error.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise openai.error.APIConnectionError(str(e)) from e
+        if response.status_code >= 400:
+            raise api_error(response.status_code, response.text, response.headers)
+        return OpenAIObject.construct_from(response.json())
+
+    async def _httpx_astream(self, body):
+        import httpx
+
+        try:
+            async with self._httpx_async_client().stream('POST', 'chat/completions', json=body) as response:
+                if response.status_code >= 400:
+                    raise api_error(response.status_code, (await response.aread()).decode('utf-8', 'replace'), response.headers)
+                # Read to the end of the response, past [DONE], so the connection can be reused
+                async for line in response.aiter_lines():
+                    data = line[len('data:'):].strip() if line.startswith('data:') else ''
+                    if data and data != '[DONE]':
+                        yield OpenAIObject.construct_from(json.loads(data))
+        except httpx.TimeoutException as e:
+            raise openai.error.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise openai.error.APIConnectionError(str(e)) from e
+
+    async def aclose(self):
+        """
+        Closes the async connection pool of the running event loop.
+        """
+        with self._pools['lock']:
+            pool = self._pools['async'].pop(asyncio.get_running_loop(), None)
+        if pool is not None:
+            await (pool.aclose() if self.http2 else pool.close())
+
+
+async def close_backends():
+    """
+    Closes the async connection pools of all backends in the running event loop; call it
+    before the loop ends.
+    """
+    for backend in list(open_backends):
+        await backend.aclose()
+
+
+def load_backend_configs(path):
+    """
+    Loads the backend configs per role from a JSON file, e.g.
+    {"generation": {"model": "phi-3.5-mini", "api_base": "http://localhost:1234/v1", "server": "lmstudio"},
+     "judge": {"model": "gpt-4o", "http2": true}}; see Backend.from_config for the keys.
+
+    Returns:
+        dict: Role -> config; empty without a path.
+    """
+    if not path:
+        return {}
+    with open(path, encoding='utf-8') as f:
+        configs = json.load(f)
+    unknown = set(configs) - {'generation', 'judge'}
+    if unknown:
+        raise ValueError(f"Unknown backend roles {sorted(unknown)} in {path}, expected 'generation' and 'judge'")
+    return configs
+
+
+def add_backend_arguments(parser):
+    parser.add_argument("--backends", default=os.getenv("BACKENDS_CONFIG"),
+                        help="JSON file with the 'generation' and 'judge' backends (server, model, sampling presets, pool)")
@@ -0,0 +1,241 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+terminal_statuses = ('completed', 'failed', 'expired', 'cancelled')
+
+
+def build_batch_request(custom_id, model, messages, params):
+    """
+    Returns one line of a Batch API input file for a chat completion request.
+    """
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": dict(params, model=model, messages=messages),
+    }
+
+
+def write_jsonl(path, records):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, mode='w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def parse_batch_output(records):
+    """
+    Maps the custom_id of every Batch API output line to the message content of its
+    completion, or None if the request failed.
+    """
+    results = {}
+    for record in records:
+        custom_id = record.get("custom_id")
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            logging.error(f"Batch request {custom_id} failed: {record.get('error') or response.get('body')}")
+            results[custom_id] = None
+            continue
+        try:
+            results[custom_id] = response["body"]["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            logging.error(f"Malformed batch response for {custom_id}: {e}")
+            results[custom_id] = None
+    return results
+
+
+class OpenAIBatchClient:
+    """
+    Minimal client for the OpenAI Batch API (upload file, create batch, poll, download)
+    using the API key and base URL configured on the openai module.
+    """
+
+    def __init__(self, api_base=None, api_key=None, completion_window="24h"):
+        import requests
+
+        self.api_base = (api_base or openai.api_base).rstrip("/")
+        self.completion_window = completion_window
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {api_key or openai.api_key}"
+
+    def _check(self, response):
+        response.raise_for_status()
+        return response
+
+    def submit(self, input_path):
+        with open(input_path, "rb") as f:
+            uploaded = self._check(self.session.post(
+                f"{self.api_base}/files", data={"purpose": "batch"},
+                files={"file": (os.path.basename(input_path), f)})).json()
+        batch = self._check(self.session.post(f"{self.api_base}/batches", json={
+            "input_file_id": uploaded["id"],
+            "endpoint": "/v1/chat/completions",
+            "completion_window": self.completion_window,
+        })).json()
+        return batch["id"]
+
+    def status(self, batch_id):
+        return self._check(self.session.get(f"{self.api_base}/batches/{batch_id}")).json()
+
+    def download(self, batch, output_path):
+        with open(output_path, "wb") as f:
+            for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+                if file_id:
+                    f.write(self._check(self.session.get(f"{self.api_base}/files/{file_id}/content")).content)
+
+
+class LocalBatchClient:
+    """
+    Client for the file-based stand-in batch server (`python batch_mode.py serve`).
+    Submitting copies the input file into the spool directory; the server writes
+    `<batch_id>.status.json` and `<batch_id>.output.jsonl` next to it.
+    """
+
+    def __init__(self, spool_dir):
+        self.spool_dir = spool_dir
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def submit(self, input_path):
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        tmp_path = os.path.join(self.spool_dir, f"{batch_id}.input.jsonl.tmp")
+        shutil.copyfile(input_path, tmp_path)
+        os.replace(tmp_path, os.path.join(self.spool_dir, f"{batch_id}.input.jsonl"))
+        return batch_id
+
+    def status(self, batch_id):
+        status_path = os.path.join(self.spool_dir, f"{batch_id}.status.json")
+        if not os.path.exists(status_path):
+            return {"id": batch_id, "status": "validating"}
+        with open(status_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def download(self, batch, output_path):
+        shutil.copyfile(os.path.join(self.spool_dir, f"{batch['id']}.output.jsonl"), output_path)
+
+
+def run_batch(client, requests, input_path, poll_interval=30):
+    """
+    Serializes the requests into a Batch API JSONL file, submits it, polls until the batch
+    is finished and returns the results joined by custom_id.
+
+    Parameters:
+        client (OpenAIBatchClient or LocalBatchClient): Batch endpoint to use.
+        requests (list): Batch request lines as returned by build_batch_request.
+        input_path (str): Where to write the JSONL input; the output is stored next to it.
+        poll_interval (float): Seconds between status polls.
+
+    Returns:
+        dict: custom_id -> message content, or None for requests that failed.
+    """
+    if not requests:
+        return {}
+    write_jsonl(input_path, requests)
+    batch_id = client.submit(input_path)
+    logging.info(f"Submitted batch {batch_id} with {len(requests)} requests from {input_path}")
+
+    while True:
+        batch = client.status(batch_id)
+        if batch.get("status") in terminal_statuses:
+            break
+        counts = batch.get("request_counts") or {}
+        logging.info(f"Batch {batch_id} is {batch.get('status')} ({counts.get('completed', 0)}/{counts.get('total', len(requests))})")
+        time.sleep(poll_interval)
+
+    if batch["status"] != "completed":
+        logging.error(f"Batch {batch_id} ended with status {batch['status']}")
+        return {request["custom_id"]: None for request in requests}
+
+    output_path = input_path.replace(".jsonl", "") + ".output.jsonl"
+    client.download(batch, output_path)
+    results = parse_batch_output(read_jsonl(output_path))
+    missing = [request["custom_id"] for request in requests if request["custom_id"] not in results]
+    if missing:
+        logging.error(f"Batch {batch_id} returned no result for {len(missing)} requests")
+    return {request["custom_id"]: results.get(request["custom_id"]) for request in requests}
+
+
+def make_batch_client(mode, spool_dir, backend=None):
+    """
+    Returns the batch client of `mode`; the OpenAI one submits to the server of `backend`
+    if given.
+    """
+    if mode == "local":
+        return LocalBatchClient(spool_dir)
+    if backend is not None:
+        return OpenAIBatchClient(backend.api_base, backend.api_key)
+    return OpenAIBatchClient()
+
+
+def execute_request(line):
+    """
+    Executes one batch line against the chat completion endpoint configured on the openai
+    module (OPENAI_API_BASE) and returns the Batch API output line.
+    """
+    try:
+        completion = openai.ChatCompletion.create(**line["body"])
+        response = {"status_code": 200, "request_id": completion.get("id"), "body": completion}
+        error = None
+    except Exception as e:
+        response = {"status_code": getattr(e, "http_status", None) or 500, "request_id": None, "body": {"error": str(e)}}
+        error = {"message": str(e)}
+    return {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": line["custom_id"], "response": response, "error": error}
+
+
+def serve(spool_dir, workers=16, poll_interval=1.0):
+    """
+    Stand-in batch server: picks up `*.input.jsonl` files from the spool directory, executes
+    their requests and writes the output JSONL and a status file in the Batch API format.
+    """
+    os.makedirs(spool_dir, exist_ok=True)
+    logging.info(f"Local batch server watching {spool_dir}")
+
+    def write_status(batch_id, status, total, completed, failed, output_file_id=None):
+        status_path = os.path.join(spool_dir, f"{batch_id}.status.json")
+        with open(status_path + ".tmp", mode='w', encoding='utf-8') as f:
+            json.dump({"id": batch_id, "status": status, "output_file_id": output_file_id,
+                       "request_counts": {"total": total, "completed": completed, "failed": failed}}, f)
+        os.replace(status_path + ".tmp", status_path)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            for name in sorted(os.listdir(spool_dir)):
+                if not name.endswith(".input.jsonl"):
+                    continue
+                batch_id = name[:-len(".input.jsonl")]
+                if os.path.exists(os.path.join(spool_dir, f"{batch_id}.status.json")):
+                    continue
+                lines = read_jsonl(os.path.join(spool_dir, name))
+                write_status(batch_id, "in_progress", len(lines), 0, 0)
+                outputs = list(executor.map(execute_request, lines))
+                write_jsonl(os.path.join(spool_dir, f"{batch_id}.output.jsonl"), outputs)
+                failed = sum(1 for output in outputs if output["error"])
+                write_status(batch_id, "completed", len(lines), len(lines) - failed, failed, f"{batch_id}.output.jsonl")
+                logging.info(f"Completed batch {batch_id}: {len(lines)} requests, {failed} failed")
+            time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI Batch API.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Process batch files dropped into a spool directory")
+    serve_parser.add_argument("--spool-dir", default=os.path.join("batch", "spool"))
+    serve_parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    openai.api_key = os.getenv("OPENAI_API_KEY", "sk-[...]")
+    serve(args.spool_dir, workers=args.workers)
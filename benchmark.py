@@ -0,0 +1,276 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from checkpoint import generation_error_markers, judge_error_markers, read_csv_rows
+from mock_server import MockOpenAIServer, add_settings_arguments, settings_from_args
+from scoring import ordered_configs
+from tasks import task_for
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+filler_words = ['Der', 'Bericht', 'beschreibt', 'die', 'Ergebnisse', 'des', 'Projekts', 'und', 'nennt', 'Termine', 'für', 'das', 'Team']
+
+
+def make_workdir(workdir, rows, context_chars, seed=0):
+    """
+    Writes synthetic prepared_<config>_test.csv files for all benchmark configs, with
+    contexts of about `context_chars` characters so memory and parsing costs are realistic.
+    """
+    rng = random.Random(seed)
+    prepared_dir = os.path.join(workdir, 'prepared')
+    os.makedirs(prepared_dir, exist_ok=True)
+    for config_name in ordered_configs:
+        fieldnames = ['System', 'Instruction', 'Chosen'] + (['References'] if task_for(config_name).references else [])
+        with open(os.path.join(prepared_dir, f"prepared_{config_name}_test.csv"), mode='w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=';')
+            writer.writeheader()
+            for index in range(rows):
+                context = []
+                while sum(len(word) + 1 for word in context) < context_chars:
+                    context.append(rng.choice(filler_words))
+                references = sorted(rng.sample(range(1, 6), 2))
+                row = {
+                    'System': f"Beantworte die Frage anhand des Kontexts. Kontext [1]: {' '.join(context)}",
+                    'Instruction': f"Frage {index} zu {config_name}: Was steht im Bericht?",
+                    'Chosen': f"Laut Kontext [{references[0]}] und [{references[1]}] ist die Antwort {index}.",
+                }
+                if 'time_difference' in task_for(config_name).extraction:
+                    row['Chosen'] += f" Zwischen beiden liegen {rng.randint(1, 5)} Tage."
+                if 'extraction_id' in task_for(config_name).extraction:
+                    # Summaries name the attendee IDs and the context sections they draw on
+                    row['Chosen'] += f" ID {rng.randint(1, 20)} spricht im {references[0]}. Kontext-Abschnitt darüber."
+                if 'References' in fieldnames:
+                    row['References'] = str([str(r) for r in references])
+                writer.writerow(row)
+
+
+def run_stage(name, command, cwd, env, rows, timeout=None):
+    """
+    Runs one stage as a child process and measures it with wait4, so the CPU time and peak
+    RSS are those of the stage alone. A stage still running after `timeout` seconds is killed.
+
+    Returns:
+        dict: Wall time, rows/s, CPU seconds and share, peak RSS, exit code and timeout of the stage.
+    """
+    log_path = os.path.join(cwd, f"{name}.log")
+    with open(log_path, mode='w', encoding='utf-8') as log:
+        start = time.monotonic()
+        process = subprocess.Popen(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+        killed = threading.Event()
+
+        def kill():
+            killed.set()
+            process.kill()
+
+        timer = threading.Timer(timeout, kill) if timeout else None
+        if timer:
+            timer.start()
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.monotonic() - start
+        if timer:
+            timer.cancel()
+    timed_out = killed.is_set()
+    process.returncode = os.waitstatus_to_exitcode(status)
+    cpu_seconds = usage.ru_utime + usage.ru_stime
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss_mb = usage.ru_maxrss / (1e6 if sys.platform == 'darwin' else 1e3)
+    result = {
+        "stage": name,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 2) if seconds > 0 else None,
+        "cpu_seconds": round(cpu_seconds, 3),
+        "cpu_percent": round(100 * cpu_seconds / seconds, 1) if seconds > 0 else None,
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "returncode": process.returncode,
+        "timed_out": timed_out,
+        "problems": [],
+    }
+    if timed_out:
+        logging.error(f"Stage {name} did not finish within {timeout:g}s and was killed, see {log_path}")
+    elif process.returncode != 0:
+        logging.error(f"Stage {name} exited with {process.returncode}, see {log_path}")
+    return result
+
+
+def stage_outputs(name, workdir):
+    """
+    Returns the files a stage writes as (path, error column, error markers) tuples; the
+    error column is None for files whose rows cannot fail.
+    """
+    evaluated_dir = os.path.join(workdir, 'evaluated')
+    outputs = []
+    for config_name in ordered_configs:
+        if name == 'generate':
+            outputs.append((os.path.join(evaluated_dir, f"evaluated_{config_name}_test.csv"),
+                            'model_generated_output', generation_error_markers))
+        elif name == 'extract':
+            outputs.append((os.path.join(evaluated_dir, 'extracted', f"extracted_evaluated_{config_name}_test.csv"), None, None))
+        elif name == 'judge':
+            outputs.append((os.path.join(evaluated_dir, 'judged', f"extracted_judged_evaluated_{config_name}_test.csv"),
+                            'overall_score', judge_error_markers))
+    if name == 'score':
+        outputs.append((os.path.join(workdir, 'leaderboard.json'), None, None))
+    return outputs
+
+
+def check_stage_outputs(name, workdir, rows):
+    """
+    Checks that a stage wrote all its files with `rows` rows each and no error markers, since
+    the stages log failed rows and still exit with 0.
+
+    Returns:
+        list: One message per missing file, wrong row count or file with failed rows.
+    """
+    problems = []
+    for path, column, markers in stage_outputs(name, workdir):
+        if not os.path.exists(path):
+            problems.append(f"{os.path.relpath(path, workdir)} is missing")
+            continue
+        if not path.endswith('.csv'):
+            continue
+        try:
+            _, written = read_csv_rows(path)
+        except Exception as e:
+            problems.append(f"{os.path.relpath(path, workdir)} cannot be read: {e}")
+            continue
+        if len(written) != rows:
+            problems.append(f"{os.path.relpath(path, workdir)} has {len(written)} rows, expected {rows}")
+        failed = sum(1 for row in written if (row.get(column) or '') in markers) if column else 0
+        if failed:
+            problems.append(f"{os.path.relpath(path, workdir)} has {failed} failed rows")
+    return problems
+
+
+def stage_failed(result):
+    return result["returncode"] != 0 or result.get("timed_out") or bool(result.get("problems"))
+
+
+def stage_commands(workdir):
+    """
+    Returns (name, command, cwd) of the stages in the order of the README steps.
+    """
+    python = sys.executable
+    return [
+        ('generate', [python, os.path.join(repo_dir, 'evaluate_model.py')], workdir),
+        ('extract', [python, os.path.join(repo_dir, 'evaluated', 'extract_special_metrics.py')], os.path.join(workdir, 'evaluated')),
+        ('judge', [python, os.path.join(repo_dir, 'evaluate_by_judge.py')], workdir),
+        ('score', [python, os.path.join(repo_dir, 'scoring.py'), '--judged-dir', os.path.join('evaluated', 'judged'),
+                   '--weighted-dir', os.path.join('evaluated', 'weighted'), '--output-json', 'leaderboard.json'], workdir),
+    ]
+
+
+def run_benchmark(workdir, rows, context_chars, settings, concurrency=None, stage_timeout=None):
+    """
+    Starts the mock server, runs generation, extraction, judging and scoring against it on
+    synthetic data and returns the measurements of every stage. A stage that times out,
+    fails or leaves missing or failed rows stops the run.
+    """
+    make_workdir(workdir, rows, context_chars)
+    server = MockOpenAIServer(settings=settings).start()
+    env = dict(os.environ, OPENAI_API_BASE=server.url, OPENAI_API_KEY="sk-mock", RESPONSE_CACHE="0",
+               METRICS_DIR=os.path.join(workdir, 'metrics'))
+    if concurrency:
+        env.update(MAX_CONCURRENCY=str(concurrency), JUDGE_CONCURRENCY=str(concurrency))
+    total_rows = rows * len(ordered_configs)
+
+    results = []
+    try:
+        for name, command, cwd in stage_commands(workdir):
+            before = server.stats()
+            result = run_stage(name, command, cwd, env, total_rows, stage_timeout)
+            after = server.stats()
+            # Requests the mock server answered with a 500 during the stage; the retries should hide them
+            result["server_errors"] = after["errors"] - before["errors"]
+            if result["returncode"] == 0 and not result["timed_out"]:
+                result["problems"] = check_stage_outputs(name, workdir, rows)
+            results.append(result)
+            logging.info(f"{name}: {result['rows_per_second']} rows/s, {result['cpu_percent']}% CPU, {result['peak_rss_mb']} MB peak RSS")
+            for problem in result["problems"]:
+                logging.error(f"Stage {name}: {problem} ({result['server_errors']} requests failed on the mock server)")
+            if stage_failed(result):
+                break
+    finally:
+        logging.info(f"Mock server served {server.stats()}")
+        server.stop()
+    return results
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Compares the stages with a previous benchmark result.
+
+    Returns:
+        list: One message per stage whose throughput dropped or whose peak RSS grew by more than `tolerance`.
+    """
+    previous = {result["stage"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(result["stage"])
+        if before is None:
+            continue
+        if result.get("timed_out"):
+            regressions.append(f"{result['stage']}: timed out")
+            continue
+        if result["returncode"] != 0:
+            regressions.append(f"{result['stage']}: failed with exit code {result['returncode']}")
+            continue
+        if result.get("problems"):
+            regressions.append(f"{result['stage']}: {'; '.join(result['problems'])}")
+            continue
+        if before.get("rows_per_second") and result["rows_per_second"] < before["rows_per_second"] * (1 - tolerance):
+            regressions.append(f"{result['stage']}: {result['rows_per_second']} rows/s, baseline {before['rows_per_second']}")
+        if before.get("peak_rss_mb") and result["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{result['stage']}: {result['peak_rss_mb']} MB peak RSS, baseline {before['peak_rss_mb']}")
+    return regressions
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Benchmark generation, judging and scoring against the offline mock server.")
+    parser.add_argument("--rows", type=int, default=200, help="Synthetic rows per config")
+    parser.add_argument("--context-chars", type=int, default=4000, help="Approximate size of every row's context")
+    parser.add_argument("--concurrency", type=int, help="MAX_CONCURRENCY and JUDGE_CONCURRENCY of the stages")
+    parser.add_argument("--workdir", help="Keep the benchmark files here instead of a temporary directory")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Earlier --output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative drop in rows/s or growth in RSS")
+    parser.add_argument("--stage-timeout", type=float, default=900, help="Seconds after which a stage is killed and counted as failed")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    settings = settings_from_args(args)
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        results = run_benchmark(args.workdir, args.rows, args.context_chars, settings, args.concurrency, args.stage_timeout)
+    else:
+        with tempfile.TemporaryDirectory(prefix="grag-benchmark-") as workdir:
+            results = run_benchmark(workdir, args.rows, args.context_chars, settings, args.concurrency, args.stage_timeout)
+
+    print(f"{'stage':<10}{'rows':>8}{'seconds':>10}{'rows/s':>10}{'CPU s':>9}{'CPU %':>8}{'RSS MB':>9}")
+    for result in results:
+        print(f"{result['stage']:<10}{result['rows']:>8}{result['seconds']:>10}{result['rows_per_second']:>10}"
+              f"{result['cpu_seconds']:>9}{result['cpu_percent']:>8}{result['peak_rss_mb']:>9}")
+
+    if args.output:
+        with open(args.output, mode='w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    failed = any(stage_failed(result) for result in results)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for message in regressions:
+            logging.error(f"Regression: {message}")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
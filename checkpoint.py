@@ -0,0 +1,220 @@
+import csv
+import hashlib
+import logging
+import os
+import sys
+
+csv.field_size_limit(sys.maxsize)
+
+generation_error_markers = ('Error generating response', '')
+judge_error_markers = ('', 'None', 'Error: Processing failed')
+
+
+def row_id(row):
+    """
+    Returns a stable identifier for a benchmark row: its 'ID' column when present,
+    otherwise a hash of the System, Instruction and Chosen texts.
+    """
+    if row.get('ID'):
+        return str(row['ID'])
+    content = '\x1f'.join(row.get(col) or '' for col in ('System', 'Instruction', 'Chosen'))
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+
+
+def iter_row_ids(rows):
+    """
+    Lazily yields (row_id, row) for `rows`, suffixing repeated IDs with their occurrence
+    number so that duplicate rows can still be told apart.
+    """
+    seen = {}
+    for row in rows:
+        base = row_id(row)
+        count = seen.get(base, 0)
+        seen[base] = count + 1
+        yield (base if count == 0 else f"{base}#{count}"), row
+
+
+def assign_row_ids(rows):
+    """
+    Returns the row IDs of `rows` in order (see iter_row_ids).
+    """
+    return [rid for rid, _ in iter_row_ids(rows)]
+
+
+def parse_shard(spec):
+    """
+    Parses a shard spec 'i/N' into (i, N) with 0 <= i < N.
+    """
+    index, _, count = str(spec).partition('/')
+    index, count = int(index), int(count)
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {spec!r}, expected i/N with 0 <= i < N")
+    return index, count
+
+
+def shard_of(rid, shard_count):
+    """
+    Returns the shard of a row ID. Repeated rows ('<id>#n') go to the shard of their first
+    occurrence, so each shard file can recompute the same suffixes as the full input.
+    """
+    base = rid.split('#', 1)[0]
+    return int(hashlib.sha1(base.encode('utf-8')).hexdigest()[:8], 16) % shard_count
+
+
+def select_shard(rows, shard):
+    """
+    Lazily yields the rows of `rows` that belong to `shard` ((i, N) or None for all rows).
+    """
+    if shard is None:
+        yield from rows
+        return
+    index, count = shard
+    for row in rows:
+        if shard_of(row_id(row), count) == index:
+            yield row
+
+
+def shard_path(csv_path, shard):
+    """
+    Returns the output path of a shard, e.g. 'x_test.csv' -> 'x_test.shard-0-of-4.csv'.
+    """
+    if shard is None:
+        return csv_path
+    root, ext = os.path.splitext(csv_path)
+    return f"{root}.shard-{shard[0]}-of-{shard[1]}{ext}"
+
+
+def is_shard_file(csv_path):
+    return '.shard-' in os.path.basename(csv_path)
+
+
+def read_csv_rows(csv_path):
+    """
+    Reads a semicolon CSV and returns (fieldnames, rows) with stripped column names.
+    """
+    with open(csv_path, mode='r', newline='', encoding='utf-8') as infile:
+        reader = csv.DictReader(infile, delimiter=';')
+        fieldnames = [name.strip() for name in reader.fieldnames or []]
+        rows = [{(key.strip() if key else key): value for key, value in row.items()} for row in reader]
+    return fieldnames, rows
+
+
+def read_csv_fieldnames(csv_path):
+    with open(csv_path, mode='r', newline='', encoding='utf-8') as infile:
+        return [name.strip() for name in csv.DictReader(infile, delimiter=';').fieldnames or []]
+
+
+def iter_csv_rows(csv_path):
+    """
+    Streams the rows of a semicolon CSV with stripped column names without loading the file.
+    """
+    with open(csv_path, mode='r', newline='', encoding='utf-8') as infile:
+        for row in csv.DictReader(infile, delimiter=';'):
+            yield {(key.strip() if key else key): value for key, value in row.items()}
+
+
+def write_csv_rows_atomic(csv_path, fieldnames, rows):
+    """
+    Writes the rows to a temporary file next to `csv_path` and moves it into place.
+    """
+    tmp_path = csv_path + '.tmp'
+    with open(tmp_path, mode='w', newline='', encoding='utf-8') as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames, delimiter=';', extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, csv_path)
+
+
+class CheckpointedWriter:
+    """
+    Writes result rows to an output CSV and records each completed row ID in a
+    `<output>.ckpt` sidecar, so an interrupted stage resumes where it stopped instead of
+    truncating its output.
+
+    On resume the output is first reduced to the rows listed in the checkpoint, which drops
+    a half-written last line or a row written just before the crash but never checkpointed.
+    The checkpoint is removed when the stage finishes without an exception.
+    """
+
+    def __init__(self, output_csv_path, fieldnames):
+        self.output_csv_path = output_csv_path
+        self.checkpoint_path = output_csv_path + '.ckpt'
+        self.fieldnames = fieldnames
+        self.completed = set()
+        self._outfile = None
+        self._checkpoint = None
+        self._writer = None
+
+    def __enter__(self):
+        if os.path.exists(self.checkpoint_path) and os.path.exists(self.output_csv_path):
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                checkpointed = set(line.rstrip('\n') for line in f if line.endswith('\n'))
+            _, rows = read_csv_rows(self.output_csv_path)
+            kept = []
+            for rid, row in zip(assign_row_ids(rows), rows):
+                if rid in checkpointed and rid not in self.completed:
+                    self.completed.add(rid)
+                    kept.append(row)
+            write_csv_rows_atomic(self.output_csv_path, self.fieldnames, kept)
+            with open(self.checkpoint_path, mode='w', encoding='utf-8') as f:
+                f.writelines(rid + '\n' for rid in assign_row_ids(kept))
+            logging.info(f"Resuming {self.output_csv_path} from checkpoint with {len(kept)} completed rows")
+        else:
+            with open(self.output_csv_path, mode='w', newline='', encoding='utf-8') as outfile:
+                csv.DictWriter(outfile, fieldnames=self.fieldnames, delimiter=';').writeheader()
+            open(self.checkpoint_path, mode='w', encoding='utf-8').close()
+
+        self._outfile = open(self.output_csv_path, mode='a', newline='', encoding='utf-8')
+        self._checkpoint = open(self.checkpoint_path, mode='a', encoding='utf-8')
+        self._writer = csv.DictWriter(self._outfile, fieldnames=self.fieldnames, delimiter=';', extrasaction='ignore')
+        return self
+
+    def pending(self, rows):
+        """
+        Lazily yields the (row_id, row) pairs of `rows` that are not yet in the checkpoint.
+        """
+        return ((rid, row) for rid, row in iter_row_ids(rows) if rid not in self.completed)
+
+    def writerow(self, rid, row):
+        self._writer.writerow(row)
+        self._outfile.flush()
+        self._checkpoint.write(rid + '\n')
+        self._checkpoint.flush()
+        self.completed.add(rid)
+
+    def __exit__(self, exc_type, exc, tb):
+        self._outfile.close()
+        self._checkpoint.close()
+        if exc_type is None:
+            os.remove(self.checkpoint_path)
+        return False
+
+
+def redrive_errors(output_csv_path, is_error, redo_rows):
+    """
+    Re-issues only the rows of an existing result file that carry error markers and merges
+    the new results back into the file in place, keeping the row order.
+
+    Parameters:
+        output_csv_path (str): Result CSV of a previous run.
+        is_error (callable): Returns True for a row that should be re-driven.
+        redo_rows (callable): Takes the list of failed rows and returns the updated rows in the same order.
+
+    Returns:
+        int: Number of rows that still carry an error marker afterwards.
+    """
+    fieldnames, rows = read_csv_rows(output_csv_path)
+    failed = [i for i, row in enumerate(rows) if is_error(row)]
+    if not failed:
+        logging.info(f"No failed rows to re-drive in {output_csv_path}")
+        return 0
+
+    logging.info(f"Re-driving {len(failed)} of {len(rows)} rows in {output_csv_path}")
+    updated = redo_rows([rows[i] for i in failed])
+    for i, row in zip(failed, updated):
+        rows[i] = row
+    write_csv_rows_atomic(output_csv_path, fieldnames, rows)
+
+    remaining = sum(1 for i in failed if is_error(rows[i]))
+    logging.info(f"Re-drive of {output_csv_path} fixed {len(failed) - remaining} rows, {remaining} still failing")
+    return remaining
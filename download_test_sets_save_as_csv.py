@@ -1,33 +1,203 @@
+import argparse
+import hashlib
 import json
-import huggingface_hub
-from datasets import load_dataset
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
-HF_TOKEN = "hf_[...]"
+from tasks import task_names
+
+HF_TOKEN = os.getenv("HF_TOKEN", "hf_[...]")
 hf_repo = "avemio/GRAG-HARD-LLM-BENCHMARK"
-config_names = [
-    'summarize-meeting-attendee-topic', 
-    'summarize-meeting-topic', 
-    'hard-qa-with-multiple-references', 
-    'hard-reasoning-de', 
-    'hard-reasoning-en', 
-]
-
-# Authenticate with Hugging Face Hub
-huggingface_hub.login(HF_TOKEN)
-
-# Iterate over all configurations
-for config_name in config_names:
-    # Load the dataset with the specified configuration
-    dataset = load_dataset(hf_repo, config_name)
-    
-    # Iterate over all splits
+config_names = task_names
+
+required_columns = ["System", "Instruction", "Chosen"]
+
+# Records the revision every config is pinned to and what was exported from it
+lock_file_name = "datasets.lock.json"
+
+
+def hf_token():
+    return None if HF_TOKEN == "hf_[...]" else HF_TOKEN
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, mode='rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_lock(output_dir):
+    path = os.path.join(output_dir, lock_file_name)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_lock(output_dir, lock):
+    path = os.path.join(output_dir, lock_file_name)
+    with open(path + '.tmp', mode='w', encoding='utf-8') as f:
+        json.dump(lock, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def resolve_revision(revision=None):
+    """
+    Returns the commit hash of `revision` (a branch, tag or hash; default main) on the Hub.
+    """
+    import huggingface_hub
+
+    return huggingface_hub.HfApi().dataset_info(hf_repo, revision=revision or "main", token=hf_token()).sha
+
+
+def is_current(entry, revision, output_dir):
+    """
+    Returns True if a config was exported from `revision` and its CSV files are unchanged.
+    """
+    if not entry or entry.get("revision") != revision or not entry.get("files"):
+        return False
+    for file_name, recorded in entry["files"].items():
+        path = os.path.join(output_dir, file_name)
+        if not os.path.exists(path) or file_sha256(path) != recorded["sha256"]:
+            return False
+    return True
+
+
+def export_config(config_name, revision, output_dir, cache_dir=None):
+    """
+    Loads one config at the pinned revision (from the local cache when offline) and writes
+    its test splits as <config>_<split>.csv, the input of prepare_datasets.py and pipeline.py.
+
+    Returns:
+        dict: The lock entry of the config.
+    """
+    from datasets import load_dataset
+
+    dataset = load_dataset(hf_repo, config_name, revision=revision, cache_dir=cache_dir, token=hf_token())
+    entry = {"revision": revision, "fingerprints": {}, "files": {}}
     for split_name in dataset:
         split = dataset[split_name]
-        # Check if the split is a test split
-        if 'test' in split_name:
-            # Check if the required columns are present
-            if all(col in split.column_names for col in ["System", "Instruction", "Chosen"]):
-                # Save the split as a CSV file
-                csv_filename = f"{config_name}_{split_name}.csv"
-                split.to_csv(csv_filename, sep=';', index=False, encoding='utf-8')
-                print(f"Saved {csv_filename}")
\ No newline at end of file
+        # Only test splits with the required columns are exported
+        if 'test' not in split_name or not all(col in split.column_names for col in required_columns):
+            continue
+        csv_filename = f"{config_name}_{split_name}.csv"
+        path = os.path.join(output_dir, csv_filename)
+        split.to_csv(path + '.tmp', sep=';', index=False, encoding='utf-8')
+        os.replace(path + '.tmp', path)
+        entry["fingerprints"][split_name] = split._fingerprint
+        entry["files"][csv_filename] = {"rows": split.num_rows, "sha256": file_sha256(path)}
+        logging.info(f"Saved {csv_filename} ({split.num_rows} rows)")
+    return entry
+
+
+def sync(configs, output_dir='.', revision=None, offline=False, cache_dir=None, workers=5, force=False, update=False):
+    """
+    Brings the CSV files of `configs` to their pinned dataset revision. Every config is pinned
+    to the revision it was exported from, so reruns keep the exported data until the pin of
+    `configs` is moved explicitly with `update` (to main) or `revision`; configs without an
+    entry use the revision of the lock file, or main without one. Configs whose files were
+    exported from their revision and are unchanged are skipped; the others are loaded in
+    parallel and exported. Offline, the data comes from the local datasets cache.
+
+    The top-level revision of the lock file only moves once all configs are pinned to the same
+    revision, so syncing a subset leaves a lock whose entries each verify against their own pin.
+
+    Returns:
+        dict: Config -> 'current' or 'exported'.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    lock = read_lock(output_dir)
+    if update and (revision or offline):
+        raise ValueError("--update moves the pin to main on the Hub and cannot be combined with --revision or --offline")
+    moved = bool(revision or update)
+    if revision or update or not lock.get("revision"):
+        if offline:
+            if not revision:
+                raise ValueError(f"Offline sync needs --revision or a {lock_file_name} with a revision")
+        else:
+            revision = resolve_revision(revision)
+    else:
+        # The locked revision is a commit hash already
+        revision = lock["revision"]
+
+    entries = lock.get("configs", {})
+    # Without an explicit move every config stays at the revision it was exported from
+    targets = {}
+    for config_name in configs:
+        entry = entries.get(config_name) or {}
+        targets[config_name] = revision if moved or not entry.get("revision") else entry["revision"]
+    logging.info(f"Syncing {hf_repo} at revision {', '.join(sorted(set(targets.values())))}")
+    stale = [config_name for config_name in configs if force or not is_current(entries.get(config_name), targets[config_name], output_dir)]
+    status = {config_name: 'exported' if config_name in stale else 'current' for config_name in configs}
+    if stale:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(stale)))) as executor:
+            exported = executor.map(lambda c: export_config(c, targets[c], output_dir, cache_dir), stale)
+            for config_name, entry in zip(stale, exported):
+                entries[config_name] = entry
+
+    pinned = {entries[config_name]["revision"] for config_name in config_names if config_name in entries}
+    if len(pinned) == 1 and all(config_name in entries for config_name in config_names):
+        lock_revision = pinned.pop()
+    else:
+        lock_revision = lock.get("revision") or revision
+        behind = [config_name for config_name in config_names if entries.get(config_name, {}).get("revision") != revision]
+        if moved and behind:
+            logging.warning(f"{', '.join(behind)} are not at revision {revision}; the lock keeps revision {lock_revision} "
+                            f"until all configs are synced to it")
+    if stale or lock_revision != lock.get("revision"):
+        write_lock(output_dir, {"repo": hf_repo, "revision": lock_revision, "configs": entries})
+    for config_name in configs:
+        logging.info(f"{config_name}: {status[config_name]}")
+    return status
+
+
+def verify(configs, output_dir='.'):
+    """
+    Checks the CSV files of `configs` against the revisions they are pinned to in the lock
+    file without any network access.
+
+    Returns:
+        list: Problems found; empty if every file matches.
+    """
+    lock = read_lock(output_dir)
+    if not lock:
+        return [f"no {lock_file_name} in {output_dir}"]
+    problems = []
+    for config_name in configs:
+        entry = lock.get("configs", {}).get(config_name)
+        revision = (entry or {}).get("revision") or lock["revision"]
+        if not is_current(entry, revision, output_dir):
+            problems.append(f"{config_name} is missing or differs from revision {revision}")
+    return problems
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description=f"Download the test splits of {hf_repo} as CSV files, pinned to a revision.")
+    parser.add_argument("--configs", nargs="+", default=config_names, choices=config_names)
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--revision", help="Branch, tag or commit to pin the configs to (default: their revisions in the lock file, main without one)")
+    parser.add_argument("--update", action="store_true", help="Move the pin to the current commit of main")
+    parser.add_argument("--offline", action="store_true", help="Do not contact the Hub; load from the local datasets cache")
+    parser.add_argument("--cache-dir", help="datasets cache directory, e.g. one restored in CI")
+    parser.add_argument("--workers", type=int, default=5, help="Configs loaded in parallel")
+    parser.add_argument("--force", action="store_true", help="Export even if the files are current")
+    parser.add_argument("--verify", action="store_true", help="Only check the files against the lock file and exit")
+    args = parser.parse_args()
+
+    if args.verify:
+        problems = verify(args.configs, args.output_dir)
+        for problem in problems:
+            logging.error(problem)
+        sys.exit(1 if problems else 0)
+
+    if args.offline:
+        # Must be set before datasets is imported
+        os.environ["HF_HUB_OFFLINE"] = "1"
+        os.environ["HF_DATASETS_OFFLINE"] = "1"
+    sync(args.configs, args.output_dir, args.revision, args.offline, args.cache_dir, args.workers, args.force, args.update)
@@ -1,190 +1,257 @@
-import csv
+import argparse
 from datetime import datetime
-import openai
 import logging
 import os
 import glob
-import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import itertools
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from backends import Backend, add_backend_arguments, load_backend_configs
+from batch_mode import build_batch_request, make_batch_client, run_batch
+from checkpoint import CheckpointedWriter, assign_row_ids, iter_csv_rows, judge_error_markers, parse_shard, read_csv_fieldnames, read_csv_rows, redrive_errors, select_shard, shard_path, write_csv_rows_atomic
+from generation_engine import imap_ordered_threaded
+from instrumentation import config_from_path, current_config, error_status, metrics
+from judge_cascade import JudgeCascade, add_cascade_arguments, cascade_columns
+from judge_parsing import parse_scores, parse_verdict, reasoning_key, repair_messages, verdict_schema
+from response_cache import open_default_cache
+from result_store import ResultStore
+from tasks import task_for
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Set up OpenAI client
-openai.api_key = os.getenv("OPENAI_API_KEY", "sk-[...]")  # Replace with environment variable or secure storage
-# openai.api_base = "http://localhost:1234/v1" # FOR LM STUDIO 
-
 model_name = "gpt-4o-mini"
 
-def is_number(value):
-    return isinstance(value, (int, float))
+judge_params = {
+    "temperature": 0.01,
+    "top_p": 0.1,
+    "frequency_penalty": 0,
+    "presence_penalty": 0,
+}
+
+# Ask for the verdict as a strict JSON schema (structured outputs); set to 0 for endpoints
+# that only support {"type": "json_object"}
+structured_outputs = os.getenv("JUDGE_STRUCTURED_OUTPUTS", "1") != "0"
+
+# Judge requests in flight; at most twice as many rows are held in memory at any time
+judge_max_workers = int(os.getenv("JUDGE_CONCURRENCY", "100"))
+
+response_cache = open_default_cache()
+
+# Server, key and connection pool of the judge, independent of the model under test
+judge_backend = Backend(model_name, base_params=judge_params)
+
+# Other judge models (the cheap judge of the cascade) on the judge's server; model -> Backend
+model_backends = {}
+
+# Cheap-judge-first cascade, off unless set_cascade is given a cheap model
+judge_cascade = None
 
+# Identical judge requests of a run share one API call, e.g. when two models of a sweep give
+# the same answer to a row, even with the response cache off; cache key -> Future of the
+# response text, for the requests in flight and the most recent answers
+shared_requests = OrderedDict()
+shared_requests_lock = threading.Lock()
+max_shared_requests = 10000
 
-def generate_model_responses(system, instruction, response, model_generated_output):
+def set_backend(config):
     """
-    Sends a system and user instruction to the OpenAI model and returns the response.
+    Sends the judge requests to the backend of `config` (see Backend.from_config); keeps
+    the default backend if `config` is empty.
+    """
+    global judge_backend
+    if config:
+        judge_backend = Backend.from_config(config, judge_params)
+        model_backends.clear()
 
-    Parameters:
-        system (str): The system message to set the context.
-        instruction (str): The user instruction to process.
 
-    Returns:
-        str: The model's response or an error message if the request fails.
+def backend_for(model=None):
     """
-    try:
-        completion = openai.ChatCompletion.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": "You should respond in JSON format with the following keys: 'reasoning_of_metrics_and_correctness', 'language_quality', 'overall_correctness', 'instruction_following', 'overall_score'. The values should be a number between 0 and 100 except for the reasoning - here you should think about each metric and compare the target response and the generated response carefully together with the given context. You have to do your reasoning in english language."},
-                {"role": "user", "content": "System Instruction\n" + system + "\nUser Instruction:\n"+ instruction + "\nTarget Response that is the wanted generated Answer should be seen as ground thruth" + response + "\nModel generated Response that should be evaluated against the system and user instructions and should be compared to the Target Response:\n" + model_generated_output}
-            ],
-            
-            temperature = 0.01,
-            top_p=0.1,
-            frequency_penalty=0,
-            presence_penalty=0,
-            response_format={"type": "json_object"}
-        )
-        message = completion.choices[0].message['content']
-        
-        # Parse the JSON content
-        response_data = json.loads(message)
-        
-        # Extract each key separately
-        reasoning_of_metrics_and_correctness = response_data.get('reasoning_of_metrics_and_correctness', None)
+    Returns the backend of a judge model: the judge backend, or the same server with another model.
+    """
+    if not model or model == judge_backend.model:
+        return judge_backend
+    if model not in model_backends:
+        model_backends[model] = judge_backend.with_model(model)
+    return model_backends[model]
 
-        language_quality = response_data.get('language_quality', None)
-        language_quality = language_quality if is_number(language_quality) else None
 
-        overall_correctness = response_data.get('overall_correctness', None)
-        overall_correctness = overall_correctness if is_number(overall_correctness) else None
+def judge_request_params(score_keys, reasoning=True):
+    """
+    Returns the response_format of a verdict with `score_keys`; the backend adds its
+    sampling parameters.
+    """
+    response_format = verdict_schema(score_keys, reasoning) if structured_outputs else {"type": "json_object"}
+    return {"response_format": response_format}
 
-        instruction_following = response_data.get('instruction_following', None)
-        instruction_following = instruction_following if is_number(instruction_following) else None
 
-        overall_score = response_data.get('overall_score', None)
-        overall_score = overall_score if is_number(overall_score) else None
+def build_judge_messages(judge_prompt, system, instruction, response, model_generated_output):
+    """
+    Orders the judge request from the most to the least shared part, so providers with
+    prefix caching can reuse it: the rubric (all rows), the context, instruction and target
+    of the row (every model judged on the row), and last the evaluated response on its own.
+    """
+    return [
+        {"role": "system", "content": judge_prompt},
+        {"role": "user", "content": "System Instruction\n" + system + "\nUser Instruction:\n"+ instruction + "\nTarget Response that is the wanted generated Answer should be seen as ground thruth" + response},
+        {"role": "user", "content": "Model generated Response that should be evaluated against the system and user instructions and should be compared to the Target Response:\n" + model_generated_output}
+    ]
 
-        # Return the extracted values as a dictionary
-        return {
-            'reasoning_of_metrics_and_correctness': reasoning_of_metrics_and_correctness,
-            'language_quality': language_quality,
-            'overall_correctness': overall_correctness,
-            'instruction_following': instruction_following,
-            'overall_score': overall_score
-        }
-    except Exception as e:
-        logging.error(f"Error generating Response for instruction '{instruction}': {e}")
-        return {
-            'reasoning_of_metrics_and_correctness': None,
-            'language_quality': None,
-            'overall_correctness': None,
-            'instruction_following': None,
-            'overall_score': None
-        }
 
+def evict_shared_requests():
+    """
+    Drops the oldest answered requests beyond max_shared_requests. Requests still in flight
+    are kept, as other rows may be waiting on them. Call with shared_requests_lock held.
+    """
+    excess = len(shared_requests) - max_shared_requests
+    if excess > 0:
+        answered = list(itertools.islice((key for key, shared in shared_requests.items() if shared.done()), excess))
+        for key in answered:
+            del shared_requests[key]
 
-def generate_model_responses_reasoning(system, instruction, response, model_generated_output):
+
+def forget_shared_request(cache_key, shared):
     """
-    Sends a system and user instruction to the OpenAI model and returns the response.
+    Removes `shared` from shared_requests unless it was evicted and the key reused since.
+    """
+    with shared_requests_lock:
+        if shared_requests.get(cache_key) is shared:
+            del shared_requests[cache_key]
 
-    Parameters:
-        system (str): The system message to set the context.
-        instruction (str): The user instruction to process.
 
-    Returns:
-        str: The model's response or an error message if the request fails.
+def request_judgement(messages, parse, params, model=None, stage='judge'):
     """
+    Sends the judge messages to the judge backend (of `model` if given),
+    consulting the response cache first, and returns `parse` of the response text. `parse`
+    raises ValueError for an unusable response; only usable responses are cached. A request
+    identical to an earlier one of the run reuses its response, waiting for it if it is
+    still in flight, instead of being sent again.
+    """
+    backend = backend_for(model)
+    params = dict(backend.params, **params)
+    trace = metrics.trace(stage, backend.model)
+    cache_key = response_cache.make_key(backend.cache_model, params, messages)
+    message = response_cache.get(cache_key)
+    if message is not None:
+        trace.finish(cached=True)
+        return parse(message)
+
+    with shared_requests_lock:
+        shared = shared_requests.get(cache_key)
+        sending = shared is None
+        if sending:
+            shared = shared_requests[cache_key] = Future()
+            evict_shared_requests()
+    if not sending:
+        try:
+            message = shared.result()
+        except Exception as e:
+            trace.finish(error_status(e), type(e).__name__, deduplicated=True)
+            raise
+        trace.finish(deduplicated=True)
+        return parse(message)
+
     try:
-        completion = openai.ChatCompletion.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": "You should respond in JSON format with the following keys: 'reasoning_of_metrics_and_correctness', 'language_quality', 'overall_correctness', 'instruction_following', 'constrains_adherence', 'logical_consistency', 'final_solution_correctness', 'overall_score'. The values should be a number between 0 and 100. EXCEPT For the reasoning_of_metrics_and_correctness - here you should think about each metric and compare the target response and the generated response carefully together with the given context and present your thinking as a text. You have to do your reasoning in english language."},
-                {"role": "user", "content": "System Instruction\n" + system + "\nUser Instruction:\n"+ instruction + "\nTarget Response that is the wanted generated Answer should be seen as ground thruth" + response + "\nModel generated Response that should be evaluated against the system and user instructions and should be compared to the Target Response:\n" + model_generated_output}
-            ],
-            
-            temperature = 0.01,
-            top_p=0.1,
-            frequency_penalty=0,
-            presence_penalty=0,
-            response_format={"type": "json_object"}
-        )
+        trace.attempt()
+        completion = backend.create(messages, **params)
+        trace.record_usage(completion.get('usage'))
         message = completion.choices[0].message['content']
-        
-        # Parse the JSON content
-        response_data = json.loads(message)
+        shared.set_result(message)
+        response_data = parse(message)
+        response_cache.put(cache_key, message, backend.cache_model)
+    except ValueError as e:
+        # The API call succeeded but the verdict is unusable; do not reuse it
+        trace.finish(200, type(e).__name__)
+        forget_shared_request(cache_key, shared)
+        raise
+    except Exception as e:
+        trace.finish(error_status(e), type(e).__name__)
+        raise
+    finally:
+        if not shared.done():
+            # Requests waiting on this one fail the same way; later ones are sent again
+            shared.set_exception(sys.exc_info()[1] or RuntimeError("The shared judge request failed"))
+            forget_shared_request(cache_key, shared)
+    trace.finish()
+    return response_data
+
+
+def repair_scores(scores, missing, model=None):
+    """
+    Asks for the `missing` scores of a verdict in a short follow-up request that only carries
+    the verdict's reasoning, instead of re-judging the whole row. Scores that still cannot be
+    read stay None.
+    """
+    if not scores[reasoning_key]:
+        logging.warning(f"Judge verdict without reasoning, cannot repair the scores {missing}")
+        return scores
+    try:
+        scores.update(request_judgement(repair_messages(scores[reasoning_key], missing),
+                                        lambda text: parse_scores(text, missing),
+                                        judge_request_params(missing, reasoning=False), model, stage='judge-repair'))
+    except Exception as e:
+        logging.error(f"Error repairing the judge scores {missing}: {e}")
+    return scores
 
-        # Extract each key separately
-        reasoning_of_metrics_and_correctness = response_data.get('reasoning_of_metrics_and_correctness', None)
 
-        constrains_adherence = response_data.get('constrains_adherence', None)
-        constrains_adherence = constrains_adherence if is_number(constrains_adherence) else None
+def judge_scores(messages, score_keys, model=None):
+    """
+    Judges one row with one model: the verdict is validated against the schema and missing
+    or invalid scores are repaired.
+    """
+    scores, missing = request_judgement(messages, lambda text: parse_verdict(text, score_keys),
+                                        judge_request_params(score_keys), model)
+    return repair_scores(scores, missing, model) if missing else scores
 
-        logical_consistency = response_data.get('logical_consistency', None)
-        logical_consistency = logical_consistency if is_number(logical_consistency) else None
 
-        final_solution_correctness = response_data.get('final_solution_correctness', None)
-        final_solution_correctness = final_solution_correctness if is_number(final_solution_correctness) else None        
+def set_cascade(cheap_model, band=(50, 85), audit_rate=0.0):
+    """
+    Turns the judge cascade on with `cheap_model` as first judge and the model of the judge
+    backend as the expensive one, or off if `cheap_model` is empty. Both run on the judge's server.
+    """
+    global judge_cascade
+    judge_cascade = JudgeCascade(judge_scores, cheap_model, judge_backend.model, band, audit_rate=audit_rate) if cheap_model else None
 
-        language_quality = response_data.get('language_quality', None)
-        language_quality = language_quality if is_number(language_quality) else None
 
-        overall_correctness = response_data.get('overall_correctness', None)
-        overall_correctness = overall_correctness if is_number(overall_correctness) else None
+def judge_messages(messages, task, response, model_generated_output):
+    """
+    Scores one row of `task` with the cascade if it is on, otherwise with the judge backend alone.
+    """
+    if judge_cascade:
+        return judge_cascade.score(messages, task, response, model_generated_output)
+    return judge_scores(messages, task.score_keys)
+
 
-        instruction_following = response_data.get('instruction_following', None)
-        instruction_following = instruction_following if is_number(instruction_following) else None
+def judged_columns(score_keys):
+    return ['reasoning_of_metrics_and_correctness'] + score_keys + (cascade_columns if judge_cascade else [])
+
+
+def generate_model_responses(task, system, instruction, response, model_generated_output):
+    """
+    Sends a system and user instruction to the OpenAI model and returns the response.
 
-        overall_score = response_data.get('overall_score', None)
-        overall_score = overall_score if is_number(overall_score) else None
+    Parameters:
+        task (Task): Task of the row; gives the judge prompt and the score keys.
+        system (str): The system message to set the context.
+        instruction (str): The user instruction to process.
 
-        # Return the extracted values as a dictionary
-        return {
-            'reasoning_of_metrics_and_correctness': reasoning_of_metrics_and_correctness,
-            'language_quality': language_quality,
-            'overall_correctness': overall_correctness,
-            'instruction_following': instruction_following,
-            'constrains_adherence': constrains_adherence,
-            'logical_consistency': logical_consistency,
-            'final_solution_correctness': final_solution_correctness,
-            'overall_score': overall_score
-        }
+    Returns:
+        dict: The judge's reasoning and scores, None where the request failed.
+    """
+    try:
+        return judge_messages(
+            build_judge_messages(task.judge_prompt, system, instruction, response, model_generated_output),
+            task, response, model_generated_output
+        )
     except Exception as e:
         logging.error(f"Error generating Response for instruction '{instruction}': {e}")
-        return {
-            'reasoning_of_metrics_and_correctness': None,
-            'language_quality': None,
-            'overall_correctness': None,
-            'instruction_following': None,
-            'constrains_adherence': None,
-            'logical_consistency': None,
-            'final_solution_correctness': None,
-            'overall_score': None
-        }
-
-def process_row(row):
-    instruction = row.get('Instruction'.strip())
-    system = row.get('System'.strip())
-    response = row.get('Chosen'.strip())
-    model_generated_output = row.get('model_generated_output'.strip())
-    
-    if not instruction or not model_generated_output:
-        logging.warning(f"Missing 'Instruction' or 'System' in row: {row}")
-        return {
-            'reasoning_of_metrics_and_correctness': 'Error: Missing data',
-            'language_quality': 'Error: Missing data',
-            'overall_correctness': 'Error: Missing data',
-            'instruction_following': 'Error: Missing data',
-            'constrains_adherence': 'Error: Missing data',
-            'logical_consistency': 'Error: Missing data',
-            'final_solution_correctness': 'Error: Missing data',
-            'overall_score': 'Error: Missing data'
-        }
-    else:
-        return generate_model_responses(system, instruction, response, model_generated_output)
-    
-def process_row_reasoning(row):
+        return dict.fromkeys(['reasoning_of_metrics_and_correctness'] + task.score_keys)
+
+def process_row(row, task):
     instruction = row.get('Instruction'.strip())
     system = row.get('System'.strip())
     response = row.get('Chosen'.strip())
@@ -192,126 +259,155 @@ def process_row_reasoning(row):
     
     if not instruction or not model_generated_output:
         logging.warning(f"Missing 'Instruction' or 'System' in row: {row}")
-        return {
-            'reasoning_of_metrics_and_correctness': 'Error: Missing data',
-            'language_quality': 'Error: Missing data',
-            'overall_correctness': 'Error: Missing data',
-            'instruction_following': 'Error: Missing data',
-            'constrains_adherence': 'Error: Missing data',
-            'logical_consistency': 'Error: Missing data',
-            'final_solution_correctness': 'Error: Missing data',
-            'overall_score': 'Error: Missing data'
-        }
+        return dict.fromkeys(['reasoning_of_metrics_and_correctness'] + task.score_keys, 'Error: Missing data')
     else:
-        return generate_model_responses_reasoning(system, instruction, response, model_generated_output)
+        return generate_model_responses(task, system, instruction, response, model_generated_output)
 
-def process_csv_and_generate_output(input_csv_path, output_csv_path):
+def process_csv_and_generate_output(input_csv_path, output_csv_path, task, shard=None):
     try:
-        with open(input_csv_path, mode='r', newline='', encoding='utf-8') as infile, \
-             open(output_csv_path, mode='w', newline='', encoding='utf-8') as outfile:
-            
-            reader = csv.DictReader(infile, delimiter=';')
-            fieldnames = [name.strip() for name in reader.fieldnames]
-            
-            if 'Instruction' not in fieldnames or 'System' not in fieldnames:
-                logging.error(f"Input CSV must contain 'Instruction' and 'System' columns. Found columns: {fieldnames}")
-                return
-            
-            writer = csv.DictWriter(outfile, fieldnames=fieldnames + ['reasoning_of_metrics_and_correctness', 'language_quality', 'overall_correctness', 'instruction_following', 'overall_score'], delimiter=';')
-            writer.writeheader()
+        fieldnames = read_csv_fieldnames(input_csv_path)
+        
+        if 'Instruction' not in fieldnames or 'System' not in fieldnames:
+            logging.error(f"Input CSV must contain 'Instruction' and 'System' columns. Found columns: {fieldnames}")
+            return
+        
+        with CheckpointedWriter(output_csv_path, fieldnames + judged_columns(task.score_keys)) as writer:
             
-            with ThreadPoolExecutor(max_workers=100) as executor:
-                futures = {executor.submit(process_row, row): row for row in reader}
+            # Rows are streamed from the input, judged in a bounded window and written in input order
+            for (rid, row), future in imap_ordered_threaded(lambda item: process_row(item[1], task), writer.pending(select_shard(iter_csv_rows(input_csv_path), shard)), judge_max_workers):
+                try:
+                    result = future.result()
+                    row.update(result)
+                except Exception as e:
+                    logging.error(f"Error processing row: {e}")
+                    row.update(dict.fromkeys(['reasoning_of_metrics_and_correctness'] + task.score_keys, 'Error: Processing failed'))
                 
-                for future in as_completed(futures):
-                    row = futures[future]
-                    try:
-                        result = future.result()
-                        row.update(result)
-                    except Exception as e:
-                        logging.error(f"Error processing row: {e}")
-                        row.update({
-                            'reasoning_of_metrics_and_correctness': 'Error: Processing failed',
-                            'language_quality': 'Error: Processing failed',
-                            'overall_correctness': 'Error: Processing failed',
-                            'instruction_following': 'Error: Processing failed',
-                            'overall_score': 'Error: Processing failed'
-                        })
-                    
-                    writer.writerow(row)
-                    logging.info(f"Processed row with Instruction: {row.get('Instruction', 'N/A')}")
-                
-    except FileNotFoundError as e:
-        logging.error(f"File not found: {e}")
-    except Exception as e:
-        logging.error(f"An error occurred while processing the CSV: {e}")
-
-def process_reasoning_csv_and_generate_output(input_csv_path, output_csv_path):
-    try:
-        with open(input_csv_path, mode='r', newline='', encoding='utf-8') as infile, \
-             open(output_csv_path, mode='w', newline='', encoding='utf-8') as outfile:
-            
-            reader = csv.DictReader(infile, delimiter=';')
-            fieldnames = [name.strip() for name in reader.fieldnames]
-            
-            if 'Instruction' not in fieldnames or 'System' not in fieldnames:
-                logging.error(f"Input CSV must contain 'Instruction' and 'System' columns. Found columns: {fieldnames}")
-                return
+                writer.writerow(rid, row)
+                logging.info(f"Processed row with Instruction: {row.get('Instruction', 'N/A')}")
             
-            writer = csv.DictWriter(outfile, fieldnames=fieldnames + ['reasoning_of_metrics_and_correctness', 'language_quality', 'overall_correctness', 'instruction_following', 'constrains_adherence', 'logical_consistency', 'final_solution_correctness', 'overall_score'], delimiter=';')
-            writer.writeheader()
-            
-            with ThreadPoolExecutor(max_workers=100) as executor:
-                futures = {executor.submit(process_row_reasoning, row): row for row in reader}
-                
-                for future in as_completed(futures):
-                    row = futures[future]
-                    try:
-                        result = future.result()
-                        row.update(result)
-                    except Exception as e:
-                        logging.error(f"Error processing row: {e}")
-                        row.update({
-                            'reasoning_of_metrics_and_correctness': 'Error: Processing failed',
-                            'language_quality': 'Error: Processing failed',
-                            'overall_correctness': 'Error: Processing failed',
-                            'instruction_following': 'Error: Processing failed',
-                            'overall_score': 'Error: Processing failed'
-                        })
-                    
-                    writer.writerow(row)
-                    logging.info(f"Processed row with Instruction: {row.get('Instruction', 'N/A')}")
-                
     except FileNotFoundError as e:
         logging.error(f"File not found: {e}")
     except Exception as e:
         logging.error(f"An error occurred while processing the CSV: {e}")
 
+def process_csv_in_batch(input_csv_path, output_csv_path, client, batch_dir, task, shard=None):
+    """
+    Batch API variant of the judge: serializes every uncached row into a JSONL file keyed by
+    its row ID, submits it, waits for the batch and joins the parsed verdicts back onto the rows.
+    """
+    fieldnames, rows = read_csv_rows(input_csv_path)
+    if 'Instruction' not in fieldnames or 'System' not in fieldnames:
+        logging.error(f"Input CSV must contain 'Instruction' and 'System' columns. Found columns: {fieldnames}")
+        return
+    rows = list(select_shard(rows, shard))
+
+    score_keys = task.score_keys
+    missing_data = dict.fromkeys(['reasoning_of_metrics_and_correctness'] + score_keys, 'Error: Missing data')
+
+    params = dict(judge_backend.params, **judge_request_params(score_keys))
+    requests = []
+    cache_keys = {}
+    results = {}
+    row_ids = assign_row_ids(rows)
+    for rid, row in zip(row_ids, rows):
+        if not row.get('Instruction') or not row.get('model_generated_output'):
+            logging.warning(f"Missing 'Instruction' or 'System' in row: {row}")
+            row.update(missing_data)
+            continue
+        messages = build_judge_messages(task.judge_prompt, row.get('System') or '', row['Instruction'], row.get('Chosen') or '', row['model_generated_output'])
+        cache_keys[rid] = response_cache.make_key(judge_backend.cache_model, params, messages)
+        cached = response_cache.get(cache_keys[rid])
+        if cached is not None:
+            results[rid] = cached
+            continue
+        requests.append(build_batch_request(rid, judge_backend.model, messages, params))
+
+    batch_input_path = os.path.join(batch_dir, os.path.basename(output_csv_path).replace('.csv', '.jsonl'))
+    results.update(run_batch(client, requests, batch_input_path))
+    for rid, row in zip(row_ids, rows):
+        if rid not in results:
+            continue
+        try:
+            scores, missing = parse_verdict(results[rid], score_keys)
+            response_cache.put(cache_keys[rid], results[rid], judge_backend.cache_model)
+            # The few incomplete verdicts are repaired with short synchronous requests
+            row.update(repair_scores(scores, missing) if missing else scores)
+        except (TypeError, ValueError) as e:
+            logging.error(f"Error parsing judge response for row {rid}: {e}")
+            row.update(dict.fromkeys(['reasoning_of_metrics_and_correctness'] + score_keys))
+
+    write_csv_rows_atomic(output_csv_path, fieldnames + ['reasoning_of_metrics_and_correctness'] + score_keys, rows)
+
+def has_judge_error(row, score_columns):
+    return any((row.get(col) or '') in judge_error_markers for col in score_columns)
+
+def redrive_failed_judgements(output_csv_path, task):
+    """
+    Re-judges only the rows of an existing judged CSV whose scores are missing or error
+    markers and merges them back into the file in place.
+    """
+    def redo_rows(rows):
+        for row, future in imap_ordered_threaded(lambda row: process_row(row, task), rows, judge_max_workers):
+            row.update(future.result())
+        return rows
+
+    return redrive_errors(output_csv_path, lambda row: has_judge_error(row, task.score_keys), redo_rows)
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Judge the extracted model outputs with an LLM.")
+    parser.add_argument("--redrive-errors", action="store_true",
+                        help="Only re-judge rows of existing judged files whose scores failed and merge them back in place")
+    parser.add_argument("--batch", choices=["openai", "local"],
+                        help="Submit all judge requests through the OpenAI Batch API or the local stand-in batch server")
+    parser.add_argument("--batch-dir", default="batch", help="Directory for batch JSONL files")
+    parser.add_argument("--result-store", help="Also store the typed results per stage as Parquet under this directory")
+    parser.add_argument("--shard", type=parse_shard,
+                        help="Only judge shard i/N of every file (by a hash of the row ID) and write <output>.shard-i-of-N.csv; "
+                             "reassemble with shards.py merge")
+    add_cascade_arguments(parser)
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    if args.cascade_model and args.batch:
+        parser.error("--cascade-model cannot be combined with --batch")
+    set_backend(load_backend_configs(args.backends).get('judge'))
+    set_cascade(args.cascade_model, args.uncertainty_band, args.audit_rate)
+    batch_client = make_batch_client(args.batch, os.path.join(args.batch_dir, "spool"), judge_backend) if args.batch else None
+
     input_dir = 'evaluated/extracted'
     output_dir = 'evaluated/judged'
     
     os.makedirs(output_dir, exist_ok=True)
     
     for input_csv_path in glob.glob(os.path.join(input_dir, '*.csv')):
-        #Check if the file is the one to be skipped
-        if os.path.basename(input_csv_path) == 'extracted_evaluated_hard-reasoning-de_test.csv':
-            output_csv_filename = os.path.basename(input_csv_path).replace('evaluated_', 'judged_evaluated_')
-            output_csv_path = os.path.join(output_dir, output_csv_filename)
-            process_reasoning_csv_and_generate_output(input_csv_path, output_csv_path)
-            print(f"Processed {input_csv_path} and saved to {output_csv_path}")
+        output_csv_filename = os.path.basename(input_csv_path).replace('evaluated_', 'judged_evaluated_')
+        output_csv_path = shard_path(os.path.join(output_dir, output_csv_filename), args.shard)
+        # The task of the file decides the judge prompt and the metrics, e.g. the extended
+        # reasoning metrics of the hard-reasoning files
+        config_name = config_from_path(input_csv_path)
+        task = task_for(config_name)
+        # Label the request metrics of this file with its benchmark config
+        current_config.set(config_name)
+
+        if args.redrive_errors:
+            if os.path.exists(output_csv_path):
+                redrive_failed_judgements(output_csv_path, task)
             continue
 
-        if os.path.basename(input_csv_path) == 'extracted_evaluated_hard-reasoning-en_test.csv':
-            output_csv_filename = os.path.basename(input_csv_path).replace('evaluated_', 'judged_evaluated_')
-            output_csv_path = os.path.join(output_dir, output_csv_filename)
-            process_reasoning_csv_and_generate_output(input_csv_path, output_csv_path)
-            print(f"Processed {input_csv_path} and saved to {output_csv_path}")
-            continue
-        
-        output_csv_filename = os.path.basename(input_csv_path).replace('evaluated_', 'judged_evaluated_')
-        output_csv_path = os.path.join(output_dir, output_csv_filename)
-        
-        process_csv_and_generate_output(input_csv_path, output_csv_path)
+        if batch_client:
+            process_csv_in_batch(input_csv_path, output_csv_path, batch_client, args.batch_dir, task, shard=args.shard)
+        else:
+            process_csv_and_generate_output(input_csv_path, output_csv_path, task, shard=args.shard)
         
         print(f"Processed {input_csv_path} and saved to {output_csv_path}")
+
+        # Sharded results are stored by shards.py merge once all shards are complete
+        if args.result_store and args.shard is None:
+            ResultStore(args.result_store).import_csv(config_name, output_csv_path)
+
+    response_cache.report()
+    metrics.report()
+    metrics_name = 'judge' if args.shard is None else f"judge-shard-{args.shard[0]}-of-{args.shard[1]}"
+    metrics.export(metrics_name)
+    if judge_cascade:
+        judge_cascade.report()
+        judge_cascade.export(metrics_name)
@@ -1,94 +1,190 @@
-import csv
+import argparse
+import asyncio
 from datetime import datetime
-import openai
 import logging
 import os
 import glob
 
+from backends import Backend, add_backend_arguments, close_backends, load_backend_configs
+from batch_mode import build_batch_request, make_batch_client, run_batch
+from checkpoint import CheckpointedWriter, assign_row_ids, generation_error_markers, parse_shard, read_csv_rows, redrive_errors, select_shard, shard_path, write_csv_rows_atomic
+from generation_engine import AdaptiveRateLimiter, StreamTimer, call_with_retries, estimate_tokens, imap_ordered, latency_columns
+from instrumentation import config_from_path, current_config, error_status, metrics, quantiles
+from response_cache import open_default_cache
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Set up OpenAI client
-openai.api_key = os.getenv("OPENAI_API_KEY", "sk-[...]")  # Replace with environment variable or secure storage
-# openai.api_base = "http://localhost:1234/v1" # FOR LM STUDIO 
-
 model_name = "gpt-4o-mini"
 
-def generate_model_responses(system, instruction):
+# Defaults of the model under test; model and server presets (e.g. the stop tokens of Phi or
+# max_tokens -1 for LM Studio) are applied on top, see backends.py
+generation_params = {
+    "temperature": 0.01,
+    "top_p": 0.1,
+    "frequency_penalty": 1,
+    "presence_penalty": 1,
+    "stop": ["<|im_end|>"]
+}
+
+# Concurrency and provider quota; lower these for a local endpoint such as LM Studio
+max_concurrency = int(os.getenv("MAX_CONCURRENCY", "32"))
+requests_per_minute = int(os.getenv("RPM_LIMIT", "500"))
+tokens_per_minute = int(os.getenv("TPM_LIMIT", "200000"))
+
+response_cache = open_default_cache()
+
+# Server, key and connection pool of the model under test (OPENAI_API_BASE / OPENAI_API_KEY by default)
+backend = Backend(model_name, base_params=generation_params)
+
+
+def set_backend(config):
     """
-    Sends a system and user instruction to the OpenAI model and returns the response.
+    Sends the generation requests to the backend of `config` (see Backend.from_config);
+    keeps the default backend if `config` is empty.
+    """
+    global backend
+    if config:
+        backend = Backend.from_config(config, generation_params)
+
+
+def build_messages(system, instruction):
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": instruction}
+    ]
+
+async def agenerate_model_responses(system, instruction, limiter, target=None, timings=None):
+    """
+    Sends a system and user instruction to the model under test under the shared rate
+    limiter and returns the response; 429s (honouring Retry-After) and transient errors are retried.
 
     Parameters:
         system (str): The system message to set the context.
         instruction (str): The user instruction to process.
+        limiter (AdaptiveRateLimiter): Rate limiter shared by all requests of the endpoint.
+        target (Backend): Backend to query instead of the module's backend.
+        timings (dict): If given, the response is streamed and its latency_columns are stored
+            in this dict. Cached responses are not read in this mode since they have no latency.
 
     Returns:
         str: The model's response or an error message if the request fails.
     """
+    target = target or backend
+    messages = build_messages(system, instruction)
+    cache_model = target.cache_model
+    trace = metrics.trace('generation', target.model)
+    cache_key = response_cache.make_key(cache_model, target.params, messages)
+    cached = response_cache.get(cache_key) if timings is None else None
+    if cached is not None:
+        trace.finish(cached=True)
+        return cached
+
+    async def stream_request():
+        timer = StreamTimer()
+        response = await target.acreate(messages, stream=True)
+        parts = []
+        async for chunk in response:
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.get('content')
+            if content:
+                timer.token()
+                parts.append(content)
+        timings.update(timer.timings())
+        trace.record_usage({'prompt_tokens': estimate_tokens(messages), 'completion_tokens': timings['output_tokens']})
+        return ''.join(parts), estimate_tokens(messages) + timings['output_tokens']
+
+    async def request():
+        completion = await target.acreate(messages)
+        usage = completion.get('usage') or {}
+        trace.record_usage(usage)
+        return completion.choices[0].message['content'], usage.get('total_tokens')
+
     try:
-        completion = openai.ChatCompletion.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": instruction}
-            ],
-            
-            temperature = 0.01,
-            #max_tokens= -1, # FOR LM STUDIO 
-            #stream=false, # FOR LM STUDIO 
-            top_p=0.1,
-            frequency_penalty=1,
-            presence_penalty=1,
-            stop=["<|im_end|>"] # FOR PHI ["<|end|>"]
-        )
-        message = completion.choices[0].message['content']
+        message = await call_with_retries(request if timings is None else stream_request, limiter, estimate_tokens(messages), trace=trace)
+        response_cache.put(cache_key, message, cache_model)
+        trace.finish()
         return message
     except Exception as e:
+        trace.finish(error_status(e), type(e).__name__)
         logging.error(f"Error generating Response for instruction '{instruction}': {e}")
         return "Error generating response"
 
-def process_csv_and_generate_output(input_csv_path, output_csv_path):
+async def generate_rows(items, write, stream=False):
+    """
+    Generates the responses for all (row_id, row) items concurrently and passes the
+    finished rows to `write(row_id, row)` in input order. With `stream` the responses are
+    streamed and the latency_columns of every row are filled in as well.
+    """
+    limiter = AdaptiveRateLimiter(backend.requests_per_minute or requests_per_minute, backend.tokens_per_minute or tokens_per_minute)
+
+    async def process_row(item):
+        rid, row = item
+        instruction = row.get('Instruction')
+        system = row.get('System')
+
+        if not instruction or not system:
+            logging.warning(f"Missing 'Instruction' or 'System' in row: {row}")
+            row['model_generated_output'] = 'Error: Missing data'
+        else:
+            timings = {} if stream else None
+            message = await agenerate_model_responses(system, instruction, limiter, timings=timings)
+            row['model_generated_output'] = message if message else 'Error generating response'
+            if timings:
+                row.update(timings)
+        return rid, row
+
+    try:
+        async for rid, row in imap_ordered(process_row, items, backend.max_concurrency or max_concurrency):
+            write(rid, row)
+            logging.info(f"Processed row with Instruction ID: {row.get('ID', 'N/A')}")
+    finally:
+        await close_backends()
+
+def summarize_latency(rows):
+    """
+    Returns p50/p95/p99 of every latency column over the rows that have a measurement.
+    """
+    summary = {}
+    for column in latency_columns:
+        values = [float(row[column]) for row in rows if row.get(column) not in (None, '')]
+        summary[column] = quantiles(values)
+    return summary
+
+
+def process_csv_and_generate_output(input_csv_path, output_csv_path, stream=False, shard=None):
     """
-    Processes the input CSV by sending each row's instruction to the OpenAI model
-    and writing the results to the output CSV with an added 'rejected' column.
+    Processes the input CSV by sending the rows' instructions concurrently to the OpenAI model
+    and writing the results to the output CSV with an added 'model_generated_output' column.
+    Completed rows are checkpointed, so an interrupted run resumes where it stopped.
 
     Parameters:
         input_csv_path (str): Path to the input CSV file.
         output_csv_path (str): Path to the output CSV file.
+        stream (bool): Stream the responses and add the latency_columns.
+        shard (tuple): Only process the rows of shard (i, N), see checkpoint.select_shard.
     """
     try:
-        with open(input_csv_path, mode='r', newline='', encoding='utf-8') as infile, \
-             open(output_csv_path, mode='w', newline='', encoding='utf-8') as outfile:
-            
-            reader = csv.DictReader(infile, delimiter=';')  # Specify semicolon as the delimiter
-            # Standardize column names by stripping leading/trailing spaces
-            fieldnames = [name.strip() for name in reader.fieldnames]
-            
-            # Print the actual field names to inspect them
-            print("CSV Headers:", fieldnames)
-            
-            # Check if 'Instruction' and 'System' columns exist
-            if 'Instruction' not in fieldnames or 'System' not in fieldnames:
-                logging.error(f"Input CSV must contain 'Instruction' and 'System' columns. Found columns: {fieldnames}")
-                return
-            
-            writer = csv.DictWriter(outfile, fieldnames=fieldnames + ['model_generated_output'], delimiter=';')
-            writer.writeheader()
-            
-            for row in reader:
-                # Strip whitespace from column names for safe access
-                instruction = row.get('Instruction'.strip())
-                system = row.get('System'.strip())
-                
-                if not instruction or not system:
-                    logging.warning(f"Missing 'Instruction' or 'System' in row: {row}")
-                    row['model_generated_output'] = 'Error: Missing data'
-                else:
-                    message = generate_model_responses(system, instruction)
-                    row['model_generated_output'] = message if message else 'Error generating response'
-                
-                writer.writerow(row)
-                logging.info(f"Processed row with Instruction ID: {row.get('ID', 'N/A')}")
+        # Semicolon CSV with column names stripped of leading/trailing spaces
+        fieldnames, rows = read_csv_rows(input_csv_path)
+        
+        # Print the actual field names to inspect them
+        print("CSV Headers:", fieldnames)
+        
+        # Check if 'Instruction' and 'System' columns exist
+        if 'Instruction' not in fieldnames or 'System' not in fieldnames:
+            logging.error(f"Input CSV must contain 'Instruction' and 'System' columns. Found columns: {fieldnames}")
+            return
+        
+        output_fieldnames = fieldnames + ['model_generated_output'] + (latency_columns if stream else [])
+        with CheckpointedWriter(output_csv_path, output_fieldnames) as writer:
+            asyncio.run(generate_rows(writer.pending(select_shard(rows, shard)), writer.writerow, stream))
+
+        if stream:
+            _, written = read_csv_rows(output_csv_path)
+            for column, values in summarize_latency(written).items():
+                logging.info(f"{os.path.basename(output_csv_path)} {column}: p50 {values['0.5']}, p95 {values['0.95']}, p99 {values['0.99']}")
                 
     except FileNotFoundError as e:
         logging.error(f"File not found: {e}")
@@ -96,7 +192,90 @@ def process_csv_and_generate_output(input_csv_path, output_csv_path):
         logging.error(f"An error occurred while processing the CSV: {e}")
 
 
+def process_csv_in_batch(input_csv_path, output_csv_path, client, batch_dir, shard=None):
+    """
+    Batch API variant of process_csv_and_generate_output: serializes every uncached row into
+    a JSONL file keyed by its row ID, submits it, waits for the batch and joins the results
+    back onto the rows.
+
+    Parameters:
+        input_csv_path (str): Path to the input CSV file.
+        output_csv_path (str): Path to the output CSV file.
+        client (OpenAIBatchClient or LocalBatchClient): Batch endpoint to use.
+        batch_dir (str): Directory for the batch input and output JSONL files.
+        shard (tuple): Only process the rows of shard (i, N).
+    """
+    fieldnames, rows = read_csv_rows(input_csv_path)
+    if 'Instruction' not in fieldnames or 'System' not in fieldnames:
+        logging.error(f"Input CSV must contain 'Instruction' and 'System' columns. Found columns: {fieldnames}")
+        return
+    rows = list(select_shard(rows, shard))
+
+    requests = []
+    cache_keys = {}
+    row_ids = assign_row_ids(rows)
+    for rid, row in zip(row_ids, rows):
+        instruction = row.get('Instruction')
+        system = row.get('System')
+        if not instruction or not system:
+            logging.warning(f"Missing 'Instruction' or 'System' in row: {row}")
+            row['model_generated_output'] = 'Error: Missing data'
+            continue
+        messages = build_messages(system, instruction)
+        cache_keys[rid] = response_cache.make_key(backend.cache_model, backend.params, messages)
+        cached = response_cache.get(cache_keys[rid])
+        if cached is not None:
+            row['model_generated_output'] = cached
+            continue
+        requests.append(build_batch_request(rid, backend.model, messages, backend.params))
+
+    batch_input_path = os.path.join(batch_dir, os.path.basename(output_csv_path).replace('.csv', '.jsonl'))
+    results = run_batch(client, requests, batch_input_path)
+    for rid, row in zip(row_ids, rows):
+        if rid in results:
+            message = results[rid]
+            row['model_generated_output'] = message if message else 'Error generating response'
+            if message:
+                response_cache.put(cache_keys[rid], message, backend.cache_model)
+
+    write_csv_rows_atomic(output_csv_path, fieldnames + ['model_generated_output'], rows)
+
+
+def redrive_failed_generations(output_csv_path, stream=False):
+    """
+    Re-generates only the rows of an existing output CSV whose 'model_generated_output'
+    is an error marker and merges them back into the file in place. With `stream` the
+    latency_columns of the re-generated rows are measured again.
+    """
+    def redo_rows(rows):
+        redone = []
+        asyncio.run(generate_rows(list(enumerate(rows)), lambda rid, row: redone.append(row), stream))
+        return redone
+
+    return redrive_errors(
+        output_csv_path,
+        lambda row: (row.get('model_generated_output') or '') in generation_error_markers,
+        redo_rows
+    )
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate model responses for the prepared benchmark CSVs.")
+    parser.add_argument("--redrive-errors", action="store_true",
+                        help="Only re-issue rows of existing output files that failed and merge them back in place")
+    parser.add_argument("--batch", choices=["openai", "local"],
+                        help="Submit all rows through the OpenAI Batch API or the local stand-in batch server")
+    parser.add_argument("--batch-dir", default="batch", help="Directory for batch JSONL files")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream the responses and record time to first token, inter-token latency, total latency and tokens/s per row")
+    parser.add_argument("--shard", type=parse_shard,
+                        help="Only process shard i/N of every file (by a hash of the row ID) and write <output>.shard-i-of-N.csv; "
+                             "reassemble with shards.py merge")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    set_backend(load_backend_configs(args.backends).get('generation'))
+    batch_client = make_batch_client(args.batch, os.path.join(args.batch_dir, "spool"), backend) if args.batch else None
+
     # Define the input and output directories
     input_dir = 'prepared'
     output_dir = 'evaluated'
@@ -109,9 +288,23 @@ if __name__ == "__main__":
         # Define the output CSV path
         # Replace 'prepared_' with 'evaluated_' in the output file name
         output_csv_filename = os.path.basename(input_csv_path).replace('prepared_', 'evaluated_')
-        output_csv_path = os.path.join(output_dir, output_csv_filename)
+        output_csv_path = shard_path(os.path.join(output_dir, output_csv_filename), args.shard)
+        # Label the request metrics of this file with its benchmark config
+        current_config.set(config_from_path(input_csv_path))
         
+        if args.redrive_errors:
+            if os.path.exists(output_csv_path):
+                redrive_failed_generations(output_csv_path, stream=args.stream)
+            continue
+
         # Call the function to process the CSV and generate the output
-        process_csv_and_generate_output(input_csv_path, output_csv_path)
+        if batch_client:
+            process_csv_in_batch(input_csv_path, output_csv_path, batch_client, args.batch_dir, shard=args.shard)
+        else:
+            process_csv_and_generate_output(input_csv_path, output_csv_path, stream=args.stream, shard=args.shard)
         
         print(f"Processed {input_csv_path} and saved to {output_csv_path}")
+
+    response_cache.report()
+    metrics.report()
+    metrics.export('generation' if args.shard is None else f"generation-shard-{args.shard[0]}-of-{args.shard[1]}")
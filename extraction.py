@@ -0,0 +1,172 @@
+import functools
+import re
+
+import numpy as np
+import pandas as pd
+
+# Regular expressions for extracting integers
+qa_reference_pattern = r'\[(\d+)\]'
+qa_time_difference_pattern = r'(\d+)\s*(?:Tage|Tag|Stunden|Stunde)'
+extraction_recall_pattern = r'ID (\d+)'
+relevant_context_pattern = r'im (\d+)\. Kontext-Abschnitt'
+
+extraction_patterns = {
+    'reference': qa_reference_pattern,
+    'time_difference': qa_time_difference_pattern,
+    'extraction_id': extraction_recall_pattern,
+    'context': relevant_context_pattern,
+}
+
+qa_reference_regex = re.compile(qa_reference_pattern)
+
+# The patterns above as named alternatives, so every text is scanned only once. The ID and
+# context alternatives capture inside a lookahead and consume only their prefix, so 'ID 3 Tage'
+# still yields the time difference and every group matches exactly what its own pattern finds.
+combined_alternatives = {
+    'reference': r'\[(?P<reference>\d+)\]',
+    'time_difference': r'(?P<time_difference>\d+)\s*(?:Tage|Tag|Stunden|Stunde)',
+    'extraction_id': r'ID (?=(?P<extraction_id>\d+))',
+    'context': r'im (?=(?P<context>\d+)\. Kontext-Abschnitt)',
+}
+
+# Metric columns scored from each pattern
+extraction_metric_groups = {
+    'reference': ['reference_precision', 'reference_recall', 'reference_f1'],
+    'time_difference': ['time_difference_accuracy'],
+    'extraction_id': ['extraction_recall'],
+    'context': ['context_recall'],
+}
+
+extraction_metric_columns = [column for columns in extraction_metric_groups.values() for column in columns]
+
+
+def metric_columns(patterns):
+    """
+    Returns the extraction metric columns scored from `patterns` (names of extraction_patterns).
+    """
+    return [column for name in patterns for column in extraction_metric_groups[name]]
+
+
+@functools.lru_cache(maxsize=None)
+def pattern_regex(patterns):
+    """
+    Returns the combined regex of a tuple of pattern names, in the order of extraction_patterns.
+    """
+    return re.compile('|'.join(combined_alternatives[name] for name in extraction_patterns if name in patterns))
+
+
+
+def extract_references(texts, regex=qa_reference_regex):
+    """
+    Vectorized replacement of `texts.apply(lambda x: re.findall(qa_reference_pattern, x))`;
+    missing texts give an empty list.
+    """
+    return pd.Series(texts).fillna('').astype(str).str.findall(regex)
+
+
+def match_pairs(texts, patterns=tuple(extraction_patterns)):
+    """
+    Scans a Series of texts once for the extraction_patterns named in `patterns`. `str.findall`
+    with the combined pattern returns one tuple of groups per match; it measured several
+    times faster than `str.extractall`, which builds a MultiIndex row by row.
+
+    Returns:
+        pd.DataFrame: The distinct (row, pattern, value) matches, where row is the position in `texts`.
+    """
+    names = [name for name in extraction_patterns if name in patterns]
+    texts = pd.Series(texts).reset_index(drop=True).fillna('').astype(str)
+    matches = texts.str.findall(pattern_regex(tuple(names))).explode().dropna()
+    # With a single pattern findall gives the values themselves instead of tuples, still one column each
+    groups = pd.DataFrame(matches.tolist(), columns=names, index=matches.index)
+    pairs = groups.rename_axis('row').reset_index().melt(id_vars='row', var_name='pattern', value_name='value')
+    return pairs[pairs['value'] != ''].drop_duplicates()
+
+
+def overlap_counts(target_pairs, output_pairs, pattern, n):
+    """
+    Compares the matches of one pattern row by row as sets.
+
+    Returns:
+        (np.ndarray, np.ndarray, np.ndarray): Per row the number of distinct values in both,
+        in the target and in the output.
+    """
+    target = target_pairs[target_pairs['pattern'] == pattern]
+    output = output_pairs[output_pairs['pattern'] == pattern]
+    both = target.merge(output, on=['row', 'pattern', 'value'])
+
+    def counts(pairs):
+        return np.bincount(pairs['row'].to_numpy(dtype=np.int64), minlength=n)
+
+    return counts(both), counts(target), counts(output)
+
+
+def add_extraction_metrics(df, patterns=tuple(extraction_patterns), target_column='Chosen', output_column='model_generated_output'):
+    """
+    Adds the extraction metric columns of `patterns` (0-100, NaN where the target has nothing
+    to compare) by comparing the numbers the target answer and the model output mention:
+
+    - reference_precision/recall/f1: cited context references '[n]', as sets.
+    - time_difference_accuracy: share of the target's time differences ('n Tage/Stunden') the output names.
+    - extraction_recall: share of the target's 'ID n' the output names.
+    - context_recall: share of the target's 'im n. Kontext-Abschnitt' the output names.
+
+    Returns:
+        pd.DataFrame: `df` with the added columns.
+    """
+    if not patterns:
+        return df
+    n = len(df)
+    target = match_pairs(df[target_column], patterns)
+    output = match_pairs(df[output_column], patterns)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if 'reference' in patterns:
+            hits, target_count, output_count = overlap_counts(target, output, 'reference', n)
+            df['reference_precision'] = np.where(output_count > 0, 100 * hits / output_count, np.nan)
+            df['reference_recall'] = np.where(target_count > 0, 100 * hits / target_count, np.nan)
+            df['reference_f1'] = np.where(target_count + output_count > 0, 200 * hits / (target_count + output_count), np.nan)
+        for column, name in (('time_difference_accuracy', 'time_difference'), ('extraction_recall', 'extraction_id'),
+                             ('context_recall', 'context')):
+            if name in patterns:
+                hits, target_count, _ = overlap_counts(target, output, name, n)
+                df[column] = np.where(target_count > 0, 100 * hits / target_count, np.nan)
+    return df
+
+
+def match_sets(text, patterns=tuple(extraction_patterns)):
+    """
+    Single-text counterpart of match_pairs: the distinct values of every pattern in `patterns`.
+    """
+    values = {name: set() for name in extraction_patterns if name in patterns}
+    for match in pattern_regex(tuple(values)).finditer('' if text is None else str(text)):
+        for name, value in match.groupdict().items():
+            if value:
+                values[name].add(value)
+    return values
+
+
+def row_extraction_metrics(row, patterns=tuple(extraction_patterns)):
+    """
+    The extraction metrics of `patterns` for a single row dict, for the streaming pipeline;
+    None where add_extraction_metrics gives NaN. Uses sets instead of a one-row DataFrame,
+    which costs milliseconds per row on the event loop.
+    """
+    if not patterns:
+        return {}
+    target = match_sets(row.get('Chosen'), patterns)
+    output = match_sets(row.get('model_generated_output'), patterns)
+
+    def share(hits, count, scale=100):
+        return scale * hits / count if count > 0 else None
+
+    metrics = {}
+    if 'reference' in patterns:
+        hits = len(target['reference'] & output['reference'])
+        metrics['reference_precision'] = share(hits, len(output['reference']))
+        metrics['reference_recall'] = share(hits, len(target['reference']))
+        metrics['reference_f1'] = share(hits, len(target['reference']) + len(output['reference']), scale=200)
+    for column, name in (('time_difference_accuracy', 'time_difference'), ('extraction_recall', 'extraction_id'),
+                         ('context_recall', 'context')):
+        if name in patterns:
+            metrics[column] = share(len(target[name] & output[name]), len(target[name]))
+    return metrics
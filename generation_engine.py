@@ -0,0 +1,307 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import mark_queued
+
+# Columns written next to model_generated_output when responses are streamed
+latency_columns = ['ttft_seconds', 'inter_token_latency_seconds', 'total_latency_seconds', 'output_tokens', 'output_tokens_per_second']
+
+
+def estimate_tokens(messages):
+    """
+    Roughly estimates the prompt size of a chat request (about four characters per token).
+
+    Parameters:
+        messages (list): Chat messages as sent to the API.
+
+    Returns:
+        int: Estimated number of prompt tokens.
+    """
+    return sum(len(message.get("content") or "") for message in messages) // 4 + 8
+
+
+def is_rate_limit_error(error):
+    """
+    Returns True if the exception signals an HTTP 429 from the provider.
+    Works for openai.error.RateLimitError and any error carrying an http_status of 429.
+    """
+    return getattr(error, "http_status", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_transient_error(error):
+    """
+    Returns True for errors that are worth retrying (timeouts, connection resets, 5xx).
+    """
+    status = getattr(error, "http_status", None)
+    if status is not None:
+        return status >= 500
+    return type(error).__name__ in ("Timeout", "APIConnectionError", "ServiceUnavailableError",
+                                    "TimeoutError", "ConnectionError", "ClientConnectionError")
+
+
+def retry_after_seconds(error):
+    """
+    Reads the Retry-After (or retry-after-ms) header from a rate limit error.
+
+    Returns:
+        float or None: Seconds to wait, or None if the provider did not say.
+    """
+    headers = getattr(error, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        for key in ("Retry-After", "retry-after"):
+            if key in headers:
+                return float(headers[key])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+class AdaptiveRateLimiter:
+    """
+    Sliding-window limiter for requests-per-minute and tokens-per-minute.
+
+    On a 429 all callers are paused until Retry-After has passed and the request budget is cut
+    by a quarter; after a run of successes it grows back towards the configured maximum, so a
+    run settles just below the provider quota instead of repeatedly tripping it.
+    """
+
+    def __init__(self, requests_per_minute=500, tokens_per_minute=200000, window=60.0):
+        self.max_requests_per_minute = requests_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self._events = deque()  # [timestamp, tokens] for every request inside the window
+        self._tokens_in_window = 0
+        self._blocked_until = 0.0
+        self._successes = 0
+        self._lock = asyncio.Lock()
+
+    def _prune(self, now):
+        while self._events and now - self._events[0][0] >= self.window:
+            _, tokens = self._events.popleft()
+            self._tokens_in_window -= tokens
+
+    async def acquire(self, tokens):
+        """
+        Waits until a request of the given token size fits into the current window.
+
+        Returns:
+            list: The window entry, to be passed to record_usage once the real usage is known.
+        """
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                self._prune(now)
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    over_requests = len(self._events) >= self.requests_per_minute
+                    over_tokens = bool(self._events) and self._tokens_in_window + tokens > self.tokens_per_minute
+                    if not over_requests and not over_tokens:
+                        entry = [now, tokens]
+                        self._events.append(entry)
+                        self._tokens_in_window += tokens
+                        return entry
+                    wait = self.window - (now - self._events[0][0])
+            await asyncio.sleep(max(wait, 0.01))
+
+    def record_usage(self, entry, tokens):
+        """
+        Replaces the estimated token count of a request with the usage reported by the API.
+        """
+        if tokens is None:
+            return
+        if self._events and self._events[0][0] <= entry[0]:
+            self._tokens_in_window += tokens - entry[1]
+        entry[1] = tokens
+
+    def record_success(self):
+        self._successes += 1
+        if self._successes >= 50 and self.requests_per_minute < self.max_requests_per_minute:
+            self.requests_per_minute = min(self.max_requests_per_minute,
+                                           self.requests_per_minute + max(1, self.max_requests_per_minute // 20))
+            self._successes = 0
+
+    def throttle(self, delay):
+        """
+        Pauses all callers for `delay` seconds and lowers the request budget after a 429.
+        """
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        self.requests_per_minute = max(1, int(self.requests_per_minute * 0.75))
+        self._successes = 0
+        logging.warning(f"Rate limited, pausing for {delay:.1f}s (budget now {self.requests_per_minute} requests/min)")
+
+
+class StreamTimer:
+    """
+    Latency measurements of one streamed completion. Create it right before the request is
+    sent and call token() for every chunk that carries content; each chunk counts as one
+    output token, which is what OpenAI-compatible servers send.
+    """
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.token_times = []
+
+    def token(self):
+        self.token_times.append(time.monotonic())
+
+    def timings(self):
+        """
+        Returns the values of latency_columns: time to first token, mean time between tokens,
+        total latency, number of output tokens and output tokens per second of total latency.
+        """
+        total = time.monotonic() - self.start
+        count = len(self.token_times)
+        return {
+            'ttft_seconds': round(self.token_times[0] - self.start, 4) if count else None,
+            'inter_token_latency_seconds': round((self.token_times[-1] - self.token_times[0]) / (count - 1), 4) if count > 1 else None,
+            'total_latency_seconds': round(total, 4),
+            'output_tokens': count,
+            'output_tokens_per_second': round(count / total, 2) if total > 0 else None,
+        }
+
+
+async def call_with_retries(request, limiter, estimated_tokens, max_retries=6, trace=None):
+    """
+    Runs one API request under the rate limiter, retrying 429s and transient failures.
+
+    Parameters:
+        request (callable): Coroutine function returning (result, total_tokens_used).
+        limiter (AdaptiveRateLimiter): Shared limiter of the run.
+        estimated_tokens (int): Token estimate used to reserve quota before the call.
+        max_retries (int): Number of retries before the last error is raised.
+        trace (RequestTrace): Optional trace that records the queue wait and the retries.
+
+    Returns:
+        The result returned by `request`.
+    """
+    for attempt in range(max_retries + 1):
+        entry = await limiter.acquire(estimated_tokens)
+        if trace is not None:
+            trace.attempt()
+        try:
+            result, tokens_used = await request()
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            if is_rate_limit_error(e):
+                limiter.throttle(retry_after_seconds(e) or min(2 ** attempt, 60))
+                continue
+            if is_transient_error(e):
+                await asyncio.sleep(min(2 ** attempt, 30) + random.random())
+                continue
+            raise
+        limiter.record_usage(entry, tokens_used)
+        limiter.record_success()
+        return result
+
+
+class PrioritySemaphore:
+    """
+    asyncio semaphore that hands a freed slot to the waiter with the highest priority, in
+    arrival order among equal priorities. The schedulers pass the expected cost of a row, so
+    the longest rows start first and the end of a run is not held up by a long row that
+    started last.
+    """
+
+    def __init__(self, value):
+        self._value = value
+        self._waiters = []  # heap of (-priority, arrival, future)
+        self._arrivals = itertools.count()
+
+    async def acquire(self, priority=0):
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, next(self._arrivals), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                # The slot was handed over just before the cancellation; pass it on
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            # Cancelled waiters are skipped here instead of being removed from the heap
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority=0):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+async def imap_ordered(worker, items, concurrency, window=None):
+    """
+    Applies the coroutine function `worker` to every item with at most `concurrency` calls in
+    flight and yields the results in input order as soon as they are available. Like
+    imap_ordered_threaded, items are pulled from the (possibly lazy) iterable only while
+    fewer than `window` tasks exist, so memory stays bounded no matter how many items there are.
+    """
+    window = window or 2 * concurrency
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item):
+        mark_queued()
+        async with semaphore:
+            return await worker(item)
+
+    in_flight = deque()
+    try:
+        for item in items:
+            in_flight.append(asyncio.ensure_future(run(item)))
+            if len(in_flight) >= window:
+                yield await in_flight.popleft()
+        while in_flight:
+            yield await in_flight.popleft()
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
+def imap_ordered_threaded(worker, items, max_workers, window=None):
+    """
+    Thread pool counterpart of imap_ordered for blocking workers. Items are pulled from the
+    (possibly lazy) iterable only while fewer than `window` are in flight, and the
+    (item, future) pairs are yielded in input order, so memory stays bounded by the window
+    no matter how many items there are and the output order is deterministic.
+    Workers run in a copy of the caller's context, so context variables such as the current
+    config reach the threads.
+    """
+    window = window or 2 * max_workers
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for item in items:
+            context = contextvars.copy_context()
+            context.run(mark_queued)
+            in_flight.append((item, executor.submit(context.run, worker, item)))
+            if len(in_flight) >= window:
+                yield in_flight.popleft()
+        while in_flight:
+            yield in_flight.popleft()
@@ -0,0 +1,339 @@
+import argparse
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+default_metrics_dir = os.getenv("METRICS_DIR", "metrics")
+
+# USD per million (prompt, completion[, cached prompt]) tokens; override or extend with the
+# MODEL_PRICES environment variable, e.g. MODEL_PRICES='{"my-model": [0.2, 0.6]}'. Cached
+# prompt tokens cost the prompt price unless a third price is given.
+model_prices = {
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+model_prices.update({model: tuple(price) for model, price in json.loads(os.getenv("MODEL_PRICES", "{}")).items()})
+
+# Benchmark config the current row belongs to; set by the scripts, inherited by asyncio tasks
+current_config = contextvars.ContextVar("current_config", default=None)
+# When the current row was handed to its stage, used to measure the queue wait of its requests
+queued_at = contextvars.ContextVar("queued_at", default=None)
+
+latency_quantiles = (0.5, 0.95, 0.99)
+
+
+def config_from_path(path):
+    """
+    Returns the benchmark config of a pipeline file name, e.g.
+    'evaluated/extracted/extracted_evaluated_hard-reasoning-de_test.csv' -> 'hard-reasoning-de'.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    name = re.sub(r'^((prepared|evaluated|extracted|judged)_)+', '', name)
+    return re.sub(r'_test(_weighted)?$', '', name)
+
+
+def mark_queued():
+    """
+    Marks the current row as queued for the next stage; its next request reports the time
+    from here until it was sent as queue wait.
+    """
+    queued_at.set(time.monotonic())
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    """
+    Returns the estimated cost of a request in USD, or None if the model has no known price.
+    `cached_tokens` of the prompt tokens were served from the provider's prompt cache.
+    """
+    price = model_prices.get(model)
+    if price is None:
+        return None
+    cached_tokens = cached_tokens or 0
+    cached_price = price[2] if len(price) > 2 else price[0]
+    return (((prompt_tokens or 0) - cached_tokens) * price[0] + cached_tokens * cached_price
+            + (completion_tokens or 0) * price[1]) / 1e6
+
+
+class RequestTrace:
+    """
+    Timing and usage of one logical API request, including all of its retries.
+    Create it with Metrics.trace and close it with finish.
+    """
+
+    def __init__(self, metrics, stage, model):
+        self.metrics = metrics
+        self.stage = stage
+        self.model = model
+        self.config = current_config.get()
+        self.created = time.monotonic()
+        self.queued = queued_at.get() or self.created
+        self.sent = None
+        self.retries = 0
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.cached_tokens = None
+
+    def attempt(self):
+        """
+        Called right before every attempt is sent.
+        """
+        if self.sent is None:
+            self.sent = time.monotonic()
+        else:
+            self.retries += 1
+
+    def record_usage(self, usage):
+        usage = usage or {}
+        self.prompt_tokens = usage.get("prompt_tokens")
+        self.completion_tokens = usage.get("completion_tokens")
+        # Prompt tokens the provider served from its prefix cache
+        self.cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+
+    def finish(self, status=200, error=None, cached=False, deduplicated=False):
+        """
+        Records the request. `status` is the final HTTP status (None if unknown) and
+        `error` the name of the error the request finally failed with, if any. `cached`
+        requests were answered by the response cache, `deduplicated` ones by an identical
+        request in flight at the same time; neither is sent.
+        """
+        now = time.monotonic()
+        sent = self.sent or now
+        self.metrics.record({
+            "stage": self.stage,
+            "config": self.config,
+            "model": self.model,
+            "started_at": self.created,
+            "queue_wait": sent - self.queued,
+            "wall_time": now - sent,
+            "retries": self.retries,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "status": status,
+            "error": error,
+            "cached": cached,
+            "deduplicated": deduplicated,
+            "cost_usd": 0.0 if cached or deduplicated else estimate_cost(self.model, self.prompt_tokens, self.completion_tokens, self.cached_tokens),
+        })
+
+
+def error_status(error):
+    return getattr(error, "http_status", None)
+
+
+class Metrics:
+    """
+    Collects one event per API request of a run (from the generation event loop and the judge
+    threads alike) and aggregates them per stage, config and model: p50/p95/p99 latency and
+    queue wait, retries, errors, token counts (with the share served from the provider's
+    prompt cache), throughput and estimated cost. Cache hits and deduplicated requests are
+    counted but kept out of the latency percentiles.
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+        self._clock_offset = time.time() - time.monotonic()
+
+    def trace(self, stage, model):
+        return RequestTrace(self, stage, model)
+
+    def record(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self):
+        """
+        Returns one aggregate dict per (stage, config, model), sorted by those keys.
+        """
+        with self._lock:
+            events = list(self.events)
+        groups = {}
+        for event in events:
+            groups.setdefault((event["stage"], event["config"] or "", event["model"]), []).append(event)
+
+        summaries = []
+        for (stage, config, model), group in sorted(groups.items()):
+            sent = [event for event in group if not event["cached"] and not event.get("deduplicated")]
+            wall_times = np.array([event["wall_time"] for event in sent], dtype=float)
+            queue_waits = np.array([event["queue_wait"] for event in sent], dtype=float)
+            prompt_tokens = sum(event["prompt_tokens"] or 0 for event in sent)
+            completion_tokens = sum(event["completion_tokens"] or 0 for event in sent)
+            cached_tokens = sum(event.get("cached_tokens") or 0 for event in sent)
+            costs = [event["cost_usd"] for event in sent if event["cost_usd"] is not None]
+            span = (max(event["started_at"] + event["queue_wait"] + event["wall_time"] for event in group)
+                    - min(event["started_at"] for event in group))
+            statuses = {}
+            for event in group:
+                key = "cached" if event["cached"] else "deduplicated" if event.get("deduplicated") else str(event["status"])
+                statuses[key] = statuses.get(key, 0) + 1
+            summaries.append({
+                "stage": stage,
+                "config": config,
+                "model": model,
+                "requests": len(group),
+                "cached": sum(1 for event in group if event["cached"]),
+                "deduplicated": sum(1 for event in group if event.get("deduplicated")),
+                "errors": sum(1 for event in group if event["error"]),
+                "retries": sum(event["retries"] for event in group),
+                "statuses": statuses,
+                "sent": len(sent),
+                "latency_seconds": quantiles(wall_times),
+                "latency_mean_seconds": float(wall_times.mean()) if len(wall_times) else None,
+                "latency_sum_seconds": float(wall_times.sum()),
+                "queue_wait_seconds": quantiles(queue_waits),
+                "queue_wait_sum_seconds": float(queue_waits.sum()),
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "cached_prompt_tokens": cached_tokens,
+                "cached_prompt_token_ratio": cached_tokens / prompt_tokens if prompt_tokens else None,
+                "elapsed_seconds": span,
+                "requests_per_second": len(group) / span if span > 0 else None,
+                "completion_tokens_per_second": completion_tokens / span if span > 0 else None,
+                "cost_usd": sum(costs) if costs else None,
+            })
+        return summaries
+
+    def write_events(self, path):
+        """
+        Writes the raw per-request events as JSON lines with wall-clock timestamps.
+        """
+        with self._lock:
+            events = list(self.events)
+        with open(path + ".tmp", mode='w', encoding='utf-8') as f:
+            for event in events:
+                event = dict(event, started_at=event["started_at"] + self._clock_offset)
+                f.write(json.dumps(event) + "\n")
+        os.replace(path + ".tmp", path)
+
+    def write_json(self, path):
+        with open(path + ".tmp", mode='w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def write_prometheus(self, path):
+        """
+        Writes the aggregates in the Prometheus text exposition format, for the node
+        exporter textfile collector. The file is replaced atomically.
+        """
+        lines = []
+
+        def sample(name, labels, value):
+            if value is None:
+                return
+            label_text = ",".join(f'{key}="{escape_label(val)}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value:.6g}")
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                sample(name, labels, value)
+
+        def summary_metric(name, help_text, key):
+            # A summary has its quantiles plus the _sum and _count of the observations
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} summary")
+            for labels, s in pairs:
+                for q, value in s[f"{key}_seconds"].items():
+                    sample(name, dict(labels, quantile=q), value)
+                sample(f"{name}_sum", labels, s[f"{key}_sum_seconds"])
+                sample(f"{name}_count", labels, s["sent"])
+
+        summaries = self.summary()
+        keys = [{"stage": s["stage"], "config": s["config"], "model": s["model"]} for s in summaries]
+        pairs = list(zip(keys, summaries))
+        summary_metric("grag_request_latency_seconds", "Request latency without queue wait, including retries.", "latency")
+        summary_metric("grag_request_queue_wait_seconds", "Time a row waited for concurrency slots and the rate limiter.", "queue_wait")
+        metric("grag_requests_total", "counter", "Requests by final HTTP status ('cached' for cache hits, 'deduplicated').",
+               [(dict(labels, status=status), count) for labels, s in pairs for status, count in s["statuses"].items()])
+        metric("grag_request_errors_total", "counter", "Requests that finally failed.",
+               [(labels, s["errors"]) for labels, s in pairs])
+        metric("grag_request_retries_total", "counter", "Retried attempts.",
+               [(labels, s["retries"]) for labels, s in pairs])
+        metric("grag_tokens_total", "counter", "Tokens reported by the API (cached_prompt: part of prompt served from the prefix cache).",
+               [(dict(labels, kind=kind), s[f"{kind}_tokens"]) for labels, s in pairs for kind in ("prompt", "completion", "cached_prompt")])
+        metric("grag_cached_prompt_token_ratio", "gauge", "Share of the prompt tokens served from the provider's prefix cache.",
+               [(labels, s["cached_prompt_token_ratio"]) for labels, s in pairs])
+        metric("grag_requests_deduplicated_total", "counter", "Requests answered by an identical request in flight.",
+               [(labels, s["deduplicated"]) for labels, s in pairs])
+        metric("grag_requests_per_second", "gauge", "Average request throughput of the run.",
+               [(labels, s["requests_per_second"]) for labels, s in pairs])
+        metric("grag_completion_tokens_per_second", "gauge", "Average completion token throughput of the run.",
+               [(labels, s["completion_tokens_per_second"]) for labels, s in pairs])
+        metric("grag_cost_usd_total", "counter", "Estimated cost from the model_prices table.",
+               [(labels, s["cost_usd"]) for labels, s in pairs])
+
+        with open(path + ".tmp", mode='w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
+
+    def export(self, name, directory=default_metrics_dir):
+        """
+        Writes <name>_requests.jsonl, <name>.json and <name>.prom into `directory`.
+        Does nothing if no request was recorded.
+        """
+        if not self.events:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self.write_events(os.path.join(directory, f"{name}_requests.jsonl"))
+        self.write_json(os.path.join(directory, f"{name}.json"))
+        self.write_prometheus(os.path.join(directory, f"{name}.prom"))
+        logging.info(f"Wrote request metrics of {len(self.events)} requests to {directory}")
+
+    def report(self):
+        for s in self.summary():
+            latency = s["latency_seconds"]
+            cost = f"${s['cost_usd']:.4f}" if s["cost_usd"] is not None else "unknown cost"
+            cached_ratio = f"{s['cached_prompt_token_ratio']:.0%}" if s["cached_prompt_token_ratio"] is not None else "-"
+            logging.info(f"{s['stage']} {s['config'] or '-'} ({s['model']}): {s['requests']} requests "
+                         f"({s['cached']} cached, {s['deduplicated']} deduplicated, {s['errors']} errors, {s['retries']} retries), "
+                         f"p50/p95/p99 {fmt(latency['0.5'])}/{fmt(latency['0.95'])}/{fmt(latency['0.99'])}s, "
+                         f"{fmt(s['requests_per_second'])} req/s, {fmt(s['completion_tokens_per_second'])} tok/s, "
+                         f"{cached_ratio} prompt tokens cached, {cost}")
+
+
+def quantiles(values):
+    if not len(values):
+        return {str(q): None for q in latency_quantiles}
+    return {str(q): float(v) for q, v in zip(latency_quantiles, np.quantile(values, latency_quantiles))}
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def fmt(value):
+    return "-" if value is None else f"{value:.2f}"
+
+
+# Shared collector of the process
+metrics = Metrics()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Re-aggregate recorded request events into JSON and Prometheus files.")
+    parser.add_argument("events", nargs="+", help="One or more <name>_requests.jsonl files")
+    parser.add_argument("--name", default="combined")
+    parser.add_argument("--metrics-dir", default=default_metrics_dir)
+    args = parser.parse_args()
+
+    combined = Metrics()
+    combined._clock_offset = 0.0
+    for path in args.events:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    combined.record(json.loads(line))
+    combined.report()
+    combined.export(args.name, args.metrics_dir)
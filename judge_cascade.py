@@ -0,0 +1,192 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from instrumentation import current_config, default_metrics_dir
+
+# Written next to the scores when the cascade is on
+cascade_columns = ['judge_model', 'judge_escalation', 'cheap_judge_overall_score']
+
+escalation_reasons = ['cheap_failed', 'uncertain', 'rule_disagreement', 'audit']
+
+
+def parse_band(value):
+    """
+    Parses an uncertainty band 'low,high' (overall_score bounds, inclusive).
+    """
+    try:
+        low, high = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ValueError(f"Uncertainty band must look like 'low,high', got {value!r}")
+    if low > high:
+        raise ValueError(f"Uncertainty band {value!r} is empty")
+    return low, high
+
+
+def reference_rule(task, response, model_generated_output):
+    """
+    Deterministic verdict from the context references the task cites: True if the output
+    cites exactly the references of the target answer, False if it cites none of them, None
+    if the task has no references, the target cites none or the match is partial.
+    """
+    if not task.references:
+        return None
+    target = set(task.reference_regex.findall(response or ''))
+    if not target:
+        return None
+    output = set(task.reference_regex.findall(model_generated_output or ''))
+    if output == target:
+        return True
+    if not target & output:
+        return False
+    return None
+
+
+def audit_draw(messages):
+    """
+    Deterministic number in [0, 1) per judge request, so reruns audit the same rows.
+    """
+    digest = hashlib.sha1(json.dumps(messages, sort_keys=True).encode('utf-8')).hexdigest()
+    return int(digest[:8], 16) / 0x100000000
+
+
+class JudgeCascade:
+    """
+    Judges every row with a cheap model first and escalates to the expensive judge only
+    when the cheap verdict cannot be trusted: it failed, its overall_score lies inside the
+    uncertainty band, or, for tasks with references, it contradicts the References rule
+    (exactly the right references cited but judged as failing, or none of them but judged
+    as passing). A deterministic
+    `audit_rate` share of the accepted rows is escalated as well, so the agreement of the
+    two judges is also measured where no escalation was needed.
+
+    `judge(messages, score_keys, model)` returns the parsed scores of one model and raises
+    if the request fails.
+    """
+
+    def __init__(self, judge, cheap_model, expensive_model, band=(50, 85), pass_threshold=70, audit_rate=0.0, tolerance=10):
+        self.judge = judge
+        self.cheap_model = cheap_model
+        self.expensive_model = expensive_model
+        self.band = band
+        self.pass_threshold = pass_threshold
+        self.audit_rate = audit_rate
+        self.tolerance = tolerance
+        self._lock = threading.Lock()
+        self.outcomes = []  # (config, escalation reason or None, cheap overall_score, expensive overall_score)
+
+    def escalation_reason(self, messages, cheap_scores, task, response, model_generated_output):
+        score = cheap_scores.get('overall_score')
+        if score is None:
+            return 'cheap_failed'
+        if self.band[0] <= score <= self.band[1]:
+            return 'uncertain'
+        rule = reference_rule(task, response, model_generated_output)
+        if rule is not None and rule != (score >= self.pass_threshold):
+            return 'rule_disagreement'
+        if self.audit_rate and audit_draw(messages) < self.audit_rate:
+            return 'audit'
+        return None
+
+    def score(self, messages, task, response, model_generated_output):
+        """
+        Returns the scores of the row of `task` plus the cascade_columns. Errors of the
+        expensive judge are raised like those of a single judge.
+        """
+        try:
+            cheap_scores = self.judge(messages, task.score_keys, self.cheap_model)
+        except Exception as e:
+            logging.error(f"Cheap judge {self.cheap_model} failed, escalating: {e}")
+            cheap_scores = {}
+        reason = self.escalation_reason(messages, cheap_scores, task, response, model_generated_output)
+        cheap_score = cheap_scores.get('overall_score')
+        if reason is None:
+            self.record(None, cheap_score, None)
+            return dict(cheap_scores, judge_model=self.cheap_model, judge_escalation='', cheap_judge_overall_score=cheap_score)
+
+        scores = self.judge(messages, task.score_keys, self.expensive_model)
+        self.record(reason, cheap_score, scores.get('overall_score'))
+        return dict(scores, judge_model=self.expensive_model, judge_escalation=reason, cheap_judge_overall_score=cheap_score)
+
+    def record(self, reason, cheap_score, expensive_score):
+        with self._lock:
+            self.outcomes.append((current_config.get() or '', reason, cheap_score, expensive_score))
+
+    def summarize(self, outcomes):
+        escalated = [o for o in outcomes if o[1] is not None]
+        compared = [(cheap, expensive, reason) for _, reason, cheap, expensive in escalated
+                    if cheap is not None and expensive is not None]
+
+        def agreement(pairs):
+            if not pairs:
+                return {'rows': 0, 'pass_agreement': None, 'within_tolerance': None, 'mean_absolute_difference': None}
+            return {
+                'rows': len(pairs),
+                'pass_agreement': sum((c >= self.pass_threshold) == (e >= self.pass_threshold) for c, e, _ in pairs) / len(pairs),
+                'within_tolerance': sum(abs(c - e) <= self.tolerance for c, e, _ in pairs) / len(pairs),
+                'mean_absolute_difference': sum(abs(c - e) for c, e, _ in pairs) / len(pairs),
+            }
+
+        return {
+            'rows': len(outcomes),
+            'accepted': len(outcomes) - len(escalated),
+            'escalated': len(escalated),
+            'escalation_rate': len(escalated) / len(outcomes) if outcomes else None,
+            'escalations': {reason: sum(1 for o in escalated if o[1] == reason) for reason in escalation_reasons},
+            # All rows judged by both models; the audited rows estimate the agreement on the accepted ones
+            'agreement': agreement(compared),
+            'audit_agreement': agreement([pair for pair in compared if pair[2] == 'audit']),
+        }
+
+    def summary(self):
+        """
+        Returns the escalation counts and judge agreement over all rows and per config.
+        """
+        with self._lock:
+            outcomes = list(self.outcomes)
+        configs = sorted({o[0] for o in outcomes})
+        return {
+            'cheap_model': self.cheap_model,
+            'expensive_model': self.expensive_model,
+            'uncertainty_band': list(self.band),
+            'pass_threshold': self.pass_threshold,
+            'audit_rate': self.audit_rate,
+            'tolerance': self.tolerance,
+            'total': self.summarize(outcomes),
+            'configs': {config: self.summarize([o for o in outcomes if o[0] == config]) for config in configs},
+        }
+
+    def report(self):
+        summary = self.summary()
+        for config, s in [('all configs', summary['total'])] + list(summary['configs'].items()):
+            if not s['rows']:
+                continue
+            agreement = s['agreement']
+            agreement_text = (f"pass agreement {agreement['pass_agreement']:.0%}, mean |diff| {agreement['mean_absolute_difference']:.1f} "
+                              f"on {agreement['rows']} rows judged by both" if agreement['rows'] else "no rows judged by both")
+            reasons = ", ".join(f"{reason} {count}" for reason, count in s['escalations'].items() if count)
+            logging.info(f"Judge cascade {config}: {s['escalated']}/{s['rows']} escalated ({s['escalation_rate']:.0%}"
+                         f"{': ' + reasons if reasons else ''}), {agreement_text}")
+
+    def export(self, name, directory=default_metrics_dir):
+        """
+        Writes the summary to <name>_cascade.json in `directory`.
+        """
+        if not self.outcomes:
+            return
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}_cascade.json")
+        with open(path + ".tmp", mode='w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+        os.replace(path + ".tmp", path)
+
+
+def add_cascade_arguments(parser):
+    parser.add_argument("--cascade-model", default=os.getenv("JUDGE_CASCADE_MODEL"),
+                        help="Cheap judge model that scores every row first; only uncertain rows go to the main judge")
+    parser.add_argument("--uncertainty-band", type=parse_band, default=parse_band(os.getenv("JUDGE_UNCERTAINTY_BAND", "50,85")),
+                        help="overall_score range 'low,high' of the cheap judge that is escalated (default 50,85)")
+    parser.add_argument("--audit-rate", type=float, default=float(os.getenv("JUDGE_AUDIT_RATE", "0")),
+                        help="Share of confidently judged rows escalated anyway to measure judge agreement")
@@ -0,0 +1,120 @@
+import json
+import re
+
+reasoning_key = 'reasoning_of_metrics_and_correctness'
+
+# A score given as text: '85', '85.5', '85/100', '85 %'
+numeric_string_pattern = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(?:/\s*100|%)?\s*$')
+
+repair_system_prompt = "You are given the reasoning of an evaluation of a generated response. You should respond in JSON format with the following keys: {keys}. The values should be a number between 0 and 100 that follows from the reasoning."
+
+
+def verdict_schema(score_keys, reasoning=True):
+    """
+    Returns the strict structured-outputs response_format of a judge verdict; the reasoning
+    comes first so the model reasons before it scores.
+    """
+    properties = {reasoning_key: {"type": "string"}} if reasoning else {}
+    properties.update({key: {"type": "integer"} for key in score_keys})
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "judge_verdict",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+def coerce_score(value):
+    """
+    Returns a score as a number, converting numeric strings; None if it is not a number
+    between 0 and 100.
+    """
+    if isinstance(value, str):
+        match = numeric_string_pattern.match(value)
+        if not match:
+            return None
+        value = float(match.group(1))
+        value = int(value) if value.is_integer() else value
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return value if 0 <= value <= 100 else None
+
+
+def salvage_fields(text, score_keys):
+    """
+    Picks the reasoning and the scores out of a verdict that is not valid JSON, e.g. cut off
+    by the token limit or wrapped in prose.
+    """
+    fields = {}
+    match = re.search(r'"' + reasoning_key + r'"\s*:\s*"((?:[^"\\]|\\.)*)"', text)
+    if match:
+        fields[reasoning_key] = json.loads(f'"{match.group(1)}"')
+    for key in score_keys:
+        # The number must be complete, i.e. followed by a delimiter and not by the end of the text
+        match = re.search(r'"' + key + r'"\s*:\s*"?(\d+(?:\.\d+)?)"?\s*[,}\n]', text)
+        if match:
+            fields[key] = match.group(1)
+    return fields
+
+
+def parse_verdict(text, score_keys):
+    """
+    Validates a judge response against the verdict schema. Valid JSON is used as is, JSON
+    inside prose or code fences is cut out, and anything else is salvaged field by field.
+
+    Returns:
+        (dict, list): The reasoning and the scores (None where unusable), and the score keys
+        that are missing or invalid.
+
+    Raises:
+        ValueError: If neither the reasoning nor any score could be read.
+    """
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        start, end = (text or '').find('{'), (text or '').rfind('}')
+        try:
+            data = json.loads(text[start:end + 1]) if 0 <= start < end else None
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            data = salvage_fields(text or '', score_keys)
+    if not isinstance(data, dict):
+        raise ValueError(f"Judge response is not a JSON object: {str(text)[:200]!r}")
+
+    reasoning = data.get(reasoning_key)
+    scores = {reasoning_key: reasoning if isinstance(reasoning, str) and reasoning.strip() else None}
+    scores.update({key: coerce_score(data.get(key)) for key in score_keys})
+    missing = [key for key in score_keys if scores[key] is None]
+    if scores[reasoning_key] is None and len(missing) == len(score_keys):
+        raise ValueError(f"Judge response has no usable field: {str(text)[:200]!r}")
+    return scores, missing
+
+
+def parse_scores(text, score_keys):
+    """
+    Parses the answer of a repair request.
+
+    Returns:
+        dict: The scores that could be read.
+    """
+    scores, missing = parse_verdict(text, score_keys)
+    return {key: scores[key] for key in score_keys if key not in missing}
+
+
+def repair_messages(reasoning, missing):
+    """
+    Short follow-up request for the `missing` scores of a verdict: only its reasoning is
+    sent, not the judged row.
+    """
+    return [
+        {"role": "system", "content": repair_system_prompt.format(keys=", ".join(f"'{key}'" for key in missing))},
+        {"role": "user", "content": reasoning},
+    ]
@@ -0,0 +1,280 @@
+import argparse
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+judge_keys = ['language_quality', 'overall_correctness', 'instruction_following', 'constrains_adherence',
+              'logical_consistency', 'final_solution_correctness', 'overall_score']
+
+
+class MockSettings:
+    """
+    Behaviour of the mock endpoint. Time to first token is drawn from a log-normal
+    distribution around `ttft_median`; the completion then takes `output_tokens` tokens
+    at `tokens_per_second`.
+    """
+
+    def __init__(self, ttft_median=0.3, ttft_sigma=0.5, tokens_per_second=80.0, output_tokens=120,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=1.0, seed=None):
+        self.ttft_median = ttft_median
+        self.ttft_sigma = ttft_sigma
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+
+    def ttft(self):
+        return self.ttft_median * math.exp(self.random.gauss(0, self.ttft_sigma)) if self.ttft_median > 0 else 0.0
+
+
+def is_judge_request(body):
+    """
+    Judge requests ask for a JSON object or schema; everything else is treated as generation.
+    """
+    if (body.get("response_format") or {}).get("type") in ("json_object", "json_schema"):
+        return True
+    system = next((m.get("content") or "" for m in body.get("messages", []) if m.get("role") == "system"), "")
+    return "JSON format" in system
+
+
+def canned_content(body, settings):
+    """
+    Returns a deterministic response for the request: a judge verdict with scores derived
+    from a hash of the messages (with the keys of the requested JSON schema, if any), or a
+    generated answer citing a few context references, time differences, IDs and context sections.
+    """
+    digest = hashlib.sha256(json.dumps(body.get("messages", []), sort_keys=True).encode("utf-8")).hexdigest()
+    rng = random.Random(digest)
+    if is_judge_request(body):
+        schema = ((body.get("response_format") or {}).get("json_schema") or {}).get("schema") or {}
+        keys = list(schema.get("properties") or ["reasoning_of_metrics_and_correctness"] + judge_keys)
+        verdict = {key: "Mock verdict " + digest[:12] if key == "reasoning_of_metrics_and_correctness" else rng.randint(40, 100)
+                   for key in keys}
+        return json.dumps(verdict)
+    words = []
+    for _ in range(settings.output_tokens):
+        draw = rng.random()
+        if draw < 0.05:
+            words.append(f"[{rng.randint(1, 5)}]")
+        elif draw < 0.07:
+            words.append(f"ID {rng.randint(1, 20)}")
+        elif draw < 0.09:
+            words.append(f"im {rng.randint(1, 5)}. Kontext-Abschnitt")
+        elif draw < 0.10:
+            words.append(f"{rng.randint(1, 5)} Tage")
+        else:
+            words.append(rng.choice(("Antwort", "Kontext", "laut", "und", "der", "die")))
+    return " ".join(words)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY a kept-alive connection
+    # stalls on delayed ACKs between them
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        # One handler per TCP connection, so this counts the connections the clients opened
+        super().setup()
+        self.server.count("connections")
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        elif self.path.rstrip("/").endswith("/stats"):
+            self.send_json(200, self.server.stats())
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_json(400, {"error": {"message": "Invalid JSON body", "type": "invalid_request_error"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+
+        settings = self.server.settings
+        with self.server.lock:
+            draw = settings.random.random()
+            ttft = settings.ttft()
+        if draw < settings.rate_limit_rate:
+            self.server.count("rate_limited")
+            self.send_json(429, {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}},
+                           {"Retry-After": f"{settings.retry_after:g}"})
+            return
+        if draw < settings.rate_limit_rate + settings.error_rate:
+            self.server.count("errors")
+            time.sleep(ttft)
+            self.send_json(500, {"error": {"message": "Internal error (mock)", "type": "server_error"}})
+            return
+
+        content = canned_content(body, settings)
+        tokens = content.split(" ")
+        usage = {"prompt_tokens": sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4,
+                 "completion_tokens": len(tokens),
+                 "prompt_tokens_details": {"cached_tokens": self.server.cached_prefix_tokens(body.get("messages", []))}}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = body.get("model", "mock")
+        token_gap = 1.0 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0.0
+        self.server.count("completed")
+
+        time.sleep(ttft)
+        if not body.get("stream"):
+            time.sleep(token_gap * len(tokens))
+            self.send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        # Server-sent events, one token per chunk; chunked so the connection can be kept alive
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for index, token in enumerate(tokens):
+            if index:
+                time.sleep(token_gap)
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": {"content": token if index == 0 else " " + token}, "finish_reason": None}]}
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n")
+        final = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self.write_chunk(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    """
+    Local OpenAI-compatible stand-in for /v1/chat/completions (plain and streamed) with
+    configurable latency, error and 429 rates and canned judge JSON. Point the scripts at it
+    with OPENAI_API_BASE=http://host:port/v1 to run the harness offline and for free.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+    # Prefixes remembered for the prompt cache emulation
+    max_prefixes = 100000
+
+    def __init__(self, host="127.0.0.1", port=0, settings=None):
+        super().__init__((host, port), MockHandler)
+        self.settings = settings or MockSettings()
+        self.lock = threading.Lock()
+        self.counters = {"completed": 0, "rate_limited": 0, "errors": 0, "connections": 0}
+        self.prefixes = OrderedDict()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def cached_prefix_tokens(self, messages):
+        """
+        Emulates provider prefix caching: the longest run of leading messages (all but the
+        last) that an earlier request started with counts as cached once it reaches 1024
+        tokens, in steps of 128 tokens.
+        """
+        digest = hashlib.sha256()
+        hashes = []
+        for message in messages[:-1]:
+            digest.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+            hashes.append(digest.hexdigest())
+        with self.lock:
+            hit = max((index for index, key in enumerate(hashes) if key in self.prefixes), default=-1)
+            for key in hashes:
+                self.prefixes[key] = True
+                self.prefixes.move_to_end(key)
+            while len(self.prefixes) > self.max_prefixes:
+                self.prefixes.popitem(last=False)
+        tokens = sum(len(m.get("content") or "") for m in messages[:hit + 1]) // 4
+        return tokens // 128 * 128 if tokens >= 1024 else 0
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def start(self):
+        """
+        Serves in a background thread and returns the server.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def add_settings_arguments(parser):
+    parser.add_argument("--ttft-median", type=float, default=0.3, help="Median time to first token in seconds")
+    parser.add_argument("--ttft-sigma", type=float, default=0.5, help="Sigma of the log-normal time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--output-tokens", type=int, default=120, help="Tokens per generated answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with HTTP 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of the 429 responses in seconds")
+    parser.add_argument("--seed", type=int)
+
+
+def settings_from_args(args):
+    return MockSettings(args.ttft_median, args.ttft_sigma, args.tokens_per_second, args.output_tokens,
+                        args.error_rate, args.rate_limit_rate, args.retry_after, args.seed)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible mock server for benchmarking the harness.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(args.host, args.port, settings_from_args(args))
+    logging.info(f"Mock OpenAI server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logging.info(f"Served {server.stats()}")
+        server.server_close()
@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import contextvars
+import csv
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import evaluate_by_judge
+import evaluate_model
+from backends import add_backend_arguments, close_backends, load_backend_configs
+from checkpoint import CheckpointedWriter, read_csv_rows
+from extraction import row_extraction_metrics
+from generation_engine import AdaptiveRateLimiter, PrioritySemaphore, imap_ordered, latency_columns
+from instrumentation import current_config, mark_queued, metrics
+from judge_cascade import add_cascade_arguments
+from result_store import ResultStore
+from tasks import task_for, task_names
+
+config_names = task_names
+
+
+class CsvSink:
+    """
+    Optional semicolon CSV output for one intermediate stage, in the same layout the
+    standalone scripts write. A resumed run passes the rows completed before, so the file
+    holds the same rows as the judged file.
+    """
+
+    def __init__(self, path, fieldnames, completed_rows=()):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, mode='w', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames, delimiter=';', extrasaction='ignore')
+        self._writer.writeheader()
+        self._writer.writerows(completed_rows)
+
+    def writerow(self, row):
+        self._writer.writerow(row)
+
+    def close(self):
+        self._file.close()
+
+
+class StreamingPipeline:
+    """
+    Streams every row through prepare -> generate -> extract -> judge without materializing
+    the stages on disk in between. A row is handed to the judge as soon as its own generation
+    and reference extraction are done, so the wall-clock time of a run approaches
+    max(generation, judging) instead of their sum.
+
+    All configs run at the same time and share one rate limiter and one slot budget per stage.
+    The slots go to the most expensive rows first (see Task.row_cost), and the configs are
+    started longest-first with windows sized by their expected cost, so the long rows are not
+    left for the end of the run.
+    """
+
+    def __init__(self, input_dir='.', output_dir='evaluated', generation_concurrency=None,
+                 judge_concurrency=100, write_intermediate=False, result_store=None, stream=False):
+        self.input_dir = input_dir
+        self.result_store = result_store
+        self.output_dir = output_dir
+        self.write_intermediate = write_intermediate
+        self.stream = stream
+        self.generation_concurrency = generation_concurrency or evaluate_model.backend.max_concurrency or evaluate_model.max_concurrency
+        self.judge_concurrency = judge_concurrency
+        self.judge_executor = ThreadPoolExecutor(max_workers=judge_concurrency)
+
+    def _open_sinks(self, output_dir, config_name, generated_fields, extracted_fields, judged_path, resumed):
+        if not self.write_intermediate:
+            return []
+        # The judged rows hold every generated and extracted column, so the intermediate
+        # files of a resumed run are rebuilt from them
+        completed_rows = read_csv_rows(judged_path)[1] if resumed else []
+        return [
+            CsvSink(os.path.join(output_dir, f"evaluated_{config_name}_test.csv"), generated_fields, completed_rows),
+            CsvSink(os.path.join(output_dir, 'extracted', f"extracted_evaluated_{config_name}_test.csv"), extracted_fields, completed_rows),
+        ]
+
+    def judge_row(self, row, task):
+        try:
+            return evaluate_by_judge.process_row(row, task)
+        except Exception as e:
+            logging.error(f"Error processing row: {e}")
+            return dict.fromkeys(['reasoning_of_metrics_and_correctness'] + task.score_keys, 'Error: Processing failed')
+
+    def stage_fields(self, fieldnames, config_name):
+        """
+        Returns the generated, extracted and judged field names of a config whose input CSV
+        has `fieldnames`.
+        """
+        task = task_for(config_name)
+        prepared_fields = fieldnames + (['References'] if task.references and 'References' not in fieldnames else [])
+        generated_fields = prepared_fields + ['model_generated_output'] + (latency_columns if self.stream else [])
+        extracted_fields = generated_fields + (['model_References'] if task.references else []) + task.extraction_metrics
+        judged_fields = extracted_fields + evaluate_by_judge.judged_columns(task.score_keys)
+        return generated_fields, extracted_fields, judged_fields
+
+    async def process_row(self, config_name, row, generate, judge_slots):
+        """
+        Prepares, generates, extracts and judges one row of a config in place and returns it.
+        Its generation and judge requests wait for their slots with the row's expected cost as priority.
+        """
+        task = task_for(config_name)
+        priority = task.row_cost(row)
+
+        # Prepare: the references cited in the target answer
+        if task.references:
+            row['References'] = str(task.reference_regex.findall(row.get('Chosen') or ''))
+
+        # Generate
+        if not row.get('Instruction') or not row.get('System'):
+            logging.warning(f"Missing 'Instruction' or 'System' in row: {row}")
+            row['model_generated_output'] = 'Error: Missing data'
+        else:
+            timings = {} if self.stream else None
+            message = await generate(row['System'], row['Instruction'], timings, priority)
+            row['model_generated_output'] = message if message else 'Error generating response'
+            if timings:
+                row.update(timings)
+
+        # Extract: the references cited in the model output and the extraction metrics
+        if task.references:
+            row['model_References'] = str(task.reference_regex.findall(row['model_generated_output']))
+        row.update(row_extraction_metrics(row, task.extraction))
+
+        # Judge
+        mark_queued()
+        async with judge_slots.slot(priority):
+            context = contextvars.copy_context()
+            row.update(await asyncio.get_running_loop().run_in_executor(self.judge_executor, context.run, self.judge_row, row, task))
+        return row
+
+    async def run_config(self, config_name, generate, judge_slots, output_dir=None, window=None):
+        """
+        Runs one benchmark config end to end and writes its judged CSV.
+
+        Parameters:
+            config_name (str): Benchmark config to run.
+            generate (callable): Coroutine function (system, instruction, timings, priority) -> model
+                response; when `timings` is a dict the response is streamed and its latency is stored in it.
+            judge_slots (PrioritySemaphore): Judge concurrency shared by all running configs.
+            output_dir (str): Output directory, defaults to the pipeline's.
+            window (int): Rows of the config in flight, defaults to the generation plus the judge concurrency.
+
+        Returns:
+            int: Number of rows processed in this run.
+        """
+        # run_config runs as its own task, so this labels only the requests of this config
+        current_config.set(config_name)
+        input_csv_path = os.path.join(self.input_dir, f"{config_name}_test.csv")
+        fieldnames, rows = read_csv_rows(input_csv_path)
+        if 'Instruction' not in fieldnames or 'System' not in fieldnames:
+            logging.error(f"Input CSV must contain 'Instruction' and 'System' columns. Found columns: {fieldnames}")
+            return 0
+
+        generated_fields, extracted_fields, judged_fields = self.stage_fields(fieldnames, config_name)
+        output_dir = output_dir or self.output_dir
+        judged_path = os.path.join(output_dir, 'judged', f"extracted_judged_evaluated_{config_name}_test.csv")
+        os.makedirs(os.path.dirname(judged_path), exist_ok=True)
+
+        async def process(item):
+            rid, row = item
+            return rid, await self.process_row(config_name, row, generate, judge_slots)
+
+        processed = 0
+        with CheckpointedWriter(judged_path, judged_fields) as writer:
+            sinks = self._open_sinks(output_dir, config_name, generated_fields, extracted_fields, judged_path, bool(writer.completed))
+            try:
+                async for rid, row in imap_ordered(process, writer.pending(rows), window or self.generation_concurrency + self.judge_concurrency):
+                    for sink in sinks:
+                        sink.writerow(row)
+                    writer.writerow(rid, row)
+                    processed += 1
+            finally:
+                for sink in sinks:
+                    sink.close()
+        logging.info(f"Finished {config_name}: {processed} rows written to {judged_path}")
+        if self.result_store:
+            self.result_store.import_csv(config_name, judged_path)
+        return processed
+
+    def make_generate(self):
+        """
+        Returns the generate coroutine function of the model under test, under one rate
+        limiter and the generation concurrency of the pipeline.
+        """
+        backend = evaluate_model.backend
+        limiter = AdaptiveRateLimiter(backend.requests_per_minute or evaluate_model.requests_per_minute,
+                                      backend.tokens_per_minute or evaluate_model.tokens_per_minute)
+        generation_slots = PrioritySemaphore(self.generation_concurrency)
+
+        async def generate(system, instruction, timings=None, priority=0):
+            async with generation_slots.slot(priority):
+                return await evaluate_model.agenerate_model_responses(system, instruction, limiter, timings=timings)
+
+        return generate
+
+    def config_cost(self, config_name):
+        """
+        Expected cost of a config: the sum of Task.row_cost over its input rows; 0 without input.
+        """
+        input_csv_path = os.path.join(self.input_dir, f"{config_name}_test.csv")
+        if not os.path.exists(input_csv_path):
+            return 0
+        task = task_for(config_name)
+        return sum(task.row_cost(row) for row in read_csv_rows(input_csv_path)[1])
+
+    def schedule(self, configs):
+        """
+        Orders the configs longest-first by their expected cost and sizes the window of rows
+        each keeps in flight by its share: the most expensive config gets the full window of
+        the pipeline, the others proportionally smaller ones, but at least the generation
+        concurrency.
+
+        Returns:
+            list: (config name, window) pairs, the most expensive config first.
+        """
+        costs = {config_name: self.config_cost(config_name) for config_name in configs}
+        full_window = self.generation_concurrency + self.judge_concurrency
+        largest = max(costs.values(), default=0) or 1
+        plan = []
+        for config_name in sorted(configs, key=lambda c: -costs[c]):
+            window = max(self.generation_concurrency, math.ceil(full_window * costs[config_name] / largest))
+            logging.info(f"Scheduled {config_name}: expected cost {costs[config_name]:,.0f}, window {window}")
+            plan.append((config_name, window))
+        return plan
+
+    async def run(self, configs):
+        generate = self.make_generate()
+        judge_slots = PrioritySemaphore(self.judge_concurrency)
+        plan = self.schedule(configs)
+        try:
+            counts = await asyncio.gather(*(self.run_config(config_name, generate, judge_slots, window=window)
+                                            for config_name, window in plan))
+        finally:
+            await close_backends()
+        counts = dict(zip([config_name for config_name, _ in plan], counts))
+        return {config_name: counts[config_name] for config_name in configs}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run download output -> prepare -> generate -> extract -> judge as one streaming pipeline.")
+    parser.add_argument("--configs", nargs="+", default=config_names, choices=config_names)
+    parser.add_argument("--input-dir", default=".", help="Directory with the downloaded <config>_test.csv files")
+    parser.add_argument("--output-dir", default="evaluated")
+    parser.add_argument("--judge-concurrency", type=int, default=100)
+    parser.add_argument("--write-intermediate", action="store_true",
+                        help="Also write the evaluated_ and extracted_ CSVs of the standalone scripts")
+    parser.add_argument("--result-store", help="Also store the typed results per stage as Parquet under this directory")
+    parser.add_argument("--stream", action="store_true", help="Stream the responses and record their latency per row")
+    add_cascade_arguments(parser)
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    backend_configs = load_backend_configs(args.backends)
+    evaluate_model.set_backend(backend_configs.get('generation'))
+    evaluate_by_judge.set_backend(backend_configs.get('judge'))
+    evaluate_by_judge.set_cascade(args.cascade_model, args.uncertainty_band, args.audit_rate)
+
+    pipeline = StreamingPipeline(args.input_dir, args.output_dir, judge_concurrency=args.judge_concurrency,
+                                 write_intermediate=args.write_intermediate,
+                                 result_store=ResultStore(args.result_store) if args.result_store else None,
+                                 stream=args.stream)
+    start = time.monotonic()
+    counts = asyncio.run(pipeline.run(args.configs))
+    logging.info(f"Pipeline processed {sum(counts.values())} rows in {time.monotonic() - start:.1f}s: {counts}")
+    evaluate_model.response_cache.report()
+    evaluate_by_judge.response_cache.report()
+    metrics.report()
+    metrics.export('pipeline')
+    if evaluate_by_judge.judge_cascade:
+        evaluate_by_judge.judge_cascade.report()
+        evaluate_by_judge.judge_cascade.export('pipeline')
@@ -0,0 +1,345 @@
+import argparse
+import json
+import logging
+import os
+import re
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from checkpoint import is_shard_file
+from scoring import build_weighted_frame, config_from_file, full_metrics, grouped_bootstrap, metric_column_map, score_frames
+from tasks import task_for
+
+# Colors and legend names of the notebook charts
+color_map = {
+    'Language Quality': '#18A2D9',
+    'Overall Correctness': '#306CB4',
+    'Instruction Following': '#794C99',
+    'Overall Correctness Binary Score': '#F2CE1B',
+    'Constrains Adherence': '#AFDDF0',
+    'Logical Consistency': '#0B9FDB',
+    'Final Solution Correctness': '#2882A6',
+    'Weighted Overall Score': '#6BBA76'
+}
+
+legend_name_map = {
+    'Overall Correctness Binary Score': 'Source Citation',
+}
+
+# Intervals of 10 points; 100 falls into the last one
+histogram_labels = [f"{i}-{i + 10}%" for i in range(0, 100, 10)]
+
+# Columns read from the result files; prompts, contexts and judge reasoning are skipped
+read_columns = {'References', 'model_References', 'model_generated_output', 'overall_score'} | set(metric_column_map.values())
+
+
+def result_files(directory):
+    """
+    Returns the result CSVs of a run directory and whether they are _weighted files. A run
+    directory may hold the CSVs itself or in its 'weighted' or 'judged' subdirectory; the
+    weighted files are preferred.
+    """
+    for candidate in (os.path.join(directory, 'weighted'), os.path.join(directory, 'judged'), directory):
+        if not os.path.isdir(candidate):
+            continue
+        files = sorted(f for f in os.listdir(candidate)
+                       if f.endswith('.csv') and '_evaluated' in f and not is_shard_file(f))
+        weighted = [f for f in files if f.endswith('_weighted.csv')]
+        if weighted or files:
+            return [os.path.join(candidate, f) for f in weighted or files], bool(weighted)
+    return [], False
+
+
+def load_model(directory):
+    """
+    Reads the results of one model, only the columns needed for scoring.
+
+    Returns:
+        dict: Config name -> weighted frame.
+    """
+    files, weighted = result_files(directory)
+    frames = {}
+    for path in files:
+        df = pd.read_csv(path, sep=';', usecols=lambda column: column in read_columns)
+        config_name = config_from_file(os.path.basename(path))
+        frames[config_name] = df if weighted else build_weighted_frame(df, config_name)
+    return frames
+
+
+def model_sources(models=(), sweep_dir=None):
+    """
+    Returns (name, directory) per model from 'name=directory' or 'directory' specs and the
+    target directories of a sweep.
+    """
+    sources = []
+    for spec in models:
+        name, _, directory = spec.rpartition('=')
+        if not name:
+            # evaluated/weighted or <run>/judged are named after the run directory
+            parts = os.path.normpath(os.path.abspath(directory)).split(os.sep)
+            name = parts[-2] if parts[-1] in ('weighted', 'judged') and len(parts) > 1 else parts[-1]
+        sources.append((name, directory))
+    if sweep_dir:
+        for name in sorted(os.listdir(sweep_dir)):
+            if os.path.isdir(os.path.join(sweep_dir, name)) and result_files(os.path.join(sweep_dir, name))[0]:
+                sources.append((name, os.path.join(sweep_dir, name)))
+    return sources
+
+
+def score_models(models, threshold_variable=70):
+    """
+    Scores every model like the leaderboard and stacks the rows of all models and tasks.
+    Metrics that do not count for a task are NaN, so the means per task equal the
+    leaderboard table.
+
+    Returns:
+        pd.DataFrame: Columns 'Model', 'Task' and full_metrics, one row per judged row.
+    """
+    tables = []
+    for model, frames in models.items():
+        if not frames:
+            logging.warning(f"No results for {model}")
+            continue
+        scored, _ = score_frames(frames, threshold_variable)
+        for config_name, df in scored.items():
+            relevant = task_for(config_name).metrics
+            table = pd.DataFrame({metric: df[metric_column_map[metric]].to_numpy(dtype=float)
+                                  if metric in relevant and metric_column_map[metric] in df.columns else np.nan
+                                  for metric in full_metrics}, index=range(len(df)))
+            table.insert(0, 'Task', config_name)
+            table.insert(0, 'Model', model)
+            tables.append(table)
+    return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=['Model', 'Task'] + full_metrics)
+
+
+def histograms(values, codes, groups):
+    """
+    Counts of the 10-point intervals per group and metric in one bincount.
+
+    Returns:
+        np.ndarray: groups x metrics x intervals.
+    """
+    metrics = values.shape[1]
+    valid = ~np.isnan(values)
+    bins = np.clip(np.floor(np.where(valid, values, 0) / 10), 0, 9).astype(np.int64)
+    cells = (codes[:, None] * metrics + np.arange(metrics)[None, :]) * 10 + bins
+    return np.bincount(cells[valid], minlength=groups * metrics * 10).reshape(groups, metrics, 10)
+
+
+def build_report(rows, resamples=1000, confidence=0.95, seed=0):
+    """
+    Aggregates the scored rows of all models in one pass: the mean, bootstrap interval, row
+    count and histogram of every metric per model and task, and the leaderboard of the
+    models by their Weighted Overall Score averaged over the tasks. The interval of that
+    average comes from the same resamples, each task resampled on its own.
+
+    Returns:
+        dict: The report, ready to be written as JSON.
+    """
+    keys = rows[['Model', 'Task']].drop_duplicates().reset_index(drop=True)
+    codes = rows.groupby(['Model', 'Task'], sort=False).ngroup().to_numpy()
+    values = rows[full_metrics].to_numpy(dtype=float)
+    _, means, resampled = grouped_bootstrap(values, codes, resamples, seed)
+    tail = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        # A metric without values in a task has no interval
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low, high = np.nanquantile(resampled, [tail, 1 - tail], axis=0) if resamples else (means, means)
+    hist = histograms(values, codes, len(keys))
+    counts = hist.sum(axis=2)
+
+    def number(value):
+        return None if np.isnan(value) else round(float(value), 4)
+
+    details = {}
+    for k, (model, task) in enumerate(keys.itertuples(index=False)):
+        details.setdefault(model, {})[task] = {
+            metric: {
+                'mean': number(means[k, m]),
+                'ci_low': number(low[k, m]),
+                'ci_high': number(high[k, m]),
+                'rows': int(counts[k, m]),
+                'histogram': hist[k, m].tolist(),
+            }
+            for m, metric in enumerate(full_metrics) if counts[k, m]
+        }
+
+    overall = full_metrics.index('Weighted Overall Score')
+    leaderboard = []
+    for model, tasks in keys.groupby('Model', sort=False).groups.items():
+        task_means = means[tasks, overall]
+        task_resamples = resampled[:, tasks, overall]
+        scored = ~np.isnan(task_means)
+        score = task_means[scored].mean() if scored.any() else np.nan
+        model_low, model_high = (np.quantile(task_resamples[:, scored].mean(axis=1), [tail, 1 - tail])
+                                 if scored.any() and resamples else (score, score))
+        leaderboard.append({'model': model, 'weighted_overall_score': number(score), 'ci_low': number(model_low),
+                            'ci_high': number(model_high), 'tasks': int(scored.sum())})
+    leaderboard.sort(key=lambda entry: -np.inf if entry['weighted_overall_score'] is None else entry['weighted_overall_score'], reverse=True)
+    for rank, entry in enumerate(leaderboard, start=1):
+        entry['rank'] = rank
+
+    return {
+        'settings': {'resamples': resamples, 'confidence': confidence, 'seed': seed},
+        'histogram_intervals': histogram_labels,
+        'leaderboard': leaderboard,
+        'models': details,
+    }
+
+
+def file_name(model):
+    return re.sub(r'[^\w.-]+', '_', model)
+
+
+def write_charts(report, output_dir, model_charts=False, histogram_metric='Weighted Overall Score'):
+    """
+    Renders the leaderboard with its intervals and a model x task heatmap of the Weighted
+    Overall Score; with `model_charts` also the notebook's per-task bar chart and a histogram
+    per task for every model. Needs matplotlib; runs headless.
+
+    Returns:
+        list: Paths of the written charts.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    paths = []
+
+    def save(fig, name):
+        path = os.path.join(output_dir, name)
+        fig.tight_layout()
+        fig.savefig(path, dpi=120)
+        plt.close(fig)
+        paths.append(path)
+
+    leaderboard = [entry for entry in report['leaderboard'] if entry['weighted_overall_score'] is not None]
+    if not leaderboard:
+        return paths
+    names = [entry['model'] for entry in leaderboard][::-1]
+    scores = np.array([entry['weighted_overall_score'] for entry in leaderboard])[::-1]
+    errors = np.array([[entry['weighted_overall_score'] - entry['ci_low'], entry['ci_high'] - entry['weighted_overall_score']]
+                       for entry in leaderboard])[::-1].T
+    fig, ax = plt.subplots(figsize=(10, 1.5 + 0.4 * len(names)))
+    ax.barh(names, scores, xerr=errors, color=color_map['Weighted Overall Score'], capsize=3)
+    for y, score in enumerate(scores):
+        ax.text(1, y, f"{score:.1f}", va='center', fontsize=9)
+    ax.set_xlim(0, 100)
+    ax.set_xlabel(f"Weighted Overall Score, mean over tasks ({report['settings']['confidence']:.0%} interval)")
+    ax.set_title("Leaderboard")
+    ax.grid(axis='x', linestyle='--', alpha=0.3)
+    save(fig, 'leaderboard.png')
+
+    tasks = list(dict.fromkeys(task for model in report['models'].values() for task in model))
+    grid = np.array([[report['models'][model].get(task, {}).get('Weighted Overall Score', {}).get('mean', np.nan)
+                      for task in tasks] for model in names[::-1]], dtype=float)
+    fig, ax = plt.subplots(figsize=(2 + 2 * len(tasks), 1.5 + 0.4 * len(names)))
+    image = ax.imshow(grid, cmap='viridis', vmin=0, vmax=100, aspect='auto')
+    ax.set_xticks(range(len(tasks)), tasks, rotation=20, ha='right')
+    ax.set_yticks(range(len(names)), names[::-1])
+    for (y, x), value in np.ndenumerate(grid):
+        if not np.isnan(value):
+            ax.text(x, y, f"{value:.1f}", ha='center', va='center', fontsize=9, color='white' if value < 60 else 'black')
+    fig.colorbar(image, ax=ax, label='Weighted Overall Score')
+    save(fig, 'tasks_heatmap.png')
+
+    if not model_charts:
+        return paths
+    for model, model_tasks in report['models'].items():
+        fig, ax = plt.subplots(figsize=(20, 12))
+        labelled = set()
+        for x, task in enumerate(model_tasks):
+            metrics = list(model_tasks[task].items())
+            for i, (metric, summary) in enumerate(metrics):
+                position = x + (i - (len(metrics) - 1) / 2) * 0.2
+                error = [[summary['mean'] - summary['ci_low']], [summary['ci_high'] - summary['mean']]]
+                ax.bar(position, summary['mean'], 0.2, yerr=error, capsize=3, color=color_map[metric],
+                       label=None if metric in labelled else legend_name_map.get(metric, metric))
+                labelled.add(metric)
+                if summary['mean'] > 5:
+                    ax.text(position, summary['mean'] * 0.98, f"{summary['mean']:.1f}", ha='center', va='top', fontsize=12, rotation=90)
+        ax.set_ylim(0, 100)
+        ax.set_xticks(range(len(model_tasks)), list(model_tasks), fontsize=14)
+        ax.set_title(model, fontsize=20, pad=20)
+        ax.legend(title="Metrics", loc='lower center', bbox_to_anchor=(0.5, -0.16), ncol=5, frameon=False, fontsize=12)
+        ax.grid(axis='y', color='black', linestyle='--', alpha=0.3)
+        save(fig, f"{file_name(model)}_tasks.png")
+
+        fig, axes = plt.subplots(1, len(model_tasks), figsize=(5 * len(model_tasks), 4), squeeze=False)
+        for ax, (task, metrics) in zip(axes[0], model_tasks.items()):
+            counts = metrics.get(histogram_metric, {}).get('histogram', [0] * len(histogram_labels))
+            ax.bar(histogram_labels, counts, color='#0B9FDB')
+            ax.set_title(task)
+            ax.set_xlabel("Intervals (%)")
+            ax.tick_params(axis='x', rotation=45)
+        axes[0][0].set_ylabel("Number of Entries")
+        fig.suptitle(f"Distribution of {histogram_metric} {model}")
+        save(fig, f"{file_name(model)}_histograms.png")
+    return paths
+
+
+def metrics_table(report):
+    """
+    The per model, task and metric aggregates as a flat table.
+    """
+    return pd.DataFrame([
+        dict(Model=model, Task=task, Metric=metric, **{key: value for key, value in summary.items() if key != 'histogram'})
+        for model, tasks in report['models'].items() for task, metrics in tasks.items() for metric, summary in metrics.items()
+    ])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Build the leaderboard, confidence intervals, histograms and charts "
+                                                 "of one or more evaluated models without the notebook.")
+    parser.add_argument("--model", action="append", default=[],
+                        help="Model results as name=directory or directory (repeatable); the directory holds the "
+                             "_weighted or judged CSVs, or 'weighted'/'judged' subdirectories")
+    parser.add_argument("--sweep-dir", help="Report every target of a sweep directory")
+    parser.add_argument("--output-dir", default=os.path.join("evaluated", "report"))
+    parser.add_argument("--threshold", type=float, default=70)
+    parser.add_argument("--resamples", type=int, default=1000, help="Bootstrap resamples")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=8, help="Result files read in parallel")
+    parser.add_argument("--no-charts", action="store_true", help="Only write the JSON and CSV")
+    parser.add_argument("--model-charts", action="store_true", help="Also write the per-task and histogram chart of every model")
+    parser.add_argument("--histogram-metric", default='Weighted Overall Score', choices=full_metrics)
+    args = parser.parse_args()
+
+    sources = model_sources(args.model, args.sweep_dir)
+    if not sources:
+        parser.error("No results given; use --model or --sweep-dir")
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        models = dict(zip([name for name, _ in sources], executor.map(load_model, [directory for _, directory in sources])))
+    rows = score_models(models, args.threshold)
+    if rows.empty:
+        parser.error("No judged rows found in the given results")
+    report = build_report(rows, args.resamples, args.confidence, args.seed)
+    report['settings']['threshold'] = args.threshold
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, 'leaderboard.json')
+    with open(path + '.tmp', mode='w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    os.replace(path + '.tmp', path)
+    metrics_table(report).to_csv(os.path.join(args.output_dir, 'report_metrics.csv'), index=False, sep=';')
+    logging.info(f"Scored {len(rows)} rows of {len(models)} models in {time.monotonic() - start:.1f}s")
+
+    if not args.no_charts:
+        try:
+            charts = write_charts(report, args.output_dir, args.model_charts, args.histogram_metric)
+            logging.info(f"Wrote {len(charts)} charts to {args.output_dir}")
+        except ImportError:
+            logging.error("matplotlib is not installed; skipping the charts")
+
+    leaderboard = pd.DataFrame(report['leaderboard'])[['rank', 'model', 'weighted_overall_score', 'ci_low', 'ci_high', 'tasks']]
+    pd.options.display.float_format = '{:.2f}'.format
+    print(leaderboard.to_string(index=False))
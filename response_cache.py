@@ -0,0 +1,174 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+default_cache_path = os.getenv("RESPONSE_CACHE_PATH", os.path.join("cache", "responses.sqlite"))
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache of chat completion responses backed by SQLite.
+
+    Entries are keyed by a hash of the model name, the sampling parameters and the messages,
+    so a rerun only pays for requests whose inputs actually changed. The cache is safe to
+    share between the threads of the judge and the event loop of the generation engine.
+    The database is opened on first use, so creating a cache has no side effects.
+    """
+
+    def __init__(self, path=default_cache_path, max_bytes=None, max_age_days=None, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self._lock = threading.RLock()
+        self._connection = None
+
+    def _connect(self):
+        """
+        Returns the SQLite connection, creating the database and applying the configured
+        eviction on first use. Call with the lock held.
+        """
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            self._connection = connection
+            if self.max_bytes or self.max_age_days:
+                self.evict(max_bytes=self.max_bytes, max_age_days=self.max_age_days)
+        return self._connection
+
+    @staticmethod
+    def make_key(model, params, messages):
+        """
+        Returns the hex SHA-256 of the canonical JSON of model, parameters and messages.
+        """
+        payload = json.dumps({"model": model, "params": params, "messages": messages},
+                             sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached response for `key`, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._connect().execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key, response, model=None):
+        """
+        Stores a successful response. Error responses must not be cached.
+        """
+        if not self.enabled or response is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode("utf-8")), now, now)
+            )
+
+    def evict(self, max_bytes=None, max_age_days=None):
+        """
+        Removes entries older than `max_age_days` and then the least recently used entries
+        until the total response size is at most `max_bytes`.
+
+        Returns:
+            int: Number of evicted entries.
+        """
+        if not self.enabled:
+            return 0
+        evicted = 0
+        with self._lock:
+            self._connect()
+            if max_age_days is not None:
+                cutoff = time.time() - max_age_days * 86400
+                evicted += self._connection.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,)).rowcount
+            if max_bytes is not None:
+                total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > max_bytes:
+                    doomed = []
+                    for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+                        if total <= max_bytes:
+                            break
+                        doomed.append((key,))
+                        total -= size
+                    self._connection.executemany("DELETE FROM responses WHERE key = ?", doomed)
+                    evicted += len(doomed)
+        if evicted:
+            logging.info(f"Evicted {evicted} entries from response cache {self.path}")
+        return evicted
+
+    def stats(self):
+        """
+        Returns the hit/miss counters of this process and the size of the cache on disk.
+        """
+        entries, size = 0, 0
+        # A cache that was never used is not created just to report on it
+        if self.enabled and (self._connection is not None or os.path.exists(self.path)):
+            with self._lock:
+                entries, size = self._connect().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "size_bytes": size,
+        }
+
+    def report(self):
+        stats = self.stats()
+        logging.info(f"Response cache {self.path}: {stats['hits']} hits, {stats['misses']} misses "
+                     f"({stats['hit_rate']:.1%} hit rate), {stats['entries']} entries, {stats['size_bytes'] / 1e6:.1f} MB")
+        return stats
+
+
+def open_default_cache():
+    """
+    Opens the shared cache configured through the RESPONSE_CACHE_* environment variables.
+    Set RESPONSE_CACHE=0 to disable caching.
+    """
+    max_mb = os.getenv("RESPONSE_CACHE_MAX_MB")
+    max_age_days = os.getenv("RESPONSE_CACHE_MAX_AGE_DAYS")
+    return ResponseCache(
+        default_cache_path,
+        max_bytes=int(float(max_mb) * 1e6) if max_mb else None,
+        max_age_days=float(max_age_days) if max_age_days else None,
+        enabled=os.getenv("RESPONSE_CACHE", "1") != "0",
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Inspect or evict the shared response cache.")
+    parser.add_argument("--path", default=default_cache_path)
+    parser.add_argument("--max-mb", type=float, help="Evict least recently used entries above this size")
+    parser.add_argument("--max-age-days", type=float, help="Evict entries older than this")
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.path)
+    cache.evict(max_bytes=int(args.max_mb * 1e6) if args.max_mb else None, max_age_days=args.max_age_days)
+    print(json.dumps(cache.stats(), indent=2))
@@ -0,0 +1,211 @@
+import argparse
+import ast
+import glob
+import logging
+import os
+import re
+
+from checkpoint import assign_row_ids, read_csv_rows
+from extraction import extraction_metric_columns
+from generation_engine import latency_columns
+from judge_cascade import cascade_columns
+
+list_columns = ['References', 'model_References']
+
+numeric_columns = [
+    'language_quality',
+    'overall_correctness',
+    'instruction_following',
+    'constrains_adherence',
+    'logical_consistency',
+    'final_solution_correctness',
+    'overall_score',
+    'overall_correctness_binary_score',
+    'weighted_overall_score',
+    'cheap_judge_overall_score',
+] + latency_columns + extraction_metric_columns
+
+# Columns added by each stage; every column not listed here belongs to the prepared stage
+stage_columns = {
+    'generated': ['model_generated_output'] + latency_columns,
+    'extracted': ['model_References'] + extraction_metric_columns,
+    'judged': ['reasoning_of_metrics_and_correctness', 'language_quality', 'overall_correctness', 'instruction_following',
+               'constrains_adherence', 'logical_consistency', 'final_solution_correctness', 'overall_score'] + cascade_columns,
+}
+
+stage_order = ['prepared', 'generated', 'extracted', 'judged']
+
+
+def parse_list(value):
+    """
+    Returns a list column value as a list of strings. Accepts real lists and the
+    "['1', '2']" strings that pandas writes into the CSV files.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        parsed = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return re.findall(r"\d+", value)
+    return [str(v) for v in parsed] if isinstance(parsed, (list, tuple)) else [str(parsed)]
+
+
+def parse_number(value):
+    """
+    Returns a score as float, or None for missing values and error markers.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def column_array(name, values):
+    import pyarrow as pa
+
+    if name in list_columns:
+        return pa.array([parse_list(v) for v in values], type=pa.list_(pa.string()))
+    if name in numeric_columns:
+        return pa.array([parse_number(v) for v in values], type=pa.float64())
+    return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+class ResultStore:
+    """
+    Typed Arrow/Parquet store for benchmark results, one directory per config and one Parquet
+    file per stage. Each stage file holds a `row_id` column plus only the columns that stage
+    added, so a stage appends its columns without rewriting the large context texts, and
+    readers can memory-map just the columns they need (for example the metric columns for
+    scoring). List columns such as `References` are stored as real list<string> columns.
+    """
+
+    def __init__(self, root='results'):
+        self.root = root
+
+    def stage_path(self, config_name, stage):
+        return os.path.join(self.root, config_name, f"{stage}.parquet")
+
+    def stages(self, config_name):
+        """
+        Returns the stages stored for a config in pipeline order, followed by any extra stages.
+        """
+        directory = os.path.join(self.root, config_name)
+        if not os.path.isdir(directory):
+            return []
+        found = [name[:-len('.parquet')] for name in os.listdir(directory) if name.endswith('.parquet')]
+        return sorted(found, key=lambda stage: (stage_order.index(stage) if stage in stage_order else len(stage_order), stage))
+
+    def configs(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if self.stages(name))
+
+    def write_stage(self, config_name, stage, row_ids, columns):
+        """
+        Writes (or replaces) the Parquet file of one stage.
+
+        Parameters:
+            config_name (str): Benchmark config, e.g. 'hard-reasoning-de'.
+            stage (str): Stage name; new stages such as 'scored' may be added freely.
+            row_ids (list): Row IDs in row order, shared by all stages of the config.
+            columns (dict): Column name -> list of values in row order.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        arrays = {'row_id': pa.array(row_ids, type=pa.string())}
+        for name, values in columns.items():
+            arrays[name] = values if isinstance(values, (pa.Array, pa.ChunkedArray)) else column_array(name, values)
+        path = self.stage_path(config_name, stage)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(pa.table(arrays), path + '.tmp', compression='zstd')
+        os.replace(path + '.tmp', path)
+
+    def write_rows(self, config_name, fieldnames, rows):
+        """
+        Splits result rows (as read from one of the pipeline CSVs) into their stage files.
+        """
+        row_ids = assign_row_ids(rows)
+        claimed = {column for columns in stage_columns.values() for column in columns}
+        grouped = {'prepared': [name for name in fieldnames if name not in claimed]}
+        for stage, columns in stage_columns.items():
+            grouped[stage] = [name for name in columns if name in fieldnames]
+        for stage, columns in grouped.items():
+            if columns:
+                self.write_stage(config_name, stage, row_ids, {name: [row.get(name) for row in rows] for name in columns})
+
+    def import_csv(self, config_name, csv_path):
+        fieldnames, rows = read_csv_rows(csv_path)
+        self.write_rows(config_name, fieldnames, rows)
+        logging.info(f"Imported {len(rows)} rows of {csv_path} into {os.path.join(self.root, config_name)}")
+
+    def read(self, config_name, columns=None):
+        """
+        Reads a config as one Arrow table, loading only the stage files (and columns) needed.
+
+        Parameters:
+            config_name (str): Benchmark config.
+            columns (list or None): Columns to load; None loads everything.
+
+        Returns:
+            pyarrow.Table: The requested columns plus `row_id`, in row order.
+        """
+        import pyarrow.parquet as pq
+
+        table = None
+        for stage in self.stages(config_name):
+            path = self.stage_path(config_name, stage)
+            available = [name for name in pq.read_schema(path).names if name != 'row_id']
+            wanted = available if columns is None else [name for name in available if name in columns]
+            if not wanted:
+                continue
+            stage_table = pq.read_table(path, columns=['row_id'] + wanted, memory_map=True)
+            if table is None:
+                table = stage_table
+                continue
+            if not table.column('row_id').equals(stage_table.column('row_id')):
+                raise ValueError(f"Stage '{stage}' of {config_name} is not aligned with the earlier stages")
+            for name in wanted:
+                if name in table.column_names:
+                    table = table.drop([name])
+                table = table.append_column(name, stage_table.column(name))
+        if table is None:
+            raise FileNotFoundError(f"No stored results for {config_name} in {self.root}")
+        missing = [name for name in columns or [] if name not in table.column_names]
+        if missing:
+            logging.warning(f"Columns {missing} are not stored for {config_name}")
+        return table
+
+    def read_pandas(self, config_name, columns=None):
+        return self.read(config_name, columns).to_pandas()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Import CSV results into the Parquet result store or inspect it.")
+    parser.add_argument("--root", default="results")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Import judged CSVs (extracted_judged_evaluated_<config>_test.csv)")
+    import_parser.add_argument("--judged-dir", default=os.path.join("evaluated", "judged"))
+    show_parser = subparsers.add_parser("show", help="Print the stored columns of a config")
+    show_parser.add_argument("config")
+    show_parser.add_argument("--columns", nargs="+")
+    args = parser.parse_args()
+
+    store = ResultStore(args.root)
+    if args.command == "import":
+        for csv_path in glob.glob(os.path.join(args.judged_dir, 'extracted_judged_evaluated_*_test.csv')):
+            config_name = os.path.basename(csv_path)[len('extracted_judged_evaluated_'):-len('_test.csv')]
+            store.import_csv(config_name, csv_path)
+    else:
+        table = store.read(args.config, args.columns)
+        print(table.schema)
+        print(f"{table.num_rows} rows in stages {store.stages(args.config)}")
@@ -0,0 +1,432 @@
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from checkpoint import is_shard_file
+from extraction import extraction_metric_columns
+from generation_engine import latency_columns
+from tasks import task_for
+
+ordered_configs = [
+    'hard-reasoning-de',
+    'hard-reasoning-en',
+    'hard-qa-with-multiple-references',
+    'summarize-meeting-attendee-topic',
+    'summarize-meeting-topic',
+]
+
+metric_column_map = {
+    'Language Quality': 'language_quality',
+    'Overall Correctness': 'overall_correctness',
+    'Instruction Following': 'instruction_following',
+    'Overall Correctness Binary Score': 'overall_correctness_binary_score',
+    'Constrains Adherence': 'constrains_adherence',
+    'Logical Consistency': 'logical_consistency',
+    'Final Solution Correctness': 'final_solution_correctness',
+    'Weighted Overall Score': 'weighted_overall_score'
+}
+
+full_metrics = list(metric_column_map)
+
+# Latency of the model under test, reported next to the quality scores when responses were streamed
+latency_metrics = {
+    'TTFT p50 (s)': ('ttft_seconds', 0.5),
+    'TTFT p95 (s)': ('ttft_seconds', 0.95),
+    'Inter-Token Latency p50 (s)': ('inter_token_latency_seconds', 0.5),
+    'Total Latency p50 (s)': ('total_latency_seconds', 0.5),
+    'Total Latency p95 (s)': ('total_latency_seconds', 0.95),
+    'Output Tokens/s p50': ('output_tokens_per_second', 0.5),
+}
+
+# Regex-based extraction metrics (see extraction.py), averaged per task next to the judge scores
+extraction_metrics = {
+    'Reference Precision': 'reference_precision',
+    'Reference Recall': 'reference_recall',
+    'Reference F1': 'reference_f1',
+    'Time Difference Accuracy': 'time_difference_accuracy',
+    'Extraction Recall': 'extraction_recall',
+    'Context Recall': 'context_recall',
+}
+
+
+def config_from_file(file_name):
+    """
+    Returns the benchmark config of a judged or weighted file name, e.g.
+    'extracted_judged_evaluated_hard-reasoning-de_test_weighted.csv' -> 'hard-reasoning-de'.
+    """
+    return file_name.split('_evaluated')[1].split('_test')[0].lstrip('_')
+
+
+def weighted_sum(df, weights):
+    """
+    Plain weighted sum of the weight columns; a NaN in any weighted column gives NaN.
+    """
+    total = 0
+    for metric, weight in weights.items():
+        total = total + df[metric] * weight
+    return total
+
+
+def build_weighted_frame(df, config_name):
+    """
+    Vectorized version of the notebook cell that turns a judged file into its _weighted file:
+    drops all-zero and failed rows, adds the binary reference score for tasks with references
+    and computes overall_score and the first weighted_overall_score with the task's weights.
+
+    Parameters:
+        df (pd.DataFrame): Judged rows of one config.
+        config_name (str): Benchmark config of the rows.
+
+    Returns:
+        pd.DataFrame: The filtered frame with the added score columns.
+    """
+    # Exclude rows where all specified columns are 0
+    df = df.loc[~((df['language_quality'] == 0) & (df['overall_correctness'] == 0) & (df['instruction_following'] == 0))]
+    df = df.loc[~(df['model_generated_output'] == 'Error generating response')].copy()
+
+    task = task_for(config_name)
+    if task.references:
+        df['overall_correctness_binary_score'] = np.where(df['References'] == df['model_References'], 100, 0)
+        df['overall_score'] = df[['language_quality', 'overall_correctness', 'instruction_following', 'overall_correctness_binary_score']].mean(axis=1)
+    else:
+        df['overall_score'] = df[['language_quality', 'overall_correctness', 'instruction_following']].mean(axis=1)
+
+    df['weighted_overall_score'] = weighted_sum(df, task.weights)
+    return df
+
+
+def compute_weighted_scores(values, weights, threshold_variable, reasoning):
+    """
+    Vectorized compute_weighted_score of the notebook for all rows that share one weight dict.
+
+    Rows whose final_solution_correctness is below the threshold (reasoning only) are scored
+    by logical_consistency alone. For all other rows the weight of every NaN metric is moved
+    to overall_correctness before the weighted mean is taken. Sums are accumulated in the
+    order of the weight dict so the floats match the row-wise implementation exactly.
+
+    Parameters:
+        values (pd.DataFrame): Metric columns of the rows; missing metrics may be absent.
+        weights (dict): Metric name -> weight, in the notebook's order.
+        threshold_variable (float): final_solution_correctness threshold.
+        reasoning (bool): Whether the rows come from a reasoning config.
+
+    Returns:
+        (np.ndarray, np.ndarray): The scores, and the mask of rows below the threshold.
+    """
+    n = len(values)
+
+    def column(metric):
+        if metric in values.columns:
+            return values[metric].to_numpy(dtype=float)
+        return np.full(n, np.nan)
+
+    # Case 2: redistribute the weight of NaN metrics into overall_correctness
+    row_weights = {metric: np.full(n, float(weight)) for metric, weight in weights.items()}
+    row_weights.setdefault('overall_correctness', np.zeros(n))
+    for metric in weights:
+        missing = np.isnan(column(metric))
+        row_weights['overall_correctness'] = np.where(missing, row_weights['overall_correctness'] + row_weights[metric], row_weights['overall_correctness'])
+        row_weights[metric] = np.where(missing, 0, row_weights[metric])
+
+    total_score = np.zeros(n)
+    total_weight = np.zeros(n)
+    for metric, weight in row_weights.items():
+        total_weight = total_weight + weight
+        value = column(metric)
+        total_score = total_score + np.where(np.isnan(value), 0, value * weight)
+    total_weight = np.where(total_weight == 0, 1, total_weight)  # avoid division by zero
+    scores = total_score / total_weight
+
+    # Case 1: reasoning rows below the threshold are scored by logical_consistency only
+    below_threshold = np.zeros(n, dtype=bool)
+    if reasoning:
+        below_threshold = column('final_solution_correctness') < threshold_variable
+        logical_weight = weights.get('logical_consistency', 0)
+        logical = column('logical_consistency')
+        logical_score = np.where(np.isnan(logical), 0, logical * logical_weight) if logical_weight else np.zeros(n)
+        scores = np.where(below_threshold, logical_score, scores)
+    return scores, below_threshold
+
+
+def score_frames(frames, threshold_variable=70):
+    """
+    Scores the weighted frames of all configs at once and aggregates them into the
+    leaderboard table of the notebook.
+
+    Parameters:
+        frames (dict): Config name -> weighted frame (see build_weighted_frame).
+        threshold_variable (float): final_solution_correctness threshold of the reasoning configs.
+
+    Returns:
+        (dict, pd.DataFrame): The scored frames per config, and one row per config with the
+        average of every metric (NaN where a metric does not apply), columns 'Task' + full_metrics.
+    """
+    # Configs scored alike are computed together; (reasoning, weights) -> [(config, frame)]
+    groups = {}
+    for config_name, df in frames.items():
+        # Drop rows where overall_correctness is NaN
+        df = df.dropna(subset=['overall_correctness']).copy()
+        task = task_for(config_name)
+        groups.setdefault((task.reasoning, tuple(task.score_weights.items())), []).append((config_name, df))
+
+    scored = {}
+    # The reasoning configs first
+    for (reasoning, weights), members in sorted(groups.items(), key=lambda group: not group[0][0]):
+        weights = dict(weights)
+        metric_names = list(dict.fromkeys(list(weights) + ['overall_correctness', 'logical_consistency', 'final_solution_correctness']))
+        combined = pd.concat([df.reindex(columns=metric_names) for _, df in members], ignore_index=True)
+        scores, below_threshold = compute_weighted_scores(combined, weights, threshold_variable, reasoning)
+
+        offset = 0
+        for config_name, df in members:
+            rows = slice(offset, offset + len(df))
+            offset += len(df)
+            df['weighted_overall_score'] = scores[rows]
+            if reasoning and below_threshold[rows].any():
+                # Zero out all metrics except logical_consistency
+                for metric in weights:
+                    if metric in df.columns and metric != 'logical_consistency':
+                        df.loc[below_threshold[rows], metric] = 0
+            scored[config_name] = df
+
+    results = {}
+    for config_name in sorted(scored, key=lambda c: ordered_configs.index(c) if c in ordered_configs else len(ordered_configs)):
+        df = scored[config_name]
+        available = [metric_column_map[m] for m in task_for(config_name).metrics if metric_column_map[m] in df.columns]
+        averages = df[available].mean()
+        results[config_name] = [averages[metric_column_map[m]] if metric_column_map[m] in averages.index else np.nan for m in full_metrics]
+
+    results_df = pd.DataFrame(results).T.reset_index()
+    results_df.columns = ['Task'] + full_metrics
+    return scored, results_df
+
+
+def row_weighted_scores(df, config_name, threshold_variable=70):
+    """
+    Scores judged rows one config at a time, e.g. rows held in memory by a running
+    evaluation. Score columns may still be strings or error markers.
+
+    Returns:
+        pd.Series: weighted_overall_score of the rows the leaderboard counts, indexed like `df`;
+        the leaderboard's Weighted Overall Score is their mean.
+    """
+    if df.empty:
+        return pd.Series(dtype=float)
+    df = df.copy()
+    for column in set(metric_column_map.values()) & set(df.columns):
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+    scored, _ = score_frames({config_name: build_weighted_frame(df, config_name)}, threshold_variable)
+    return scored[config_name]['weighted_overall_score']
+
+
+def bootstrap_ci(values, strata=None, shares=None, resamples=2000, confidence=0.95, seed=0, max_cells=4_000_000):
+    """
+    Percentile bootstrap confidence interval of a mean, vectorized over the resamples. With
+    `strata` the rows are resampled within their stratum and the stratum means are combined
+    with `shares` (stratum -> population share, defaults to the sample shares).
+
+    Parameters:
+        values (array-like): One value per row.
+        strata (array-like): Optional stratum label per row.
+        shares (dict): Optional population share per stratum; strata without rows are left out.
+        resamples (int): Number of bootstrap resamples.
+        confidence (float): Coverage of the interval.
+        seed (int): Seed of the resampling, so reruns give the same interval.
+        max_cells (int): Resample indices drawn at once; bounds the memory use for large samples.
+
+    Returns:
+        (float, float, float): Point estimate, lower and upper bound; NaN for an empty sample.
+    """
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return np.nan, np.nan, np.nan
+    labels, codes = np.unique(np.zeros(len(values)) if strata is None else np.asarray(strata), return_inverse=True)
+    weights = np.array([shares.get(label, 0.0) for label in labels] if shares else np.bincount(codes), dtype=float)
+    weights = weights / weights.sum()
+
+    rng = np.random.default_rng(seed)
+    estimate = 0.0
+    means = np.zeros(resamples)
+    for k, weight in enumerate(weights):
+        stratum = values[codes == k]
+        estimate += weight * stratum.mean()
+        chunk = max(1, max_cells // len(stratum))
+        for start in range(0, resamples, chunk):
+            count = min(chunk, resamples - start)
+            means[start:start + count] += weight * stratum[rng.integers(0, len(stratum), size=(count, len(stratum)))].mean(axis=1)
+    low, high = np.quantile(means, [(1 - confidence) / 2, (1 + confidence) / 2])
+    return float(estimate), float(low), float(high)
+
+
+def grouped_bootstrap(values, groups, resamples=1000, seed=0, max_cells=4_000_000):
+    """
+    Bootstrap of the column means of many samples at once, e.g. every metric of every task
+    of every model. The rows of each group are resampled within the group, with the same
+    draws for all columns; a NaN leaves the row out of that column's mean. The draws of all
+    groups are made together as row counts, so each group costs one small matrix product
+    per chunk of resamples.
+
+    Parameters:
+        values (array-like): Rows x columns.
+        groups (array-like): Group label per row.
+        resamples (int): Number of bootstrap resamples.
+        seed (int): Seed of the resampling.
+        max_cells (int): Resample draws made at once; bounds the memory use.
+
+    Returns:
+        (np.ndarray, np.ndarray, np.ndarray): The group labels, the means (groups x columns)
+        and the resampled means (resamples x groups x columns).
+    """
+    values = np.asarray(values, dtype=float)
+    labels, codes = np.unique(np.asarray(groups), return_inverse=True)
+    order = np.argsort(codes, kind='stable')
+    values, codes = values[order], codes[order]
+    sizes = np.bincount(codes, minlength=len(labels))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    valid = ~np.isnan(values)
+    # Sums and counts of the valid values in one matrix, so a product gives both
+    sums_counts = np.concatenate([np.where(valid, values, 0), valid], axis=1)
+    columns = values.shape[1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        totals = np.add.reduceat(sums_counts, starts, axis=0)
+        means = totals[:, :columns] / totals[:, columns:]
+
+        rng = np.random.default_rng(seed)
+        resampled = np.empty((resamples, len(labels), columns))
+        n = len(values)
+        chunk = max(1, max_cells // max(n, 1))
+        for start in range(0, resamples, chunk):
+            count = min(chunk, resamples - start)
+            draws = starts[codes] + rng.integers(0, sizes[codes], size=(count, n))
+            weights = np.bincount((np.arange(count)[:, None] * n + draws).ravel(), minlength=count * n).reshape(count, n)
+            for k in range(len(labels)):
+                rows = slice(starts[k], starts[k] + sizes[k])
+                totals = weights[:, rows] @ sums_counts[rows]
+                resampled[start:start + count, k] = totals[:, :columns] / totals[:, columns:]
+    return labels, means, resampled
+
+
+def latency_summary(frames):
+    """
+    Per-config latency percentiles of the frames that carry the streamed latency_columns.
+
+    Returns:
+        pd.DataFrame: One row per config with 'Task' + latency_metrics; empty if no frame was streamed.
+    """
+    results = {}
+    for config_name, df in frames.items():
+        if not set(latency_columns) & set(df.columns):
+            continue
+        results[config_name] = {
+            name: pd.to_numeric(df[column], errors='coerce').quantile(q) if column in df.columns else np.nan
+            for name, (column, q) in latency_metrics.items()
+        }
+    if not results:
+        return pd.DataFrame()
+    return pd.DataFrame.from_dict(results, orient='index').rename_axis('Task').reset_index()
+
+
+def load_judged_frames(judged_dir, exclude=()):
+    frames = {}
+    for file_name in sorted(os.listdir(judged_dir)):
+        if not file_name.endswith('.csv') or file_name in exclude or '_evaluated' not in file_name or is_shard_file(file_name):
+            continue
+        frames[config_from_file(file_name)] = pd.read_csv(os.path.join(judged_dir, file_name), sep=';')
+    return frames
+
+
+def extraction_summary(frames):
+    """
+    Per-config means of the extraction_metric_columns, ignoring rows without a target to compare.
+
+    Returns:
+        pd.DataFrame: One row per config with 'Task' + extraction_metrics; empty if no frame has the columns.
+    """
+    results = {}
+    for config_name, df in frames.items():
+        if not set(extraction_metric_columns) & set(df.columns):
+            continue
+        results[config_name] = {
+            name: pd.to_numeric(df[column], errors='coerce').mean() if column in df.columns else np.nan
+            for name, column in extraction_metrics.items()
+        }
+    if not results:
+        return pd.DataFrame()
+    return pd.DataFrame.from_dict(results, orient='index').rename_axis('Task').reset_index()
+
+
+def add_summaries(results_df, judged):
+    """
+    Merges the extraction metrics and, for streamed runs, the latency percentiles of the
+    judged frames into the leaderboard table.
+    """
+    for summary in (extraction_summary(judged), latency_summary(judged)):
+        if not summary.empty:
+            results_df = results_df.merge(summary, on='Task', how='left')
+    return results_df
+
+
+def score_judged(judged, weighted_dir, threshold_variable=70):
+    """
+    Writes the _weighted.csv file of every judged frame into `weighted_dir` and returns the
+    leaderboard table with the extraction metrics and, for streamed runs, the latency merged in.
+    """
+    os.makedirs(weighted_dir, exist_ok=True)
+    weighted = {}
+    for config_name, df in judged.items():
+        weighted[config_name] = build_weighted_frame(df, config_name)
+        output_file = os.path.join(weighted_dir, f"extracted_judged_evaluated_{config_name}_test_weighted.csv")
+        weighted[config_name].to_csv(output_file, index=False, sep=';')
+        logging.info(f"Saved {output_file}")
+
+    _, results_df = score_frames(weighted, threshold_variable)
+    return add_summaries(results_df, judged)
+
+
+def load_store_frames(store):
+    """
+    Loads the judged columns needed for scoring from a ResultStore, skipping the contexts.
+    List columns are rendered like the CSV files so reference comparison behaves the same.
+    """
+    columns = ['References', 'model_References', 'model_generated_output', 'language_quality', 'overall_correctness',
+               'instruction_following', 'constrains_adherence', 'logical_consistency', 'final_solution_correctness']
+    frames = {}
+    for config_name in store.configs():
+        df = store.read_pandas(config_name, columns)
+        for name in ('References', 'model_References'):
+            if name in df.columns:
+                df[name] = df[name].map(lambda v: str(list(v)) if v is not None else np.nan)
+        frames[config_name] = df
+    return frames
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Compute weighted scores and the per-task leaderboard from judged results.")
+    parser.add_argument("--judged-dir", default=os.path.join("evaluated", "judged"))
+    parser.add_argument("--weighted-dir", default=os.path.join("evaluated", "weighted"),
+                        help="Where to write the _weighted.csv files read by the notebook")
+    parser.add_argument("--result-store", help="Read the judged results from this Parquet result store instead of CSVs")
+    parser.add_argument("--threshold", type=float, default=70)
+    parser.add_argument("--output-json", help="Write the leaderboard table as JSON")
+    args = parser.parse_args()
+
+    if args.result_store:
+        from result_store import ResultStore
+        judged = load_store_frames(ResultStore(args.result_store))
+    else:
+        judged = load_judged_frames(args.judged_dir)
+
+    results_df = score_judged(judged, args.weighted_dir, args.threshold)
+    pd.options.display.float_format = '{:.3f}'.format
+    print(results_df.to_string(index=False))
+
+    if args.output_json:
+        with open(args.output_json, mode='w', encoding='utf-8') as f:
+            json.dump(json.loads(results_df.to_json(orient='records')), f, indent=2)
@@ -0,0 +1,174 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import subprocess
+import sys
+
+from checkpoint import iter_csv_rows, iter_row_ids, read_csv_rows, shard_of, shard_path, write_csv_rows_atomic
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+# stage -> (script, input directory, output directory, (input prefix, output prefix)), as in the scripts' main loops
+stages = {
+    'generation': ('evaluate_model.py', 'prepared', 'evaluated', ('prepared_', 'evaluated_')),
+    'judge': ('evaluate_by_judge.py', os.path.join('evaluated', 'extracted'), os.path.join('evaluated', 'judged'), ('evaluated_', 'judged_evaluated_')),
+}
+
+
+def stage_files(stage):
+    """
+    Returns the (input, canonical output) CSV paths of a stage.
+    """
+    _, input_dir, output_dir, (old, new) = stages[stage]
+    return [(input_csv_path, os.path.join(output_dir, os.path.basename(input_csv_path).replace(old, new)))
+            for input_csv_path in sorted(glob.glob(os.path.join(input_dir, '*.csv')))]
+
+
+def merge_shards(input_csv_path, output_csv_path, shard_count):
+    """
+    Reassembles the shard files of one output into the canonical file, in the row order of
+    the input. Nothing is written if a shard is missing or unfinished, if a row is missing,
+    duplicated or in the wrong shard, or if a shard holds rows that are not in the input.
+
+    Returns:
+        list: Problems found; empty if the merged file was written.
+    """
+    input_ids = [rid for rid, _ in iter_row_ids(iter_csv_rows(input_csv_path))]
+    problems = []
+    fieldnames = None
+    merged = {}
+    for index in range(shard_count):
+        path = shard_path(output_csv_path, (index, shard_count))
+        if not os.path.exists(path):
+            problems.append(f"missing shard file {path}")
+            continue
+        if os.path.exists(path + '.ckpt'):
+            problems.append(f"shard {path} is unfinished (checkpoint present)")
+        shard_fieldnames, rows = read_csv_rows(path)
+        fieldnames = fieldnames or shard_fieldnames
+        if shard_fieldnames != fieldnames:
+            problems.append(f"shard {path} has different columns")
+        for rid, row in iter_row_ids(rows):
+            if shard_of(rid, shard_count) != index:
+                problems.append(f"row {rid} of {path} belongs to shard {shard_of(rid, shard_count)}")
+            if rid in merged:
+                problems.append(f"duplicate row {rid} in {path}")
+            merged[rid] = row
+
+    missing = [rid for rid in input_ids if rid not in merged]
+    known = set(input_ids)
+    extra = set(merged) - known
+    # A row written twice to its shard comes back as '<id>#n' of an input row
+    repeated = sorted(rid for rid in extra if rid.split('#', 1)[0] in known)
+    extra -= set(repeated)
+    if missing:
+        problems.append(f"{len(missing)} rows missing, e.g. {missing[:5]}")
+    if repeated:
+        problems.append(f"{len(repeated)} duplicate rows, e.g. {repeated[:5]}")
+    if extra:
+        problems.append(f"{len(extra)} rows not in {input_csv_path}, e.g. {sorted(extra)[:5]}")
+    if problems:
+        for problem in problems:
+            logging.error(f"{output_csv_path}: {problem}")
+        return problems
+
+    write_csv_rows_atomic(output_csv_path, fieldnames, [merged[rid] for rid in input_ids])
+    logging.info(f"Merged {shard_count} shards into {output_csv_path} ({len(input_ids)} rows)")
+    return []
+
+
+def merge_stage(stage, shard_count, remove_shards=False):
+    """
+    Merges the shards of every file of a stage.
+
+    Returns:
+        dict: Canonical output path -> problems (empty lists for merged files).
+    """
+    results = {}
+    for input_csv_path, output_csv_path in stage_files(stage):
+        results[output_csv_path] = merge_shards(input_csv_path, output_csv_path, shard_count)
+        if remove_shards and not results[output_csv_path]:
+            for index in range(shard_count):
+                os.remove(shard_path(output_csv_path, (index, shard_count)))
+    return results
+
+
+def run_local(stage, shard_count, extra_args=()):
+    """
+    Runs the stage script once per shard as parallel local processes and waits for all of
+    them. RPM_LIMIT and TPM_LIMIT are split between the processes so that together they stay
+    within the provider quota.
+
+    Returns:
+        list: Exit codes in shard order.
+    """
+    script = os.path.join(repo_dir, stages[stage][0])
+    env = dict(os.environ)
+    for name, default in (("RPM_LIMIT", 500), ("TPM_LIMIT", 200000)):
+        env[name] = str(max(1, int(os.getenv(name, default)) // shard_count))
+
+    processes = []
+    for index in range(shard_count):
+        log_path = f"{stage}.shard-{index}-of-{shard_count}.log"
+        log = open(log_path, mode='w', encoding='utf-8')
+        command = [sys.executable, script, '--shard', f"{index}/{shard_count}", *extra_args]
+        processes.append((subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT), log, log_path))
+        logging.info(f"Started shard {index}/{shard_count} of {stage}, logging to {log_path}")
+
+    codes = []
+    for process, log, log_path in processes:
+        codes.append(process.wait())
+        log.close()
+        if codes[-1] != 0:
+            logging.error(f"Shard process exited with {codes[-1]}, see {log_path}")
+    return codes
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Run generation or judging in shards and merge the shard files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("merge", "Merge the shard files of a stage into the canonical per-config files"),
+                            ("run", "Run every shard of a stage as a local process, then merge")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("--stage", choices=list(stages), required=True)
+        sub.add_argument("--shards", type=int, required=True, help="Number of shards N")
+        sub.add_argument("--remove-shards", action="store_true", help="Delete the shard files after a clean merge")
+        sub.add_argument("--weighted-dir", default=os.path.join("evaluated", "weighted"))
+        sub.add_argument("--threshold", type=float, default=70)
+        sub.add_argument("--result-store", help="Import the merged judged files into this Parquet result store")
+        sub.add_argument("--no-score", action="store_true", help="Do not score after merging the judge stage")
+    args, extra_args = parser.parse_known_args()
+    if extra_args and args.command != "run":
+        parser.error(f"unrecognized arguments: {' '.join(extra_args)}")
+
+    if args.command == "run":
+        # Arguments not known here (e.g. --stream, --batch local) are passed on to the stage script
+        if any(run_local(args.stage, args.shards, extra_args)):
+            sys.exit(1)
+
+    results = merge_stage(args.stage, args.shards, args.remove_shards)
+    if not results:
+        logging.warning(f"No input files found for stage {args.stage}")
+    if any(results.values()):
+        print(json.dumps({path: problems for path, problems in results.items() if problems}, indent=2))
+        sys.exit(1)
+
+    if args.stage == 'judge':
+        if args.result_store:
+            from result_store import ResultStore
+            store = ResultStore(args.result_store)
+            for output_csv_path in results:
+                config_name = os.path.basename(output_csv_path)[len('extracted_judged_evaluated_'):-len('_test.csv')]
+                store.import_csv(config_name, output_csv_path)
+        if not args.no_score:
+            import pandas as pd
+            from scoring import load_judged_frames, score_judged
+
+            judged_dir = stages['judge'][2]
+            results_df = score_judged(load_judged_frames(judged_dir), args.weighted_dir, args.threshold)
+            pd.options.display.float_format = '{:.3f}'.format
+            print(results_df.to_string(index=False))
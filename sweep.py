@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+import evaluate_by_judge
+import evaluate_model
+from backends import Backend, add_backend_arguments, close_backends, load_backend_configs
+from generation_engine import AdaptiveRateLimiter, PrioritySemaphore
+from instrumentation import metrics
+from judge_cascade import add_cascade_arguments
+from pipeline import StreamingPipeline, config_names
+
+
+def parse_target(spec):
+    """
+    Parses a command line target of the form 'model' or 'model@http://host:port/v1'.
+    """
+    model, _, api_base = spec.partition('@')
+    return {"name": model.replace('/', '_'), "model": model, "api_base": api_base or None}
+
+
+def load_targets(path):
+    """
+    Loads sweep targets from a JSON list. Every entry is a backend config (see
+    Backend.from_config): it needs a 'model' and may set 'api_base', 'api_key_env' (name of
+    the environment variable holding the key), 'server', 'params' (overrides of
+    evaluate_model.generation_params and the model presets), 'http2', 'max_connections',
+    'max_concurrency', 'requests_per_minute' and 'tokens_per_minute', plus a 'name'.
+    """
+    with open(path, encoding='utf-8') as f:
+        targets = json.load(f)
+    for target in targets:
+        target.setdefault("name", target["model"].replace('/', '_'))
+    return targets
+
+
+class Endpoint:
+    """
+    Concurrency slots and rate limiter of one inference endpoint, shared by all targets on it.
+    """
+
+    def __init__(self, max_concurrency, requests_per_minute, tokens_per_minute):
+        self.slots = PrioritySemaphore(max_concurrency)
+        self.limiter = AdaptiveRateLimiter(requests_per_minute, tokens_per_minute)
+
+
+def make_generate(target, endpoint, global_slots):
+    backend = Backend.from_config(target, evaluate_model.generation_params)
+
+    async def generate(system, instruction, timings=None, priority=0):
+        # Take the endpoint slot first so a slow endpoint queues on its own limit
+        # instead of holding global slots the other targets could use
+        async with endpoint.slots.slot(priority):
+            async with global_slots.slot(priority):
+                return await evaluate_model.agenerate_model_responses(
+                    system, instruction, endpoint.limiter, target=backend, timings=timings)
+
+    return generate
+
+
+async def run_sweep(targets, configs, input_dir, sweep_dir, global_concurrency=64, judge_concurrency=100, stream=False):
+    """
+    Generates and judges every (target, config) combination from one pool of work.
+    Generation is bounded by a global budget and by the limit of each endpoint; judging
+    shares one judge budget across all targets. The configs are scheduled longest-first like
+    in the pipeline. With `stream` the responses are streamed and their latency is recorded per row.
+
+    Returns:
+        dict: target name -> {config: rows processed}.
+    """
+    pipeline = StreamingPipeline(input_dir, judge_concurrency=judge_concurrency, stream=stream)
+    global_slots = PrioritySemaphore(global_concurrency)
+    judge_slots = PrioritySemaphore(judge_concurrency)
+
+    endpoints = {}
+    generators = {}
+    for target in targets:
+        key = target.get("api_base") or "default"
+        if key not in endpoints:
+            on_endpoint = [t for t in targets if (t.get("api_base") or "default") == key]
+            endpoints[key] = Endpoint(
+                min(t.get("max_concurrency", evaluate_model.max_concurrency) for t in on_endpoint),
+                min(t.get("requests_per_minute", evaluate_model.requests_per_minute) for t in on_endpoint),
+                min(t.get("tokens_per_minute", evaluate_model.tokens_per_minute) for t in on_endpoint),
+            )
+        generators[target["name"]] = make_generate(target, endpoints[key], global_slots)
+
+    jobs = []
+    for config_name, window in pipeline.schedule(configs):
+        for target in targets:
+            jobs.append((target["name"], config_name,
+                         pipeline.run_config(config_name, generators[target["name"]], judge_slots,
+                                             output_dir=os.path.join(sweep_dir, target["name"]), window=window)))
+
+    try:
+        counts = await asyncio.gather(*(job for _, _, job in jobs))
+    finally:
+        await close_backends()
+    summary = {}
+    for (name, config_name, _), count in zip(jobs, counts):
+        summary.setdefault(name, {})[config_name] = count
+    return summary
+
+
+def build_leaderboard(targets, sweep_dir, threshold_variable=70):
+    """
+    Scores the judged files of every target and combines the per-task averages into one table,
+    together with the extraction metrics and the latency of the model under test if the sweep
+    was streamed.
+    """
+    import pandas as pd
+    from scoring import add_summaries, build_weighted_frame, load_judged_frames, score_frames
+
+    tables = []
+    for target in targets:
+        judged_dir = os.path.join(sweep_dir, target["name"], 'judged')
+        if not os.path.isdir(judged_dir):
+            logging.warning(f"No judged results for {target['name']}")
+            continue
+        judged = load_judged_frames(judged_dir)
+        weighted = {config_name: build_weighted_frame(df, config_name) for config_name, df in judged.items()}
+        _, results_df = score_frames(weighted, threshold_variable)
+        results_df = add_summaries(results_df, judged)
+        results_df.insert(0, 'Model', target["name"])
+        tables.append(results_df)
+    return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate, judge and score several models in one sweep.")
+    parser.add_argument("--targets", help="JSON file with the sweep targets")
+    parser.add_argument("--target", action="append", default=[], help="Target as model or model@api_base (repeatable)")
+    parser.add_argument("--configs", nargs="+", default=config_names, choices=config_names)
+    parser.add_argument("--input-dir", default=".", help="Directory with the downloaded <config>_test.csv files")
+    parser.add_argument("--sweep-dir", default="sweeps")
+    parser.add_argument("--global-concurrency", type=int, default=64)
+    parser.add_argument("--judge-concurrency", type=int, default=100)
+    parser.add_argument("--threshold", type=float, default=70)
+    parser.add_argument("--stream", action="store_true", help="Stream the responses and add their latency to the leaderboard")
+    add_cascade_arguments(parser)
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    # The targets are the generation backends
+    evaluate_by_judge.set_backend(load_backend_configs(args.backends).get('judge'))
+    evaluate_by_judge.set_cascade(args.cascade_model, args.uncertainty_band, args.audit_rate)
+
+    targets = (load_targets(args.targets) if args.targets else []) + [parse_target(spec) for spec in args.target]
+    if not targets:
+        parser.error("give at least one target with --targets or --target")
+
+    start = time.monotonic()
+    summary = asyncio.run(run_sweep(targets, args.configs, args.input_dir, args.sweep_dir,
+                                    args.global_concurrency, args.judge_concurrency, args.stream))
+    logging.info(f"Sweep finished in {time.monotonic() - start:.1f}s: {summary}")
+
+    leaderboard = build_leaderboard(targets, args.sweep_dir, args.threshold)
+    if not leaderboard.empty:
+        leaderboard.to_csv(os.path.join(args.sweep_dir, 'leaderboard.csv'), sep=';', index=False)
+        leaderboard.to_json(os.path.join(args.sweep_dir, 'leaderboard.json'), orient='records', indent=2)
+        print(leaderboard.pivot(index='Task', columns='Model', values='Weighted Overall Score').round(2).to_string())
+        if 'TTFT p50 (s)' in leaderboard.columns:
+            print(leaderboard.pivot(index='Task', columns='Model', values='TTFT p50 (s)').round(3).to_string())
+    evaluate_model.response_cache.report()
+    metrics.report()
+    metrics.export('sweep', os.path.join(args.sweep_dir, 'metrics'))
+    if evaluate_by_judge.judge_cascade:
+        evaluate_by_judge.judge_cascade.report()
+        evaluate_by_judge.judge_cascade.export('sweep', os.path.join(args.sweep_dir, 'metrics'))
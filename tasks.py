@@ -0,0 +1,137 @@
+import re
+
+from extraction import extraction_patterns, metric_columns, qa_reference_pattern
+
+judge_system_prompt = "You should respond in JSON format with the following keys: 'reasoning_of_metrics_and_correctness', 'language_quality', 'overall_correctness', 'instruction_following', 'overall_score'. The values should be a number between 0 and 100 except for the reasoning - here you should think about each metric and compare the target response and the generated response carefully together with the given context. You have to do your reasoning in english language."
+
+judge_reasoning_system_prompt = "You should respond in JSON format with the following keys: 'reasoning_of_metrics_and_correctness', 'language_quality', 'overall_correctness', 'instruction_following', 'constrains_adherence', 'logical_consistency', 'final_solution_correctness', 'overall_score'. The values should be a number between 0 and 100. EXCEPT For the reasoning_of_metrics_and_correctness - here you should think about each metric and compare the target response and the generated response carefully together with the given context and present your thinking as a text. You have to do your reasoning in english language."
+
+judge_score_keys = ['language_quality', 'overall_correctness', 'instruction_following', 'overall_score']
+
+judge_reasoning_score_keys = ['language_quality', 'overall_correctness', 'instruction_following', 'constrains_adherence', 'logical_consistency', 'final_solution_correctness', 'overall_score']
+
+# hard-qa-multiple-references
+weights_binary_correctness = {
+    'overall_correctness': 0.5,
+    'instruction_following': 0.2,
+    'overall_correctness_binary_score': 0.3,
+}
+
+weights_binary_language = {
+    'language_quality': 0.4,
+    'overall_correctness': 0.3,
+    'instruction_following': 0.15,
+    'overall_correctness_binary_score': 0.15,
+}
+
+weights_non_binary_correctness = {
+    'language_quality': 0,
+    'overall_correctness': 0.6,
+    'instruction_following': 0.4,
+}
+
+weights_non_binary_language = {
+    'language_quality': 0.4,
+    'overall_correctness': 0.4,
+    'instruction_following': 0.2,
+}
+# hard reasoning
+weights_reasoning = {
+    'constrains_adherence': 0.3,
+    'logical_consistency': 0.3,
+    'final_solution_correctness': 0.4
+}
+
+# Leaderboard metrics of a task
+reasoning_metrics = ['Constrains Adherence', 'Logical Consistency', 'Final Solution Correctness', 'Weighted Overall Score']
+non_reasoning_metrics = ['Overall Correctness', 'Instruction Following', 'Overall Correctness Binary Score', 'Weighted Overall Score']
+
+# Cost of a prompt token relative to a generated one; prefill is about ten times faster than decoding
+prompt_token_cost = 0.1
+
+
+class Task:
+    """
+    One benchmark config: how its rows are prepared, judged and scored, and what a row is
+    expected to cost. The scripts look the config up here instead of matching file names.
+
+    Parameters:
+        name (str): Config name, e.g. 'hard-reasoning-de'.
+        judge_prompt (str): System prompt of the judge.
+        score_keys (list): Scores the judge returns.
+        weights (dict): Metric -> weight of the weighted_overall_score of the _weighted file.
+        score_weights (dict): Metric -> weight of the leaderboard's Weighted Overall Score.
+        reasoning (bool): Rows below the final_solution_correctness threshold are scored by
+            logical_consistency alone.
+        reference_pattern (str): Regex of the context references cited in the target answer
+            and the model output; where set, their match is scored as overall_correctness_binary_score.
+        extraction (tuple): Names of the extraction_patterns whose metrics are computed for the
+            task's rows (see extraction.py); all of them by default.
+        output_tokens (int): Expected length of a generated response.
+        judge_tokens (int): Expected length of a judge verdict.
+    """
+
+    def __init__(self, name, judge_prompt, score_keys, weights, score_weights, reasoning=False,
+                 reference_pattern=None, extraction=tuple(extraction_patterns), output_tokens=250, judge_tokens=250):
+        self.name = name
+        self.judge_prompt = judge_prompt
+        self.score_keys = score_keys
+        self.weights = weights
+        self.score_weights = score_weights
+        self.reasoning = reasoning
+        self.reference_pattern = reference_pattern
+        self.reference_regex = re.compile(reference_pattern) if reference_pattern else None
+        self.extraction = tuple(extraction)
+        self.output_tokens = output_tokens
+        self.judge_tokens = judge_tokens
+
+    @property
+    def references(self):
+        return self.reference_regex is not None
+
+    @property
+    def extraction_metrics(self):
+        return metric_columns(self.extraction)
+
+    @property
+    def metrics(self):
+        return reasoning_metrics if self.reasoning else non_reasoning_metrics
+
+    def row_cost(self, row):
+        """
+        Expected cost of one row in generated-token equivalents: the model reads the prompt
+        and writes the response, then the judge reads prompt, target and response and writes
+        its verdict. Only the ratios between rows and tasks matter.
+        """
+        prompt_chars = len(row.get('System') or '') + len(row.get('Instruction') or '')
+        read_tokens = (2 * prompt_chars + len(row.get('Chosen') or '')) / 4 + self.output_tokens
+        return read_tokens * prompt_token_cost + self.output_tokens + self.judge_tokens
+
+
+# In download order; the meeting summaries have the longest contexts, the reasoning tasks the longest answers.
+# The QA answers cite references and time differences, the meeting summaries name IDs and context sections.
+tasks = {task.name: task for task in [
+    Task('summarize-meeting-attendee-topic', judge_system_prompt, judge_score_keys,
+         weights_non_binary_language, weights_binary_correctness, extraction=('extraction_id', 'context'), output_tokens=300),
+    Task('summarize-meeting-topic', judge_system_prompt, judge_score_keys,
+         weights_non_binary_language, weights_binary_correctness, extraction=('extraction_id', 'context'), output_tokens=300),
+    Task('hard-qa-with-multiple-references', judge_system_prompt, judge_score_keys,
+         weights_binary_language, weights_binary_correctness, reference_pattern=qa_reference_pattern,
+         extraction=('reference', 'time_difference'), output_tokens=200),
+    Task('hard-reasoning-de', judge_reasoning_system_prompt, judge_reasoning_score_keys,
+         weights_non_binary_correctness, weights_reasoning, reasoning=True, extraction=(), output_tokens=800, judge_tokens=450),
+    Task('hard-reasoning-en', judge_reasoning_system_prompt, judge_reasoning_score_keys,
+         weights_non_binary_correctness, weights_reasoning, reasoning=True, extraction=(), output_tokens=800, judge_tokens=450),
+]}
+
+task_names = list(tasks)
+
+
+def task_for(config_name):
+    """
+    Returns the task of a config; configs outside the registry are judged with the standard
+    prompt and scored like the meeting summaries.
+    """
+    if config_name in tasks:
+        return tasks[config_name]
+    return Task(config_name, judge_system_prompt, judge_score_keys, weights_non_binary_language, weights_binary_correctness)
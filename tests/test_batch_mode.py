@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+import evaluate_model
+from batch_mode import build_batch_request, parse_batch_output, read_jsonl, run_batch, write_jsonl
+from checkpoint import assign_row_ids, read_csv_rows, write_csv_rows_atomic
+from response_cache import ResponseCache
+
+
+def output_line(custom_id, content=None, status_code=200, error=None):
+    """
+    One line of a Batch API output file; a completion with `content` unless an error is given.
+    """
+    body = {'choices': [{'message': {'role': 'assistant', 'content': content}}]} if status_code == 200 else {'error': error}
+    return {'id': f"batch_req_{custom_id}", 'custom_id': custom_id, 'response': {'status_code': status_code, 'body': body},
+            'error': {'message': error} if error else None}
+
+
+class FakeBatchClient:
+    """
+    Batch client that answers every submitted request with `answer(request)` (an output
+    line or None to drop it) and returns the output lines in reverse order.
+    """
+
+    def __init__(self, answer, status='completed'):
+        self.answer = answer
+        self.batch_status = status
+        self.submitted = []
+
+    def submit(self, input_path):
+        self.submitted = read_jsonl(input_path)
+        return 'batch_1'
+
+    def status(self, batch_id):
+        return {'id': batch_id, 'status': self.batch_status}
+
+    def download(self, batch, output_path):
+        lines = [self.answer(request) for request in self.submitted]
+        write_jsonl(output_path, [line for line in reversed(lines) if line is not None])
+
+
+def test_build_batch_request():
+    messages = [{'role': 'user', 'content': 'Frage'}]
+    request = build_batch_request('row-1', 'gpt-4o-mini', messages, {'temperature': 0.01, 'model': 'ignored'})
+    assert request == {'custom_id': 'row-1', 'method': 'POST', 'url': '/v1/chat/completions',
+                       'body': {'temperature': 0.01, 'model': 'gpt-4o-mini', 'messages': messages}}
+    json.dumps(request)
+
+
+def test_parse_batch_output_maps_custom_ids_to_contents():
+    records = [
+        output_line('a', 'Antwort A'),
+        output_line('b', status_code=429, error='Rate limit reached'),
+        {'custom_id': 'c', 'response': None, 'error': {'message': 'expired'}},
+        {'custom_id': 'd', 'response': {'status_code': 200, 'body': {'choices': []}}, 'error': None},
+        output_line('e', 'Antwort E'),
+    ]
+    assert parse_batch_output(records) == {'a': 'Antwort A', 'b': None, 'c': None, 'd': None, 'e': 'Antwort E'}
+
+
+def test_run_batch_returns_every_request_in_input_order(tmp_path):
+    requests = [build_batch_request(f"row-{index}", 'model', [{'role': 'user', 'content': str(index)}], {}) for index in range(4)]
+    answers = {'row-0': output_line('row-0', 'Antwort 0'), 'row-1': output_line('row-1', status_code=500, error='server error'),
+               'row-3': output_line('row-3', 'Antwort 3')}
+    client = FakeBatchClient(lambda request: answers.get(request['custom_id']))
+
+    results = run_batch(client, requests, str(tmp_path / 'batch' / 'input.jsonl'))
+    assert list(results.items()) == [('row-0', 'Antwort 0'), ('row-1', None), ('row-2', None), ('row-3', 'Antwort 3')]
+    assert client.submitted == requests
+
+
+def test_failed_batch_returns_no_results(tmp_path):
+    requests = [build_batch_request('row-0', 'model', [], {})]
+    client = FakeBatchClient(lambda request: pytest.fail('a failed batch is not downloaded'), status='expired')
+    assert run_batch(client, requests, str(tmp_path / 'input.jsonl')) == {'row-0': None}
+    assert run_batch(client, [], str(tmp_path / 'empty.jsonl')) == {}
+
+
+def test_batch_results_are_joined_back_onto_the_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(evaluate_model, 'response_cache', ResponseCache(str(tmp_path / 'responses.sqlite'), enabled=False))
+    fieldnames = ['System', 'Instruction', 'Chosen']
+    rows = [{'System': 'Kontext', 'Instruction': f"Frage {index}", 'Chosen': f"Antwort {index}"} for index in range(5)]
+    rows[3] = dict(rows[1])
+    rows[4]['Instruction'] = ''
+    input_path = str(tmp_path / 'prepared_x_test.csv')
+    write_csv_rows_atomic(input_path, fieldnames, rows)
+    row_ids = assign_row_ids(rows)
+
+    def answer(request):
+        if request['custom_id'] == row_ids[2]:
+            return output_line(request['custom_id'], status_code=400, error='context length exceeded')
+        return output_line(request['custom_id'], f"Ausgabe zu {request['body']['messages'][1]['content']} ({request['custom_id']})")
+    client = FakeBatchClient(answer)
+
+    output_path = str(tmp_path / 'evaluated_x_test.csv')
+    evaluate_model.process_csv_in_batch(input_path, output_path, client, str(tmp_path / 'batch'))
+
+    # The row without an instruction is never sent; the repeated row is sent under its own ID
+    assert [request['custom_id'] for request in client.submitted] == row_ids[:4]
+    _, outputs = read_csv_rows(output_path)
+    assert [row['model_generated_output'] for row in outputs] == [
+        f"Ausgabe zu Frage 0 ({row_ids[0]})",
+        f"Ausgabe zu Frage 1 ({row_ids[1]})",
+        'Error generating response',
+        f"Ausgabe zu Frage 1 ({row_ids[3]})",
+        'Error: Missing data',
+    ]
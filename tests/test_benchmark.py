@@ -0,0 +1,72 @@
+import os
+import sys
+
+from benchmark import check_stage_outputs, find_regressions, make_workdir, run_stage
+from checkpoint import read_csv_rows, write_csv_rows_atomic
+from scoring import ordered_configs
+
+rows = 4
+
+
+def stage_result(stage, returncode=0, timed_out=False, problems=()):
+    return {'stage': stage, 'rows': 20, 'rows_per_second': 10.0, 'peak_rss_mb': 100.0,
+            'returncode': returncode, 'timed_out': timed_out, 'problems': list(problems)}
+
+
+def write_generated(workdir, outputs):
+    """
+    Writes the generation output of every config from the prepared rows, with
+    `outputs(config_name, rows)` returning the model_generated_output values.
+    """
+    os.makedirs(workdir / 'evaluated', exist_ok=True)
+    for config_name in ordered_configs:
+        fieldnames, prepared = read_csv_rows(str(workdir / 'prepared' / f"prepared_{config_name}_test.csv"))
+        generated = [dict(row, model_generated_output=output) for row, output in zip(prepared, outputs(config_name, prepared))]
+        write_csv_rows_atomic(str(workdir / 'evaluated' / f"evaluated_{config_name}_test.csv"),
+                              fieldnames + ['model_generated_output'], generated)
+
+
+def test_complete_generation_passes(tmp_path):
+    make_workdir(str(tmp_path), rows, 200)
+    write_generated(tmp_path, lambda config_name, prepared: ['Antwort'] * len(prepared))
+    assert check_stage_outputs('generate', str(tmp_path), rows) == []
+
+
+def test_failed_missing_and_short_files_are_reported(tmp_path):
+    make_workdir(str(tmp_path), rows, 200)
+    failing, short, missing = ordered_configs[:3]
+
+    def outputs(config_name, prepared):
+        if config_name == failing:
+            return ['Antwort', 'Error generating response', '', 'Antwort']
+        return ['Antwort'] * (len(prepared) - (config_name == short))
+    write_generated(tmp_path, outputs)
+    os.remove(tmp_path / 'evaluated' / f"evaluated_{missing}_test.csv")
+
+    problems = check_stage_outputs('generate', str(tmp_path), rows)
+    assert problems == [
+        os.path.join('evaluated', f"evaluated_{failing}_test.csv") + " has 2 failed rows",
+        os.path.join('evaluated', f"evaluated_{short}_test.csv") + f" has {rows - 1} rows, expected {rows}",
+        os.path.join('evaluated', f"evaluated_{missing}_test.csv") + " is missing",
+    ]
+    assert check_stage_outputs('score', str(tmp_path), rows) == ["leaderboard.json is missing"]
+
+
+def test_stage_is_killed_after_the_timeout(tmp_path):
+    result = run_stage('sleep', [sys.executable, '-c', 'import time; time.sleep(30)'], str(tmp_path), dict(os.environ), 1, timeout=0.5)
+    assert result['timed_out']
+    assert result['returncode'] != 0
+    assert result['seconds'] < 10
+
+    result = run_stage('quick', [sys.executable, '-c', 'pass'], str(tmp_path), dict(os.environ), 1, timeout=30)
+    assert not result['timed_out'] and result['returncode'] == 0
+
+
+def test_failed_stages_are_regressions():
+    baseline = [stage_result('generate'), stage_result('judge'), stage_result('score')]
+    results = [stage_result('generate', problems=['evaluated/x.csv has 2 failed rows']),
+               stage_result('judge', returncode=-9, timed_out=True), stage_result('score', returncode=1)]
+    assert find_regressions(results, baseline, 0.2) == [
+        'generate: evaluated/x.csv has 2 failed rows', 'judge: timed out', 'score: failed with exit code 1',
+    ]
+    assert find_regressions([stage_result('generate')], baseline, 0.2) == []
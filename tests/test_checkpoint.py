@@ -0,0 +1,156 @@
+import os
+
+import pytest
+
+from checkpoint import (CheckpointedWriter, assign_row_ids, generation_error_markers, parse_shard, read_csv_rows, redrive_errors,
+                        row_id, select_shard, shard_of, shard_path, write_csv_rows_atomic)
+
+fieldnames = ['System', 'Instruction', 'Chosen', 'model_generated_output']
+
+
+def make_rows(count, repeat=()):
+    """
+    Rows without an ID column; the indexes in `repeat` get the content of row 0.
+    """
+    rows = [{'System': 'Kontext', 'Instruction': f"Frage {index}", 'Chosen': f"Antwort {index}"} for index in range(count)]
+    for index in repeat:
+        rows[index] = dict(rows[0])
+    return rows
+
+
+def generated(rows):
+    return [dict(row, model_generated_output=f"Ausgabe {row['Instruction']}") for row in rows]
+
+
+def run(path, rows, stop_after=None):
+    """
+    Writes the pending rows of `rows` like a stage does; raises after `stop_after` rows to
+    simulate a crash.
+    """
+    with CheckpointedWriter(path, fieldnames) as writer:
+        for count, (rid, row) in enumerate(writer.pending(generated(rows))):
+            if count == stop_after:
+                raise KeyboardInterrupt
+            writer.writerow(rid, row)
+
+
+def test_row_ids_use_the_id_column_or_a_content_hash():
+    assert row_id({'ID': 17, 'Instruction': 'x'}) == '17'
+    rows = make_rows(2)
+    assert row_id(rows[0]) == row_id(dict(rows[0]))
+    assert row_id(rows[0]) != row_id(rows[1])
+    assert len(row_id(rows[0])) == 16
+
+
+def test_duplicate_rows_get_occurrence_suffixes():
+    rows = make_rows(5, repeat=(2, 4))
+    base = row_id(rows[0])
+    assert assign_row_ids(rows) == [base, row_id(rows[1]), f"{base}#1", row_id(rows[3]), f"{base}#2"]
+
+
+def test_complete_run_writes_all_rows_and_removes_the_checkpoint(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    rows = make_rows(4)
+    run(path, rows)
+    assert read_csv_rows(path) == (fieldnames, generated(rows))
+    assert not os.path.exists(path + '.ckpt')
+
+
+def test_resume_continues_after_an_interruption(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    rows = make_rows(6, repeat=(3,))
+    with pytest.raises(KeyboardInterrupt):
+        run(path, rows, stop_after=4)
+    assert os.path.exists(path + '.ckpt')
+
+    with CheckpointedWriter(path, fieldnames) as writer:
+        pending = list(writer.pending(generated(rows)))
+        assert [row['Instruction'] for _, row in pending] == ['Frage 4', 'Frage 5']
+        for rid, row in pending:
+            writer.writerow(rid, row)
+    assert read_csv_rows(path)[1] == generated(rows)
+    assert not os.path.exists(path + '.ckpt')
+
+
+def test_resume_trims_rows_that_were_not_checkpointed(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    rows = make_rows(5)
+    with pytest.raises(KeyboardInterrupt):
+        run(path, rows, stop_after=2)
+    # A row written just before the crash but never checkpointed, and a half-written line
+    with open(path, mode='a', newline='', encoding='utf-8') as f:
+        f.write('Kontext;Frage 2;Antwort 2;Ausgabe Frage 2\r\n')
+        f.write('Kontext;Frage 3;Antw')
+
+    with CheckpointedWriter(path, fieldnames) as writer:
+        assert writer.completed == set(assign_row_ids(rows[:2]))
+        assert read_csv_rows(path)[1] == generated(rows[:2])
+        assert [row['Instruction'] for _, row in writer.pending(generated(rows))] == ['Frage 2', 'Frage 3', 'Frage 4']
+        with open(path + '.ckpt', encoding='utf-8') as f:
+            assert f.read().split() == assign_row_ids(rows[:2])
+
+
+def test_resume_keeps_duplicate_rows_apart(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    rows = make_rows(4, repeat=(1, 2))
+    with pytest.raises(KeyboardInterrupt):
+        run(path, rows, stop_after=2)
+
+    with CheckpointedWriter(path, fieldnames) as writer:
+        base = row_id(rows[0])
+        assert writer.completed == {base, f"{base}#1"}
+        # The third copy of the row is still pending under its own suffix
+        assert [rid for rid, _ in writer.pending(generated(rows))] == [f"{base}#2", row_id(rows[3])]
+
+
+def test_parse_shard():
+    assert parse_shard('1/4') == (1, 4)
+    for spec in ('4/4', '-1/2', '0/0', 'x/2'):
+        with pytest.raises(ValueError):
+            parse_shard(spec)
+
+
+def test_select_shard_splits_the_rows_and_keeps_duplicates_together():
+    rows = make_rows(30, repeat=(7, 19))
+    shards = [list(select_shard(rows, (index, 3))) for index in range(3)]
+    assert sorted(len(shard) for shard in shards) != [0, 0, 30]
+    assert sum(len(shard) for shard in shards) == 30
+    assert list(select_shard(rows, None)) == rows
+    home = shard_of(row_id(rows[0]), 3)
+    assert sum(1 for row in shards[home] if row == rows[0]) == 3
+    assert shard_of(row_id(rows[0]) + '#2', 3) == home
+
+
+def test_shard_path():
+    assert shard_path('evaluated/x_test.csv', None) == 'evaluated/x_test.csv'
+    assert shard_path('evaluated/x_test.csv', (0, 4)) == 'evaluated/x_test.shard-0-of-4.csv'
+
+
+def test_redrive_only_resends_the_failed_rows(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    rows = generated(make_rows(5))
+    rows[1]['model_generated_output'] = 'Error generating response'
+    rows[3]['model_generated_output'] = ''
+    write_csv_rows_atomic(path, fieldnames, rows)
+    sent = []
+
+    def redo_rows(failed):
+        sent.extend(row['Instruction'] for row in failed)
+        # The second failed row fails again
+        return [dict(failed[0], model_generated_output='Neu'), failed[1]]
+
+    is_error = lambda row: (row.get('model_generated_output') or '') in generation_error_markers
+    assert redrive_errors(path, is_error, redo_rows) == 1
+    assert sent == ['Frage 1', 'Frage 3']
+    result = read_csv_rows(path)[1]
+    assert [row['model_generated_output'] for row in result] == ['Ausgabe Frage 0', 'Neu', 'Ausgabe Frage 2', '', 'Ausgabe Frage 4']
+
+
+def test_redrive_without_errors_sends_nothing(tmp_path):
+    path = str(tmp_path / 'out.csv')
+    write_csv_rows_atomic(path, fieldnames, generated(make_rows(3)))
+
+    def redo_rows(failed):
+        raise AssertionError("nothing to re-drive")
+
+    assert redrive_errors(path, lambda row: False, redo_rows) == 0
@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+import pytest
+
+import download_test_sets_save_as_csv as download
+from download_test_sets_save_as_csv import config_names, read_lock, sync, verify
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    """
+    Dataset Hub whose `main` is at hub.main; exports write a CSV per config and are recorded.
+    """
+    hub = SimpleNamespace(main='rev-1', exported=[])
+
+    def export_config(config_name, revision, output_dir, cache_dir=None):
+        hub.exported.append((config_name, revision))
+        path = f"{output_dir}/{config_name}_test.csv"
+        with open(path, mode='w', encoding='utf-8') as f:
+            f.write(f"System;Instruction;Chosen\nKontext;Frage;Antwort {revision}\n")
+        files = {f"{config_name}_test.csv": {"rows": 1, "sha256": download.file_sha256(path)}}
+        return {"revision": revision, "fingerprints": {"test": revision}, "files": files}
+
+    monkeypatch.setattr(download, 'export_config', export_config)
+    monkeypatch.setattr(download, 'resolve_revision', lambda revision=None: hub.main if revision in (None, 'main') else revision)
+    return hub
+
+
+def pins(output_dir):
+    lock = read_lock(output_dir)
+    return lock['revision'], {config_name: entry['revision'] for config_name, entry in lock['configs'].items()}
+
+
+def test_reruns_keep_the_pin(tmp_path, hub):
+    assert set(sync(config_names, str(tmp_path)).values()) == {'exported'}
+    hub.main = 'rev-2'
+    assert set(sync(config_names, str(tmp_path)).values()) == {'current'}
+    assert len(hub.exported) == len(config_names)
+    assert pins(str(tmp_path)) == ('rev-1', dict.fromkeys(config_names, 'rev-1'))
+    assert verify(config_names, str(tmp_path)) == []
+
+
+def test_updating_a_subset_keeps_the_lock_consistent(tmp_path, hub):
+    sync(config_names, str(tmp_path))
+    hub.main = 'rev-2'
+    subset, rest = config_names[:2], config_names[2:]
+
+    assert sync(subset, str(tmp_path), update=True) == dict.fromkeys(subset, 'exported')
+    revision, configs = pins(str(tmp_path))
+    assert revision == 'rev-1'
+    assert configs == dict(dict.fromkeys(subset, 'rev-2'), **dict.fromkeys(rest, 'rev-1'))
+    assert verify(config_names, str(tmp_path)) == []
+
+    # A plain rerun keeps every config at its own pin
+    hub.exported.clear()
+    assert set(sync(config_names, str(tmp_path)).values()) == {'current'}
+    assert hub.exported == []
+
+    # The top-level pin moves once all configs are on the new revision
+    sync(rest, str(tmp_path), update=True)
+    assert pins(str(tmp_path)) == ('rev-2', dict.fromkeys(config_names, 'rev-2'))
+    assert verify(config_names, str(tmp_path)) == []
+
+
+def test_verify_reports_changed_and_missing_files(tmp_path, hub):
+    assert verify(config_names, str(tmp_path)) == [f"no datasets.lock.json in {tmp_path}"]
+    sync(config_names[:1], str(tmp_path), revision='v1.0')
+    with open(tmp_path / f"{config_names[0]}_test.csv", mode='a', encoding='utf-8') as f:
+        f.write("Kontext;Frage;Neue Antwort\n")
+
+    assert verify(config_names[:2], str(tmp_path)) == [
+        f"{config_names[0]} is missing or differs from revision v1.0",
+        f"{config_names[1]} is missing or differs from revision v1.0",
+    ]
+    assert sync(config_names[:1], str(tmp_path)) == {config_names[0]: 'exported'}
+    assert verify(config_names[:1], str(tmp_path)) == []
@@ -0,0 +1,94 @@
+import json
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+import evaluate_by_judge
+from judge_parsing import reasoning_key
+from response_cache import ResponseCache
+
+score_keys = ['language_quality', 'overall_correctness', 'instruction_following', 'overall_score']
+
+row_text = 'Kontext und Zielantwort der Zeile'
+reasoning = 'Die Antwort nennt beide Referenzen und folgt der Anweisung.'
+
+
+class FakeBackend:
+    """
+    Judge backend that answers the requests with the given texts in order and records them.
+    """
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.requests = []
+        self.params = {}
+        self.model = self.cache_model = 'fake-judge'
+
+    def create(self, messages, **params):
+        self.requests.append((messages, params))
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        completion = {'usage': {'prompt_tokens': 10, 'completion_tokens': 5}}
+        return SimpleNamespace(get=completion.get, choices=[SimpleNamespace(message={'content': answer})])
+
+
+@pytest.fixture
+def judge(monkeypatch, tmp_path):
+    def use(answers):
+        backend = FakeBackend(answers)
+        monkeypatch.setattr(evaluate_by_judge, 'backend_for', lambda model=None: backend)
+        return backend
+
+    monkeypatch.setattr(evaluate_by_judge, 'response_cache', ResponseCache(str(tmp_path / 'responses.sqlite'), enabled=False))
+    monkeypatch.setattr(evaluate_by_judge, 'shared_requests', OrderedDict())
+    monkeypatch.setattr(evaluate_by_judge, 'structured_outputs', True)
+    return use
+
+
+def judge_messages():
+    return [{'role': 'system', 'content': 'Bewerte die Antwort.'}, {'role': 'user', 'content': row_text}]
+
+
+def test_complete_verdict_needs_no_follow_up(judge):
+    backend = judge([json.dumps({reasoning_key: reasoning, 'language_quality': 90, 'overall_correctness': 80,
+                                 'instruction_following': 70, 'overall_score': 75})])
+    scores = evaluate_by_judge.judge_scores(judge_messages(), score_keys)
+    assert scores['overall_score'] == 75
+    assert len(backend.requests) == 1
+
+
+def test_missing_scores_are_repaired_with_a_follow_up_request(judge):
+    truncated = '{"' + reasoning_key + '": "' + reasoning + '", "language_quality": 90, "overall_correctness": 80, "instruction_fol'
+    backend = judge([truncated, json.dumps({'instruction_following': '70', 'overall_score': 75})])
+
+    scores = evaluate_by_judge.judge_scores(judge_messages(), score_keys)
+    assert scores == {reasoning_key: reasoning, 'language_quality': 90, 'overall_correctness': 80,
+                      'instruction_following': 70, 'overall_score': 75}
+
+    assert len(backend.requests) == 2
+    messages, params = backend.requests[1]
+    # Only the reasoning of the verdict is sent again, not the judged row
+    assert messages[-1]['content'] == reasoning
+    assert all(row_text not in message['content'] for message in messages)
+    assert "'instruction_following', 'overall_score'" in messages[0]['content']
+    assert 'language_quality' not in messages[0]['content']
+    schema = params['response_format']['json_schema']['schema']
+    assert list(schema['properties']) == ['instruction_following', 'overall_score']
+
+
+def test_failed_repair_leaves_the_scores_missing(judge):
+    partial = json.dumps({reasoning_key: reasoning, 'language_quality': 90, 'overall_correctness': 80})
+    backend = judge([partial, RuntimeError('server error')])
+    scores = evaluate_by_judge.judge_scores(judge_messages(), score_keys)
+    assert scores['language_quality'] == 90
+    assert scores['instruction_following'] is None and scores['overall_score'] is None
+    assert len(backend.requests) == 2
+
+
+def test_verdict_without_reasoning_is_not_repaired(judge):
+    backend = judge([json.dumps({'language_quality': 90, 'overall_score': 75})])
+    scores = evaluate_by_judge.judge_scores(judge_messages(), score_keys)
+    assert scores['overall_correctness'] is None
+    assert len(backend.requests) == 1
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from extraction import add_extraction_metrics, metric_columns, row_extraction_metrics
+
+fragments = ['[1]', '[2]', '[12]', '3 Tage', '1 Tag', '48 Stunden', '2Stunde', 'ID 7', 'ID 12', 'ID 3 Tage',
+             'im 2. Kontext-Abschnitt', 'im 10. Kontext-Abschnitt', 'im 4 Kontext', 'laut Kontext', 'und', '5']
+
+
+def random_text(rng):
+    if rng.random() < 0.1:
+        return None
+    return ' '.join(rng.choice(fragments, rng.integers(0, 8)))
+
+
+@pytest.mark.parametrize('patterns', [('reference', 'time_difference', 'extraction_id', 'context'),
+                                      ('reference', 'time_difference'), ('context',), ()])
+@pytest.mark.parametrize('seed', range(5))
+def test_row_metrics_match_vectorized(seed, patterns):
+    rng = np.random.default_rng(seed)
+    rows = [{'Chosen': random_text(rng), 'model_generated_output': random_text(rng)} for _ in range(300)]
+    expected = add_extraction_metrics(pd.DataFrame(rows), patterns)
+    columns = metric_columns(patterns)
+    assert [column for column in expected.columns if column not in rows[0]] == columns
+
+    for i, row in enumerate(rows):
+        metrics = row_extraction_metrics(row, patterns)
+        assert list(metrics) == columns
+        for column in columns:
+            value = expected[column].iloc[i]
+            if np.isnan(value):
+                assert metrics[column] is None, (row, column)
+            else:
+                assert metrics[column] == value, (row, column)
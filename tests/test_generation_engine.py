@@ -0,0 +1,163 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import generation_engine
+from generation_engine import AdaptiveRateLimiter, call_with_retries
+
+
+class FakeClock:
+    """
+    Monotonic clock that only moves when the code under test sleeps; the sleeps are recorded.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+class APIError(Exception):
+    def __init__(self, http_status=None, headers=None):
+        super().__init__(f"HTTP {http_status}")
+        self.http_status = http_status
+        self.headers = headers
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(generation_engine, 'time', SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(generation_engine, 'asyncio', SimpleNamespace(sleep=clock.sleep, Lock=asyncio.Lock))
+    monkeypatch.setattr(generation_engine.random, 'random', lambda: 0.0)
+    return clock
+
+
+def acquire_all(limiter, sizes):
+    async def run():
+        return [await limiter.acquire(tokens) for tokens in sizes]
+    return asyncio.run(run())
+
+
+def answers(*outcomes):
+    """
+    Request that raises or returns the given outcomes in order and counts its calls.
+    """
+    outcomes = list(outcomes)
+
+    async def request():
+        request.calls += 1
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome, 100
+    request.calls = 0
+    return request
+
+
+def test_requests_wait_for_the_window_once_the_budget_is_used(clock):
+    limiter = AdaptiveRateLimiter(requests_per_minute=3, tokens_per_minute=10 ** 6)
+    entries = acquire_all(limiter, [10, 10, 10])
+    assert clock.sleeps == []
+    assert [entry[0] for entry in entries] == [1000.0] * 3
+
+    clock.now += 20
+    entry = acquire_all(limiter, [10])[0]
+    # The fourth request waits until the first one leaves the 60 s window
+    assert clock.sleeps == [40.0]
+    assert entry[0] == 1060.0
+
+
+def test_tokens_per_minute_limit_uses_the_reported_usage(clock):
+    limiter = AdaptiveRateLimiter(requests_per_minute=100, tokens_per_minute=1000)
+    first = acquire_all(limiter, [400])[0]
+    acquire_all(limiter, [400])
+    assert clock.sleeps == []
+
+    # The first request used far fewer tokens than estimated, so a third one fits
+    limiter.record_usage(first, 100)
+    acquire_all(limiter, [400])
+    assert clock.sleeps == []
+    assert limiter._tokens_in_window == 900
+
+    acquire_all(limiter, [400])
+    assert clock.sleeps == [60.0]
+    assert limiter._tokens_in_window == 400
+
+
+def test_a_single_request_larger_than_the_budget_is_not_blocked_forever(clock):
+    limiter = AdaptiveRateLimiter(requests_per_minute=100, tokens_per_minute=1000)
+    acquire_all(limiter, [5000, 5000])
+    assert clock.sleeps == [60.0]
+
+
+@pytest.mark.parametrize('headers, pause', [
+    ({'Retry-After': '7'}, 7.0), ({'retry-after': '2.5'}, 2.5), ({'retry-after-ms': '1500'}, 1.5),
+])
+def test_rate_limit_pauses_for_the_retry_after_header(clock, headers, pause):
+    limiter = AdaptiveRateLimiter(requests_per_minute=100, tokens_per_minute=10 ** 6)
+    request = answers(APIError(429, headers), 'Antwort')
+
+    assert asyncio.run(call_with_retries(request, limiter, 10)) == 'Antwort'
+    assert request.calls == 2
+    assert clock.sleeps == [pause]
+    assert limiter.requests_per_minute == 75
+
+
+def test_rate_limit_without_header_backs_off_exponentially(clock):
+    limiter = AdaptiveRateLimiter(requests_per_minute=100, tokens_per_minute=10 ** 6)
+    request = answers(APIError(429), APIError(429, {'Retry-After': 'bald'}), APIError(429), 'Antwort')
+
+    assert asyncio.run(call_with_retries(request, limiter, 10)) == 'Antwort'
+    assert clock.sleeps == [1.0, 2.0, 4.0]
+    # Every 429 lowers the request budget by a quarter
+    assert limiter.requests_per_minute == 42
+
+
+def test_transient_errors_are_retried_with_backoff(clock):
+    limiter = AdaptiveRateLimiter(requests_per_minute=100, tokens_per_minute=10 ** 6)
+    request = answers(APIError(503), TimeoutError(), 'Antwort')
+
+    assert asyncio.run(call_with_retries(request, limiter, 10)) == 'Antwort'
+    assert clock.sleeps == [1.0, 2.0]
+    assert limiter.requests_per_minute == 100
+
+
+def test_other_errors_are_raised_without_retry(clock):
+    limiter = AdaptiveRateLimiter()
+    request = answers(APIError(400), 'Antwort')
+    with pytest.raises(APIError):
+        asyncio.run(call_with_retries(request, limiter, 10))
+    assert request.calls == 1
+    assert clock.sleeps == []
+
+
+def test_last_error_is_raised_when_the_retries_are_used_up(clock):
+    limiter = AdaptiveRateLimiter()
+    request = answers(*[APIError(502)] * 3)
+    with pytest.raises(APIError):
+        asyncio.run(call_with_retries(request, limiter, 10, max_retries=2))
+    assert request.calls == 3
+    assert clock.sleeps == [1.0, 2.0]
+
+
+def test_budget_recovers_after_a_run_of_successes(clock):
+    limiter = AdaptiveRateLimiter(requests_per_minute=100, tokens_per_minute=10 ** 6)
+    limiter.throttle(0)
+    assert limiter.requests_per_minute == 75
+    for _ in range(49):
+        limiter.record_success()
+    assert limiter.requests_per_minute == 75
+    limiter.record_success()
+    assert limiter.requests_per_minute == 80
+
+    for _ in range(50 * 10):
+        limiter.record_success()
+    assert limiter.requests_per_minute == 100
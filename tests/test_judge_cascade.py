@@ -0,0 +1,133 @@
+import pytest
+
+from judge_cascade import JudgeCascade, audit_draw, parse_band, reference_rule
+from tasks import task_for
+
+qa = task_for('hard-qa-with-multiple-references')
+summary = task_for('summarize-meeting-topic')
+target = 'Laut [1] und [3] ist das Treffen am Montag.'
+
+
+def messages(index):
+    return [{'role': 'system', 'content': 'Bewerte die Antwort.'}, {'role': 'user', 'content': f"Zeile {index}"}]
+
+
+class FakeJudge:
+    """
+    Judge that gives every score the fixed answer of the model, raises it if it is an exception,
+    and records the calls.
+    """
+
+    def __init__(self, cheap, expensive=90):
+        self.answers = {'cheap': cheap, 'expensive': expensive}
+        self.calls = []
+
+    def __call__(self, messages, score_keys, model):
+        self.calls.append(model)
+        answer = self.answers[model]
+        if isinstance(answer, Exception):
+            raise answer
+        return {key: answer for key in score_keys}
+
+
+def test_parse_band():
+    assert parse_band('40,90') == (40, 90)
+    for value in ('90,40', '50', 'a,b'):
+        with pytest.raises(ValueError):
+            parse_band(value)
+
+
+@pytest.mark.parametrize('output, expected', [
+    ('Am Montag [3], siehe [1].', True),
+    ('Am Montag, siehe [2].', False),
+    ('Am Montag.', False),
+    ('Am Montag [1].', None),
+])
+def test_reference_rule(output, expected):
+    assert reference_rule(qa, target, output) is expected
+
+
+def test_reference_rule_needs_references_in_the_task_and_target():
+    assert reference_rule(summary, target, 'Am Montag.') is None
+    assert reference_rule(qa, 'Am Montag.', 'Am Montag [1].') is None
+
+
+@pytest.mark.parametrize('scores, task, output, expected', [
+    ({}, qa, 'Am Montag [1] [3].', 'cheap_failed'),
+    ({'overall_score': None}, summary, 'Am Montag.', 'cheap_failed'),
+    ({'overall_score': 50}, summary, 'Am Montag.', 'uncertain'),
+    ({'overall_score': 85}, qa, 'Am Montag [1] [3].', 'uncertain'),
+    # Right references judged as failing, no right reference judged as passing
+    ({'overall_score': 20}, qa, 'Am Montag [1] [3].', 'rule_disagreement'),
+    ({'overall_score': 95}, qa, 'Am Montag [2].', 'rule_disagreement'),
+    ({'overall_score': 95}, qa, 'Am Montag [1] [3].', None),
+    ({'overall_score': 20}, qa, 'Am Montag [2].', None),
+    ({'overall_score': 20}, qa, 'Am Montag [1].', None),
+    # Tasks without references have no rule to disagree with
+    ({'overall_score': 95}, summary, 'Am Montag.', None),
+    ({'overall_score': 20}, summary, 'Am Montag.', None),
+])
+def test_escalation_reason(scores, task, output, expected):
+    cascade = JudgeCascade(FakeJudge(0), 'cheap', 'expensive')
+    assert cascade.escalation_reason(messages(0), scores, task, target, output) == expected
+
+
+def test_audit_draw_is_reproducible_and_in_range():
+    draws = [audit_draw(messages(index)) for index in range(1000)]
+    assert draws == [audit_draw(messages(index)) for index in range(1000)]
+    assert all(0 <= draw < 1 for draw in draws)
+    assert len(set(draws)) == 1000
+    assert 0.4 < sum(draws) / len(draws) < 0.6
+
+
+def test_audit_escalates_the_drawn_share_of_confident_rows():
+    cascade = JudgeCascade(FakeJudge(0), 'cheap', 'expensive', audit_rate=0.2)
+    reasons = [cascade.escalation_reason(messages(index), {'overall_score': 95}, summary, target, 'Am Montag.')
+               for index in range(1000)]
+    audited = [index for index, reason in enumerate(reasons) if reason == 'audit']
+    assert audited == [index for index in range(1000) if audit_draw(messages(index)) < 0.2]
+    assert 150 < len(audited) < 250
+
+
+def test_confident_rows_keep_the_cheap_verdict():
+    judge = FakeJudge(95)
+    cascade = JudgeCascade(judge, 'cheap', 'expensive')
+    scores = cascade.score(messages(0), summary, target, 'Am Montag.')
+    assert judge.calls == ['cheap']
+    assert scores['overall_score'] == 95
+    assert (scores['judge_model'], scores['judge_escalation'], scores['cheap_judge_overall_score']) == ('cheap', '', 95)
+
+
+def test_uncertain_rows_are_judged_again():
+    judge = FakeJudge(60, expensive=40)
+    cascade = JudgeCascade(judge, 'cheap', 'expensive')
+    scores = cascade.score(messages(0), summary, target, 'Am Montag.')
+    assert judge.calls == ['cheap', 'expensive']
+    assert scores['overall_score'] == 40
+    assert (scores['judge_model'], scores['judge_escalation'], scores['cheap_judge_overall_score']) == ('expensive', 'uncertain', 60)
+
+
+def test_a_failing_cheap_judge_escalates_and_expensive_errors_are_raised():
+    judge = FakeJudge(RuntimeError('timeout'))
+    cascade = JudgeCascade(judge, 'cheap', 'expensive')
+    scores = cascade.score(messages(0), summary, target, 'Am Montag.')
+    assert scores['judge_escalation'] == 'cheap_failed'
+    assert scores['cheap_judge_overall_score'] is None
+
+    judge.answers['expensive'] = RuntimeError('server error')
+    with pytest.raises(RuntimeError):
+        cascade.score(messages(1), summary, target, 'Am Montag.')
+
+
+def test_summary_counts_escalations_and_agreement():
+    cascade = JudgeCascade(FakeJudge(0), 'cheap', 'expensive')
+    for reason, cheap, expensive in [(None, 95, None), ('uncertain', 60, 65), ('audit', 90, 40), ('cheap_failed', None, 70)]:
+        cascade.record(reason, cheap, expensive)
+    total = cascade.summary()['total']
+    assert (total['rows'], total['accepted'], total['escalated']) == (4, 1, 3)
+    assert total['escalations'] == {'cheap_failed': 1, 'uncertain': 1, 'rule_disagreement': 0, 'audit': 1}
+    # Rows the cheap judge failed on cannot be compared
+    assert total['agreement']['rows'] == 2
+    assert total['agreement']['pass_agreement'] == 0.5
+    assert total['agreement']['mean_absolute_difference'] == 27.5
+    assert total['audit_agreement'] == {'rows': 1, 'pass_agreement': 0.0, 'within_tolerance': 0.0, 'mean_absolute_difference': 50.0}
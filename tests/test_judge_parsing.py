@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from judge_parsing import coerce_score, parse_scores, parse_verdict, reasoning_key, repair_messages, salvage_fields, verdict_schema
+
+score_keys = ['language_quality', 'overall_correctness', 'instruction_following', 'overall_score']
+
+
+@pytest.mark.parametrize('value, expected', [
+    (85, 85), (85.5, 85.5), (0, 0), (100, 100),
+    ('85', 85), (' 85 ', 85), ('85.5', 85.5), ('85.0', 85), ('85/100', 85), ('85 %', 85), ('85%', 85),
+])
+def test_coerce_score_accepts_numbers_and_numeric_strings(value, expected):
+    score = coerce_score(value)
+    assert score == expected
+    assert type(score) is type(expected)
+
+
+@pytest.mark.parametrize('value', [101, -1, 100.5, '101', '-5', '150/100', 'high', '', None, True, False, [85], {'score': 85}])
+def test_coerce_score_rejects_out_of_range_and_non_numbers(value):
+    assert coerce_score(value) is None
+
+
+def test_verdict_schema_is_strict_with_reasoning_first():
+    schema = verdict_schema(score_keys)['json_schema']
+    assert schema['strict'] is True
+    assert list(schema['schema']['properties']) == [reasoning_key] + score_keys
+    assert schema['schema']['required'] == [reasoning_key] + score_keys
+    assert schema['schema']['additionalProperties'] is False
+    assert list(verdict_schema(['overall_score'], reasoning=False)['json_schema']['schema']['properties']) == ['overall_score']
+
+
+def test_parse_verdict_valid_json():
+    verdict = {reasoning_key: 'Gut begründet.', 'language_quality': 90, 'overall_correctness': '80',
+               'instruction_following': 70.5, 'overall_score': 85}
+    scores, missing = parse_verdict(json.dumps(verdict), score_keys)
+    assert scores == {reasoning_key: 'Gut begründet.', 'language_quality': 90, 'overall_correctness': 80,
+                      'instruction_following': 70.5, 'overall_score': 85}
+    assert missing == []
+
+
+def test_parse_verdict_reports_missing_and_invalid_scores():
+    verdict = {reasoning_key: 'Teilweise richtig.', 'language_quality': 150, 'overall_correctness': 'n/a', 'overall_score': 60}
+    scores, missing = parse_verdict(json.dumps(verdict), score_keys)
+    assert scores['overall_score'] == 60
+    assert missing == ['language_quality', 'overall_correctness', 'instruction_following']
+    assert all(scores[key] is None for key in missing)
+
+
+def test_parse_verdict_cuts_json_out_of_code_fences():
+    text = 'Hier ist die Bewertung:\n```json\n{"' + reasoning_key + '": "Passt.", "language_quality": 90, ' \
+           '"overall_correctness": 80, "instruction_following": 70, "overall_score": 75}\n```\nViele Grüße'
+    scores, missing = parse_verdict(text, score_keys)
+    assert missing == []
+    assert scores[reasoning_key] == 'Passt.'
+    assert scores['overall_score'] == 75
+
+
+def test_parse_verdict_salvages_truncated_json():
+    # Cut off by the token limit in the middle of the last number
+    text = '{"' + reasoning_key + '": "Die Antwort nennt \\"[1]\\" korrekt.", "language_quality": 90, ' \
+           '"overall_correctness": "80", "instruction_following": 7'
+    scores, missing = parse_verdict(text, score_keys)
+    assert scores[reasoning_key] == 'Die Antwort nennt "[1]" korrekt.'
+    assert scores['language_quality'] == 90
+    assert scores['overall_correctness'] == 80
+    assert missing == ['instruction_following', 'overall_score']
+
+
+def test_salvage_fields_skips_incomplete_numbers():
+    text = '{"language_quality": 90,\n"overall_correctness": 8'
+    assert salvage_fields(text, score_keys) == {'language_quality': '90'}
+
+
+def test_parse_verdict_without_any_usable_field_raises():
+    with pytest.raises(ValueError):
+        parse_verdict('Ich kann das nicht bewerten.', score_keys)
+    with pytest.raises(ValueError):
+        parse_verdict(json.dumps({'language_quality': 'gut'}), score_keys)
+    with pytest.raises(ValueError):
+        parse_verdict(None, score_keys)
+
+
+def test_parse_scores_keeps_only_readable_scores():
+    text = json.dumps({'instruction_following': '70', 'overall_score': 'hoch'})
+    assert parse_scores(text, ['instruction_following', 'overall_score']) == {'instruction_following': 70}
+
+
+def test_repair_messages_carry_only_the_reasoning_and_missing_keys():
+    messages = repair_messages('Die Antwort ist vollständig.', ['instruction_following', 'overall_score'])
+    assert [message['role'] for message in messages] == ['system', 'user']
+    assert "'instruction_following', 'overall_score'" in messages[0]['content']
+    for key in ['language_quality', 'overall_correctness', reasoning_key]:
+        assert key not in messages[0]['content']
+    assert messages[1]['content'] == 'Die Antwort ist vollständig.'
@@ -0,0 +1,213 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from scoring import build_weighted_frame, full_metrics, metric_column_map, score_frames
+from tasks import (task_names, weights_binary_correctness, weights_binary_language, weights_non_binary_correctness,
+                   weights_non_binary_language, weights_reasoning)
+
+threshold_variable = 70
+
+score_columns = ['language_quality', 'overall_correctness', 'instruction_following',
+                 'constrains_adherence', 'logical_consistency', 'final_solution_correctness']
+
+
+# Row-wise scoring of GRAG_LLM_HARD_BENCHMARK.ipynb as it was before scoring.py, kept verbatim
+# apart from the file-name lists, which become config names.
+
+list_non_binary = ['summarize-meeting-attendee-topic', 'summarize-meeting-topic', 'hard-reasoning-de', 'hard-reasoning-en']
+list_overall_correctness = ['hard-reasoning-de', 'hard-reasoning-en']
+list_language_quality = ['hard-qa-with-multiple-references']
+
+
+def calculate_overall_score(row, weights):
+    if 'overall_correctness_binary_score' in weights:
+        return (
+        row['language_quality'] * weights['language_quality']
+        + row['overall_correctness'] * weights['overall_correctness']
+        + row['instruction_following'] * weights['instruction_following']
+        + row['overall_correctness_binary_score'] * weights['overall_correctness_binary_score']
+    )
+    elif 'final_solution_correctness'in weights:
+        return (
+        row['language_quality'] * weights['language_quality']
+        + row['overall_correctness'] * weights['overall_correctness']
+        + row['instruction_following'] * weights['instruction_following']
+        + row['constrains_adherence'] * weights['constrains_adherence']
+        + row['logical_consistency'] * weights['logical_consistency']
+        + row['final_solution_correctness'] * weights['final_solution_correctness']
+    )
+    else:
+        return (
+        row['language_quality'] * weights['language_quality']
+        + row['overall_correctness'] * weights['overall_correctness']
+        + row['instruction_following'] * weights['instruction_following']
+    )
+
+
+def compute_weighted_score(row, reasoning_col_exists, threshold_variable, metrics_to_use, weights, df=None, idx=None):
+    # Case 1: Reasoning scenario with final_solution_correctness below threshold
+    if reasoning_col_exists and row['final_solution_correctness'] < threshold_variable:
+        # Zero out all metrics except logical_consistency
+        if df is not None and idx is not None:
+            for m in metrics_to_use:
+                if m in df.columns and m != 'logical_consistency':
+                    df.at[idx, m] = 0
+
+        row_weights = {
+            m: (weights[m] if m == 'logical_consistency' else 0)
+            for m in metrics_to_use
+        }
+
+        total_weight = sum(row_weights.values())
+        if total_weight == 0:
+            return 0
+
+        val = row.get('logical_consistency', np.nan)
+        if pd.isna(val):
+            return 0
+
+        current_weighted_score = val * row_weights['logical_consistency']
+
+    else:
+        # Case 2: Normal scenario (or final_solution_correctness >= threshold)
+        row_weights = dict(weights)
+
+        # Redistribute weights if any metric is NaN
+        for m in metrics_to_use:
+            if pd.isna(row.get(m, np.nan)):
+                row_weights['overall_correctness'] = (
+                    row_weights.get('overall_correctness', 0) + row_weights.get(m, 0)
+                )
+                row_weights[m] = 0
+
+        total_score = 0
+        total_weight = sum(row_weights.values()) or 1  # avoid division by zero
+
+        for m, w in row_weights.items():
+            val = row.get(m, np.nan)
+            if pd.isna(val):
+                continue
+            total_score += val * w
+
+        current_weighted_score = total_score / total_weight
+
+    return current_weighted_score
+
+
+def notebook_weighted_frame(df, config_name):
+    """
+    The notebook cell that writes the _weighted files, for one config.
+    """
+    # Exclude rows where all specified columns are 0
+    df = df.loc[~((df['language_quality'] == 0) & (df['overall_correctness'] == 0) & (df['instruction_following'] == 0))]
+    df = df.loc[~(df['model_generated_output'] == 'Error generating response')].copy()
+
+    if config_name not in list_non_binary:
+        if config_name == 'hard-qa-with-multiple-references':
+            df['overall_correctness_binary_score'] = df.apply(
+                lambda row: 100 if row['References'] == row['model_References'] else 0, axis=1
+            )
+
+        df['overall_score'] = df[['language_quality', 'overall_correctness', 'instruction_following', 'overall_correctness_binary_score']].mean(axis=1)
+
+        if config_name in list_language_quality:
+            df['weighted_overall_score'] = df.apply(calculate_overall_score, axis=1, weights=weights_binary_language)
+        else:
+            df['weighted_overall_score'] = df.apply(calculate_overall_score, axis=1, weights=weights_binary_correctness)
+    else:
+        df['overall_score'] = df[['language_quality', 'overall_correctness', 'instruction_following']].mean(axis=1)
+
+        if config_name in list_overall_correctness:
+            df['weighted_overall_score'] = df.apply(calculate_overall_score, axis=1, weights=weights_non_binary_correctness)
+        else:
+            df['weighted_overall_score'] = df.apply(calculate_overall_score, axis=1, weights=weights_non_binary_language)
+    return df
+
+
+def notebook_scores(df):
+    """
+    The notebook cell that scores a _weighted file row by row and averages it for the leaderboard.
+
+    Returns:
+        (pd.DataFrame, list): The scored frame and the leaderboard row (one value per full_metrics).
+    """
+    # Drop rows where overall_correctness is NaN
+    df = df.dropna(subset=['overall_correctness']).copy()
+    reasoning_col_exists = 'final_solution_correctness' in df.columns
+
+    if reasoning_col_exists:
+        weights = weights_reasoning
+        metrics_to_use = ['constrains_adherence', 'logical_consistency', 'final_solution_correctness']
+        relevant_metrics = ['Constrains Adherence', 'Logical Consistency', 'Final Solution Correctness', 'Weighted Overall Score']
+    else:
+        weights = weights_binary_correctness
+        metrics_to_use = ['overall_correctness', 'instruction_following', 'overall_correctness_binary_score']
+        relevant_metrics = ['Overall Correctness', 'Instruction Following', 'Overall Correctness Binary Score', 'Weighted Overall Score']
+
+    weighted_scores = []
+    for idx, row in df.iterrows():
+        weighted_scores.append(compute_weighted_score(row, reasoning_col_exists, threshold_variable, metrics_to_use, weights, df=df, idx=idx))
+    df['weighted_overall_score'] = weighted_scores
+
+    available_cols = [metric_column_map[m] for m in relevant_metrics if metric_column_map[m] in df.columns]
+    average_scores = df[available_cols].mean()
+    averages = [average_scores[metric_column_map[m]] if metric_column_map[m] in average_scores.index else np.nan for m in full_metrics]
+    return df, averages
+
+
+def random_judged_frame(config_name, rng, rows=200):
+    """
+    Judged rows of one config with the cases the scoring has to get right: NaN scores, rows
+    with all scores 0, failed generations and final_solution_correctness right at the threshold.
+    """
+    reasoning = config_name.startswith('hard-reasoning')
+    columns = score_columns if reasoning else score_columns[:3]
+    df = pd.DataFrame({column: rng.integers(0, 101, rows).astype(float) for column in columns})
+    for column in columns:
+        df.loc[rng.random(rows) < 0.1, column] = np.nan
+    df.loc[rng.random(rows) < 0.1, ['language_quality', 'overall_correctness', 'instruction_following']] = 0
+    if reasoning:
+        df.loc[rng.random(rows) < 0.2, 'final_solution_correctness'] = threshold_variable
+        df.loc[rng.random(rows) < 0.1, 'final_solution_correctness'] = threshold_variable - 1
+
+    df['model_generated_output'] = np.where(rng.random(rows) < 0.1, 'Error generating response', 'answer')
+    if config_name == 'hard-qa-with-multiple-references':
+        df['References'] = [str(sorted(rng.choice(5, 2, replace=False))) for _ in range(rows)]
+        df['model_References'] = np.where(rng.random(rows) < 0.5, df['References'], '[0, 1]')
+    return df
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_weighted_frame_matches_notebook(seed):
+    rng = np.random.default_rng(seed)
+    for config_name in task_names:
+        judged = random_judged_frame(config_name, rng)
+        expected = notebook_weighted_frame(judged, config_name)
+        actual = build_weighted_frame(judged, config_name)
+
+        assert list(actual.index) == list(expected.index)
+        for column in ['overall_score', 'weighted_overall_score', 'overall_correctness_binary_score']:
+            if column in expected.columns:
+                np.testing.assert_array_equal(actual[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_scores_match_notebook(seed):
+    rng = np.random.default_rng(seed)
+    weighted = {config_name: notebook_weighted_frame(random_judged_frame(config_name, rng), config_name)
+                for config_name in task_names}
+    scored, results_df = score_frames(weighted, threshold_variable)
+
+    for config_name, df in weighted.items():
+        expected, averages = notebook_scores(df)
+        actual = scored[config_name]
+
+        assert list(actual.index) == list(expected.index)
+        # The row-wise version also zeroes the metrics of the rows below the threshold
+        for column in score_columns + ['weighted_overall_score']:
+            if column in expected.columns:
+                np.testing.assert_array_equal(actual[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float))
+
+        row = results_df.set_index('Task').loc[config_name, full_metrics]
+        np.testing.assert_array_equal(row.to_numpy(dtype=float), np.array(averages, dtype=float))
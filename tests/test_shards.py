@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+from checkpoint import read_csv_rows, shard_of, shard_path, write_csv_rows_atomic
+from mock_server import MockOpenAIServer, MockSettings
+from shards import merge_shards, merge_stage, run_local
+
+shard_count = 3
+configs = ['hard-qa-with-multiple-references', 'summarize-meeting-topic']
+row_count = 12
+
+
+@pytest.fixture(scope='module')
+def sharded_run(tmp_path_factory):
+    """
+    Generates a few synthetic rows of two configs with one local process per shard against
+    the mock server, as `shards.py run --stage generation` does.
+    """
+    workdir = tmp_path_factory.mktemp('shards')
+    os.makedirs(workdir / 'prepared')
+    for config_name in configs:
+        rows = [{'ID': f"{config_name}-{index}", 'System': f"Kontext [1] Nummer {index}",
+                 'Instruction': f"Frage {index}?", 'Chosen': f"Antwort [1] {index}"} for index in range(row_count)]
+        write_csv_rows_atomic(str(workdir / 'prepared' / f"prepared_{config_name}_test.csv"), list(rows[0]), rows)
+
+    server = MockOpenAIServer(settings=MockSettings(ttft_median=0, tokens_per_second=10000, output_tokens=10, seed=1)).start()
+    patch = pytest.MonkeyPatch()
+    patch.chdir(workdir)
+    for name, value in (('OPENAI_API_KEY', 'sk-mock'), ('OPENAI_API_BASE', server.url), ('RESPONSE_CACHE', '0'),
+                        ('METRICS_DIR', 'metrics')):
+        patch.setenv(name, value)
+    try:
+        codes = run_local('generation', shard_count)
+        yield workdir, codes
+    finally:
+        patch.undo()
+        server.stop()
+
+
+def canonical_paths(workdir, config_name):
+    return (str(workdir / 'prepared' / f"prepared_{config_name}_test.csv"),
+            str(workdir / 'evaluated' / f"evaluated_{config_name}_test.csv"))
+
+
+def test_merge_rebuilds_the_canonical_files(sharded_run, monkeypatch):
+    workdir, codes = sharded_run
+    assert codes == [0] * shard_count
+    monkeypatch.chdir(workdir)
+
+    results = merge_stage('generation', shard_count)
+    assert sorted(results) == sorted(os.path.join('evaluated', f"evaluated_{c}_test.csv") for c in configs)
+    assert not any(results.values())
+    for config_name in configs:
+        input_path, output_path = canonical_paths(workdir, config_name)
+        _, inputs = read_csv_rows(input_path)
+        fieldnames, outputs = read_csv_rows(output_path)
+        assert fieldnames[-1] == 'model_generated_output'
+        assert [row['ID'] for row in outputs] == [row['ID'] for row in inputs]
+        assert all(row['model_generated_output'] not in ('', 'Error generating response') for row in outputs)
+
+
+def tamper(workdir, change):
+    """
+    Copies the shard files of the first config to a new output name and lets `change`
+    edit the rows of the copies (shard index -> rows).
+
+    Returns:
+        (str, str): Input path and canonical output path of the copy.
+    """
+    input_path, output_path = canonical_paths(workdir, configs[0])
+    copy_path = output_path.replace('_test.csv', '_tampered_test.csv')
+    shards = {}
+    for index in range(shard_count):
+        fieldnames, shards[index] = read_csv_rows(shard_path(output_path, (index, shard_count)))
+    change(shards)
+    for index, rows in shards.items():
+        write_csv_rows_atomic(shard_path(copy_path, (index, shard_count)), fieldnames, rows)
+    return input_path, copy_path
+
+
+def shard_with_rows(shards):
+    return next(index for index, rows in shards.items() if len(rows) > 1)
+
+
+@pytest.mark.parametrize('change, expected', [
+    (lambda shards: shards[shard_with_rows(shards)].pop(), 'rows missing'),
+    (lambda shards: shards[shard_with_rows(shards)].append(dict(shards[shard_with_rows(shards)][0])), 'duplicate rows'),
+    (lambda shards: shards[(shard_with_rows(shards) + 1) % shard_count].append(shards[shard_with_rows(shards)].pop()), 'belongs to shard'),
+    (lambda shards: shards[0].append(dict(shards[shard_with_rows(shards)][0], ID='unknown-row')), 'not in'),
+])
+def test_merge_reports_broken_shards(sharded_run, change, expected):
+    workdir, _ = sharded_run
+    input_path, copy_path = tamper(workdir, change)
+
+    problems = merge_shards(input_path, copy_path, shard_count)
+    assert any(expected in problem for problem in problems), problems
+    assert not os.path.exists(copy_path)
+
+
+def test_merge_reports_a_missing_shard_file(sharded_run):
+    workdir, _ = sharded_run
+    input_path, copy_path = tamper(workdir, lambda shards: None)
+    os.remove(shard_path(copy_path, (1, shard_count)))
+
+    problems = merge_shards(input_path, copy_path, shard_count)
+    assert any('missing shard file' in problem for problem in problems)
+    assert any('rows missing' in problem for problem in problems)
+
+
+def test_rows_are_split_across_the_shards(sharded_run):
+    workdir, _ = sharded_run
+    _, output_path = canonical_paths(workdir, configs[0])
+    for index in range(shard_count):
+        _, rows = read_csv_rows(shard_path(output_path, (index, shard_count)))
+        assert all(shard_of(row['ID'], shard_count) == index for row in rows)